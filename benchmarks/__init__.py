@@ -0,0 +1 @@
+"""Бенчмарки экспорта на локальном фейковом VK API (не входят в пакет)."""
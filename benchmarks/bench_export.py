@@ -0,0 +1,224 @@
+"""
+Бенчмарк загрузки списка диалогов и экспорта на локальном фейковом VK.
+
+    python -m benchmarks.bench_export --dialogs 50 --messages 5000 --latency 0.05
+    python -m benchmarks.bench_export --json bench.json
+    python -m benchmarks.bench_export --baseline bench.json --tolerance 0.2
+
+Каждая стратегия запускается в отдельном процессе (чтобы пиковый RSS и
+кеши не смешивались); сервер работает в этом процессе и считает запросы.
+С --baseline код выхода 1, если messages/sec какой-либо стратегии упал
+больше чем на tolerance.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_vk import FakeVkData, FakeVkServer, RedirectSession
+from vk_dialog_parser.accounts import Account, AccountPool
+from vk_dialog_parser.dialogs import iter_dialog_pages
+from vk_dialog_parser.export import dialog_filepath, export_dialog
+from vk_dialog_parser.formats import DEFAULT_FORMAT, FORMATS
+from vk_dialog_parser.metrics import Metrics
+from vk_dialog_parser.ratelimit import RateLimiter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Стратегии загрузки истории: пакетно через execute или по странице, sync или aiohttp
+STRATEGIES = {
+    "execute": {"batched": True, "aio": False},
+    "getHistory": {"batched": False, "aio": False},
+    "async-execute": {"batched": True, "aio": True},
+    "async-getHistory": {"batched": False, "aio": True},
+}
+
+UNLIMITED_RATE = 1e9
+
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def make_account(config: dict, name: str, metrics: Metrics) -> Account:
+    limiter = RateLimiter(rate=config["rate"] or UNLIMITED_RATE)
+    if config["aio"]:
+        return Account(name, name, metrics=metrics, aio=True, limiter=limiter, api_url=config["api_url"])
+    return Account(name, name, metrics=metrics, limiter=limiter, session=RedirectSession(config["api_url"]))
+
+
+def run_strategy(config: dict) -> dict:
+    """
+    Загружает все диалоги и экспортирует их; выполняется в дочернем процессе.
+    С accounts > 1 диалоги делятся между токенами поровну и выгружаются
+    через AccountPool — у каждого токена свой лимит клиента и сервера.
+    """
+    metrics = Metrics()
+    accounts = {f"bench{i}": make_account(config, f"bench{i}", metrics) for i in range(config["accounts"])}
+    first = next(iter(accounts.values()))
+    out = tempfile.mkdtemp(prefix="vk-bench-")
+
+    started = time.perf_counter()
+    dialogs = [dialog for page in iter_dialog_pages(first.vk, first.names) for dialog in page]
+    dialogs_time = time.perf_counter() - started
+    names = list(accounts)
+    for i, dialog in enumerate(dialogs):
+        dialog["account"] = names[i % len(names)]
+
+    def export_one(account, dialog):
+        return export_dialog(account.vk, account.names, dialog["peer_id"],
+                             dialog_filepath(out, dialog, config["format"]), dialog["display_name"],
+                             dialog["dialog_type"], batched=config["batched"], incremental=False,
+                             fmt=config["format"], metrics=metrics)
+
+    try:
+        with AccountPool(accounts, config["workers"]) as pool:
+            messages = sum(f.result() for f in [pool.submit(dialog, export_one) for dialog in dialogs])
+        wall = time.perf_counter() - started
+        output_bytes = sum(os.path.getsize(os.path.join(out, f)) for f in os.listdir(out)
+                           if os.path.isfile(os.path.join(out, f)))
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+
+    return {
+        "dialogs": len(dialogs),
+        "messages": messages,
+        "dialogs_time": dialogs_time,
+        "wall_time": wall,
+        "output_bytes": output_bytes,
+        "peak_rss_mb": peak_rss_mb(),
+        "metrics": metrics.report(),
+    }
+
+
+def run_child(config: dict) -> dict:
+    """Запускает стратегию в новом интерпретаторе и возвращает её результат."""
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_export", "--child", json.dumps(config)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip() or f"код выхода {proc.returncode}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure(server: FakeVkServer, name: str, args) -> dict:
+    config = dict(STRATEGIES[name], api_url=server.url, rate=args.rate, workers=args.workers, format=args.format,
+                  accounts=args.accounts)
+    server.reset_stats()
+    result = run_child(config)
+    stats = server.snapshot()
+    wall = result["wall_time"] or 1e-9
+    return dict(
+        result,
+        strategy=name,
+        requests=stats["requests"],
+        errors=stats["errors"],
+        bytes_in=stats["bytes_out"],
+        methods=stats["methods"],
+        requests_per_sec=stats["requests"] / wall,
+        messages_per_sec=result["messages"] / wall,
+    )
+
+
+def print_table(results: list[dict]):
+    header = f"{'strategy':<18}{'wall, s':>9}{'req':>7}{'req/s':>9}{'msg/s':>11}{'errors':>8}{'MB in':>8}{'RSS MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        rss = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "-"
+        print(f"{r['strategy']:<18}{r['wall_time']:>9.2f}{r['requests']:>7}{r['requests_per_sec']:>9.1f}"
+              f"{r['messages_per_sec']:>11.0f}{r['errors']:>8}{r['bytes_in'] / 1e6:>8.1f}{rss:>8}")
+
+
+def bench_params(args) -> dict:
+    return {k: v for k, v in vars(args).items() if k not in ("child", "json", "baseline", "strategies", "tolerance")}
+
+
+def compare(results: list[dict], baseline_path: str, tolerance: float, params: dict) -> list[str]:
+    """Стратегии, у которых messages/sec упал больше чем на tolerance."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    if saved.get("params") != params:
+        print("[WARN] Параметры запуска отличаются от baseline, сравнение может быть некорректным")
+    baseline = {r["strategy"]: r for r in saved["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get(r["strategy"])
+        if base and r["messages_per_sec"] < base["messages_per_sec"] * (1 - tolerance):
+            regressions.append(f"{r['strategy']}: {r['messages_per_sec']:.0f} msg/s "
+                               f"(было {base['messages_per_sec']:.0f})")
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Бенчмарк экспорта на локальном фейковом VK API")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, help="По умолчанию — все доступные")
+    parser.add_argument("--dialogs", type=int, default=50, help="Число диалогов")
+    parser.add_argument("--messages", type=int, default=2000, help="Сообщений в каждом диалоге")
+    parser.add_argument("--text-size", type=int, default=80, help="Длина текста сообщения, символов")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа сервера, сек")
+    parser.add_argument("--server-rps", type=float, help="Лимит сервера: сверх него — ошибка 6")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля случайных ошибок 6")
+    parser.add_argument("--max-response-kb", type=int, help="Ответ execute больше этого — ошибка 13")
+    parser.add_argument("--rate", type=float, default=0.0, help="Лимит клиента, запросов/сек (0 — без лимита)")
+    parser.add_argument("-j", "--workers", type=int, default=4, help="Диалогов одновременно (на аккаунт)")
+    parser.add_argument("--accounts", type=int, default=1, help="Число токенов (лимиты --rate и --server-rps — на каждый)")
+    parser.add_argument("-f", "--format", choices=FORMATS, default=DEFAULT_FORMAT)
+    parser.add_argument("--json", help="Сохранить результаты в файл")
+    parser.add_argument("--baseline", help="Сравнить с результатами из файла (--json прошлого запуска)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимое падение msg/s (доля)")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_strategy(json.loads(args.child))))
+        return 0
+
+    strategies = args.strategies or [
+        name for name, s in STRATEGIES.items() if not s["aio"] or importlib.util.find_spec("aiohttp")
+    ]
+    data = FakeVkData(dialogs=args.dialogs, messages=args.messages, text_size=args.text_size)
+    server = FakeVkServer(data, latency=args.latency, rps=args.server_rps, error_rate=args.error_rate,
+                          max_response_bytes=args.max_response_kb and args.max_response_kb * 1024).start()
+    print(f"Фейковый VK: {server.url}, {args.dialogs} диалогов x {args.messages} сообщений, "
+          f"задержка {args.latency * 1000:.0f} мс")
+
+    results = []
+    try:
+        for name in strategies:
+            results.append(measure(server, name, args))
+    finally:
+        server.stop()
+
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"params": bench_params(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance, bench_params(args))
+        for line in regressions:
+            print(f"[REGRESSION] {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Замер холодного старта: сколько стоит импорт точек входа (python -X importtime).
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --repeat 10 --json startup.json
+    python -m benchmarks.bench_startup --targets cli --budget-ms 100
+
+Каждая точка входа импортируется в новом интерпретаторе несколько раз,
+берётся лучший результат. Код выхода 1, если импорт вышел за бюджет или
+подтянул зависимость, которая на этом пути не нужна (vk_api, requests,
+numpy, aiohttp — загружаются только в командах, которые с ними работают).
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Точка входа → модуль, бюджет импорта (мс) и зависимости, которых быть не должно
+TARGETS = {
+    "cli": {
+        "module": "vk_dialog_parser.cli",
+        "budget_ms": 150,
+        "forbidden": ["vk_api", "requests", "numpy", "aiohttp", "customtkinter", "tkinter"],
+    },
+    "gui": {
+        "module": "vk_dialog_parser_gui",
+        "budget_ms": 400,
+        "forbidden": ["vk_api", "requests", "numpy", "aiohttp"],
+    },
+}
+
+TOP_IMPORTS = 5
+
+
+def import_profile(module: str) -> dict:
+    """Импортирует module с -X importtime; возвращает время и список загруженных модулей."""
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"код выхода {proc.returncode}")
+
+    # import time: self [us] | cumulative [us] | имя (с отступом по вложенности)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us), len(name) - len(name.lstrip())))
+
+    # Модуль печатается после всего, что он импортировал; его прямые импорты — на уровень глубже
+    end = next(i for i, row in enumerate(rows) if row[0] == module)
+    total, depth = rows[end][2], rows[end][3]
+    children = []
+    for name, _, cumulative, indent in reversed(rows[:end]):
+        if indent <= depth:
+            break
+        if indent == depth + 2:
+            children.append((name, cumulative))
+    heaviest = sorted(children, key=lambda r: -r[1])
+    return {
+        "import_ms": total / 1000,
+        "heaviest": [{"module": name, "ms": cum / 1000} for name, cum in heaviest[:TOP_IMPORTS]],
+        "modules": json.loads(proc.stdout.strip().splitlines()[-1]),
+    }
+
+
+def measure(name: str, repeat: int, budget_ms: float | None) -> dict:
+    target = TARGETS[name]
+    import_profile(target["module"])  # прогрев: .pyc и файловый кеш
+    runs = [import_profile(target["module"]) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r["import_ms"])
+    loaded = set(best["modules"])
+    return {
+        "target": name,
+        "module": target["module"],
+        "import_ms": best["import_ms"],
+        "median_ms": sorted(r["import_ms"] for r in runs)[len(runs) // 2],
+        "budget_ms": budget_ms if budget_ms is not None else target["budget_ms"],
+        "heaviest": best["heaviest"],
+        "forbidden": [dep for dep in target["forbidden"] if dep in loaded],
+    }
+
+
+def print_table(results: list[dict]):
+    header = f"{'target':<8}{'best, ms':>10}{'median, ms':>12}{'budget, ms':>12}  самые тяжёлые импорты"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        heaviest = ", ".join(f"{h['module']} {h['ms']:.0f}" for h in r["heaviest"])
+        print(f"{r['target']:<8}{r['import_ms']:>10.1f}{r['median_ms']:>12.1f}{r['budget_ms']:>12.0f}  {heaviest}")
+
+
+def check(results: list[dict]) -> list[str]:
+    """Нарушения бюджета: медленный импорт или лишние зависимости."""
+    problems = []
+    for r in results:
+        if r["import_ms"] > r["budget_ms"]:
+            problems.append(f"{r['target']}: импорт {r['import_ms']:.0f} мс при бюджете {r['budget_ms']:.0f} мс")
+        if r["forbidden"]:
+            problems.append(f"{r['target']}: при импорте загружены {', '.join(r['forbidden'])}")
+    return problems
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Замер времени импорта точек входа")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, help="По умолчанию — все, для которых есть зависимости")
+    parser.add_argument("--repeat", type=int, default=5, help="Сколько раз импортировать каждую точку входа")
+    parser.add_argument("--budget-ms", type=float, help="Бюджет вместо встроенного (для всех выбранных)")
+    parser.add_argument("--json", help="Сохранить результаты в файл")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    targets = args.targets or list(TARGETS)
+
+    results = []
+    for name in targets:
+        try:
+            results.append(measure(name, args.repeat, args.budget_ms))
+        except RuntimeError as e:
+            # GUI без customtkinter (сервер) — пропускаем, если его не просили явно
+            if args.targets:
+                raise
+            print(f"[SKIP] {name}: {e}")
+
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"repeat": args.repeat, "results": results}, f, ensure_ascii=False, indent=2)
+
+    problems = check(results)
+    for line in problems:
+        print(f"[BUDGET] {line}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
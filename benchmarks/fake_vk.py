@@ -0,0 +1,340 @@
+"""
+Локальная замена api.vk.com для бенчмарков.
+
+Отдаёт синтетические ответы messages.getConversations, messages.getHistory,
+users.get, groups.getById, messages.getConversationsById,
+messages.getConversationMembers и execute (шаблоны VKScript из
+vk_dialog_parser.history и vk_dialog_parser.names) с настраиваемой задержкой,
+ошибками лимита, числом диалогов и размером сообщений. История не хранится:
+сообщение i диалога вычисляется по формуле, так что сервер занимает
+одинаково мало памяти при любом объёме.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+import requests
+
+from vk_dialog_parser.names import CHAT_PEER_OFFSET
+
+TOO_MANY_RPS_CODE = 6
+RESPONSE_TOO_BIG_CODE = 13
+
+SELF_ID = 1  # владелец «токена»
+CHAT_MEMBERS = 20
+BASE_DATE = 1600000000
+
+VK_API_PREFIXES = ("https://api.vk.ru/method/", "https://api.vk.com/method/")
+
+_FILLER = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 64
+
+
+class FakeVkData:
+    """Синтетическая модель аккаунта: dialogs диалогов по messages сообщений."""
+
+    def __init__(self, dialogs: int = 50, messages: int = 2000, text_size: int = 80, photo_every: int = 10):
+        self.dialogs = dialogs
+        self.messages = messages
+        self.text_size = text_size
+        self.photo_every = photo_every
+
+        # 70% личных, 20% бесед, 10% сообществ
+        self.peers = []
+        for i in range(dialogs):
+            if i % 10 < 7:
+                self.peers.append(1000 + i)
+            elif i % 10 < 9:
+                self.peers.append(CHAT_PEER_OFFSET + 1 + i)
+            else:
+                self.peers.append(-(1000 + i))
+        self.peer_set = set(self.peers)
+
+    @staticmethod
+    def peer_type(peer_id: int) -> str:
+        if peer_id > CHAT_PEER_OFFSET:
+            return "chat"
+        return "group" if peer_id < 0 else "user"
+
+    def sender(self, peer_id: int, i: int) -> int:
+        if peer_id > CHAT_PEER_OFFSET:
+            return 5000 + (peer_id + i) % CHAT_MEMBERS
+        return SELF_ID if i % 2 else peer_id
+
+    def message(self, peer_id: int, i: int) -> dict:
+        """Сообщение номер i (id = i, от 1 до messages) в хронологическом порядке."""
+        text = f"#{i} " + _FILLER[:max(0, self.text_size - len(str(i)) - 2)]
+        msg = {
+            "id": i,
+            "peer_id": peer_id,
+            "from_id": self.sender(peer_id, i),
+            "date": BASE_DATE + i * 60,
+            "text": text,
+            "attachments": [],
+        }
+        if self.photo_every and i % self.photo_every == 0:
+            msg["attachments"].append({"type": "photo", "photo": {
+                "id": i, "owner_id": msg["from_id"],
+                "sizes": [{"type": "x", "width": 604, "height": 453, "url": f"https://example.invalid/{i}.jpg"}],
+            }})
+        if i % 13 == 0 and i > 1:
+            msg["reply_message"] = {"id": i - 1, "from_id": self.sender(peer_id, i - 1),
+                                    "date": BASE_DATE + (i - 1) * 60, "text": "reply"}
+        return msg
+
+    def extended(self, from_ids) -> dict:
+        return {
+            "profiles": [self.profile(i) for i in sorted(set(from_ids)) if i > 0],
+            "groups": [self.group(-i) for i in sorted(set(from_ids)) if i < 0],
+        }
+
+    @staticmethod
+    def profile(user_id: int) -> dict:
+        return {"id": user_id, "first_name": "User", "last_name": str(user_id)}
+
+    @staticmethod
+    def group(group_id: int) -> dict:
+        return {"id": group_id, "name": f"Group {group_id}", "screen_name": f"club{group_id}"}
+
+    def conversation(self, peer_id: int) -> dict:
+        conv = {"peer": {"id": peer_id, "type": self.peer_type(peer_id), "local_id": peer_id % CHAT_PEER_OFFSET}}
+        if peer_id > CHAT_PEER_OFFSET:
+            conv["chat_settings"] = {"title": f"Chat {peer_id - CHAT_PEER_OFFSET}", "members_count": CHAT_MEMBERS}
+        return conv
+
+    # ----- методы API -----
+
+    def get_conversations(self, offset=0, count=20, extended=0, **_):
+        offset, count = int(offset), int(count)
+        peers = self.peers[offset:offset + count]
+        items = [{"conversation": self.conversation(p), "last_message": self.message(p, self.messages)}
+                 for p in peers]
+        response = {"count": len(self.peers), "items": items}
+        if int(extended):
+            response.update(self.extended(p for p in peers if self.peer_type(p) != "chat"))
+        return response
+
+    def get_history(self, peer_id, offset=0, count=20, rev=0, start_message_id=None, extended=0, **_):
+        peer_id, offset, count = int(peer_id), int(offset), min(int(count), 200)
+        if peer_id not in self.peer_set:
+            return {"count": 0, "items": []}
+        total = self.messages
+        if start_message_id is not None:
+            # Позиция опорного сообщения в списке от новых к старым
+            position = total - min(int(start_message_id), total)
+            lo = max(0, position + offset)
+            ids = [total - k for k in range(lo, min(lo + count, total))]
+            if int(rev):
+                ids.reverse()
+        elif int(rev):
+            ids = list(range(offset + 1, min(offset + count, total) + 1))
+        else:
+            ids = [total - k for k in range(offset, min(offset + count, total))]
+        items = [self.message(peer_id, i) for i in ids]
+        response = {"count": total, "items": items}
+        if int(extended):
+            response.update(self.extended(m["from_id"] for m in items))
+        return response
+
+    def users_get(self, user_ids="", **_):
+        return [self.profile(int(i)) for i in str(user_ids).split(",") if i]
+
+    def groups_get_by_id(self, group_ids="", **_):
+        return [self.group(abs(int(i))) for i in str(group_ids).split(",") if i]
+
+    def get_conversations_by_id(self, peer_ids="", **_):
+        items = [self.conversation(int(p)) for p in str(peer_ids).split(",") if p]
+        return {"count": len(items), "items": items}
+
+    def get_conversation_members(self, peer_id, **_):
+        peer_id = int(peer_id)
+        if peer_id not in self.peer_set or self.peer_type(peer_id) != "chat":
+            raise ApiError(917, "You don't have access to this chat")
+        members = [5000 + k for k in range(CHAT_MEMBERS)]
+        return {"count": len(members), "items": [{"member_id": m} for m in members],
+                **self.extended(members)}
+
+    def execute(self, code="", **_):
+        """Выполняет шаблоны EXECUTE_HISTORY_CODE, EXECUTE_NEW_HISTORY_CODE и CHAT_MEMBERS_CODE."""
+        if "getConversationMembers" in code:
+            peer_id = int(re.search(r"var peer_id = (-?\d+);", code).group(1))
+            try:
+                members = self.get_conversation_members(peer_id)
+            except ApiError:
+                members = False  # как execute: ошибка вызова внутри — false
+            return {"members": members, "conversations": self.get_conversations_by_id(str(peer_id))}
+
+        params = json.loads(re.search(r"var params = (.*);", code).group(1))
+        max_calls = int(re.search(r"while \(i < (\d+)\)", code).group(1))
+        count = int(params.get("count", 20))
+        pages = []
+
+        offset_match = re.search(r"var offset = (-?\d+);", code)
+        if offset_match:
+            offset = int(offset_match.group(1))
+            for i in range(max_calls):
+                page = self.get_history(**dict(params, offset=offset + i * count))
+                pages.append(page)
+                if len(page["items"]) < count:
+                    break
+            return pages
+
+        start = int(re.search(r"var start = (-?\d+);", code).group(1))
+        for _ in range(max_calls):
+            page = self.get_history(**dict(params, start_message_id=start))
+            pages.append(page)
+            ids = [m["id"] for m in page["items"]]
+            newest = max(ids) if ids else start
+            if newest <= start or len(ids) < count:
+                break
+            start = newest
+        return pages
+
+
+class ApiError(Exception):
+    def __init__(self, code: int, msg: str):
+        super().__init__(msg)
+        self.code = code
+        self.msg = msg
+
+
+class FakeVkServer(ThreadingHTTPServer):
+    """
+    HTTP-сервер с API в стиле VK на 127.0.0.1 (порт выбирается свободный).
+
+    latency — задержка каждого ответа в секундах; rps — если задано, запросы
+    сверх этой частоты (отдельно для каждого access_token) получают ошибку 6,
+    как у настоящего VK; error_rate —
+    доля случайных ошибок 6; max_response_bytes — ответ execute больше
+    этого размера заменяется ошибкой 13.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, data: FakeVkData | None = None, latency: float = 0.0, rps: float | None = None,
+                 error_rate: float = 0.0, max_response_bytes: int | None = None, seed: int = 0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.data = data or FakeVkData()
+        self.latency = latency
+        self.rps = rps
+        self.error_rate = error_rate
+        self.max_response_bytes = max_response_bytes
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._windows = {}
+        self.methods = {
+            "messages.getConversations": self.data.get_conversations,
+            "messages.getHistory": self.data.get_history,
+            "messages.getConversationsById": self.data.get_conversations_by_id,
+            "messages.getConversationMembers": self.data.get_conversation_members,
+            "users.get": self.data.users_get,
+            "groups.getById": self.data.groups_get_by_id,
+            "execute": self.data.execute,
+        }
+        self.reset_stats()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/method/"
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {"requests": 0, "errors": 0, "bytes_out": 0, "methods": {}}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self.stats))
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def _limited(self, token: str | None) -> bool:
+        with self._lock:
+            if self.error_rate and self._random.random() < self.error_rate:
+                return True
+            if not self.rps:
+                return False
+            now = time.monotonic()
+            window = [t for t in self._windows.get(token, []) if now - t < 1.0]
+            self._windows[token] = window
+            if len(window) >= self.rps:
+                return True
+            window.append(now)
+            return False
+
+    def call(self, method: str, params: dict, token: str | None = None) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            if method not in self.methods:
+                raise ApiError(3, "Unknown method passed")
+            if self._limited(token):
+                raise ApiError(TOO_MANY_RPS_CODE, "Too many requests per second")
+            response = self.methods[method](**params)
+            payload = {"response": response}
+            if (method == "execute" and self.max_response_bytes
+                    and len(json.dumps(payload)) > self.max_response_bytes):
+                raise ApiError(RESPONSE_TOO_BIG_CODE, "Response size is too big")
+        except ApiError as e:
+            payload = {"error": {"error_code": e.code, "error_msg": e.msg, "request_params": []}}
+        return payload
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у api.vk.com
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        params = dict(parse_qsl(self.rfile.read(length).decode("utf-8")))
+        self._respond(params)
+
+    def do_GET(self):
+        query = self.path.partition("?")[2]
+        self._respond(dict(parse_qsl(query)))
+
+    def _respond(self, params: dict):
+        token = params.pop("access_token", None)
+        params.pop("v", None)
+        method = self.path.partition("?")[0].rsplit("/", 1)[-1]
+        payload = self.server.call(method, params, token)
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+        with self.server._lock:
+            stats = self.server.stats
+            stats["requests"] += 1
+            stats["errors"] += "error" in payload
+            stats["bytes_out"] += len(body)
+            stats["methods"][method] = stats["methods"].get(method, 0) + 1
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RedirectSession(requests.Session):
+    """requests.Session, которая отправляет запросы к api.vk.* на base_url."""
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+
+    def request(self, method, url, *args, **kwargs):
+        for prefix in VK_API_PREFIXES:
+            if url.startswith(prefix):
+                url = self.base_url + url[len(prefix):]
+                break
+        return super().request(method, url, *args, **kwargs)
@@ -0,0 +1,35 @@
+"""
+Холодный старт: импорт точек входа не должен тянуть тяжёлые зависимости.
+
+Импорт проверяется в новом интерпретаторе (python -X importtime), как в
+benchmarks/bench_startup.py; время импорта замеряет сам бенчмарк.
+"""
+
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_modules(module: str) -> set[str]:
+    """Модули, загруженные при импорте module в новом интерпретаторе."""
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr
+    return set(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+
+def test_cli_import_is_light():
+    forbidden = {"vk_api", "requests", "numpy", "aiohttp", "customtkinter"}
+    assert not forbidden & loaded_modules("vk_dialog_parser.cli")
+
+
+@pytest.mark.skipif(importlib.util.find_spec("customtkinter") is None, reason="GUI без customtkinter")
+def test_gui_import_is_light():
+    forbidden = {"vk_api", "requests", "numpy", "aiohttp"}
+    assert not forbidden & loaded_modules("vk_dialog_parser_gui")
@@ -0,0 +1 @@
+"""Общая (не-GUI) логика VK Dialog Parser."""
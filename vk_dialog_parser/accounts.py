@@ -0,0 +1,114 @@
+"""Несколько аккаунтов VK: по сессии и лимиту запросов на каждый токен."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import extract_token
+from .dialogcache import load_dialog_cache, refresh_dialogs, save_dialog_cache
+from .dialogs import dialog_for_peer
+from .export import sanitize
+from .names import NameResolver
+from .ratelimit import RateLimiter
+
+DEFAULT_ACCOUNT = "default"
+
+
+def load_accounts(config: dict) -> dict[str, str]:
+    """
+    Токены из config.json: {"accounts": {"имя": "токен или ссылка", ...}}.
+    Если раздела нет, last_token становится аккаунтом default.
+    """
+    accounts = {}
+    for name, raw in (config.get("accounts") or {}).items():
+        token = extract_token(raw or "")
+        if token:
+            accounts[name] = token
+    if not accounts and config.get("last_token"):
+        accounts[DEFAULT_ACCOUNT] = config["last_token"]
+    return accounts
+
+
+def account_path(path: str, account: str, is_dir: bool = False) -> str:
+    """
+    Файл или папка аккаунта: для default — сам path, для остальных —
+    с именем аккаунта (names_cache.work.sqlite3, exported_dialogs/work).
+
+    peer_id бесед и личных сообщений у каждого аккаунта свои, поэтому
+    экспорт, контрольные точки, архив и кеш имён у аккаунтов раздельные.
+    Папку вызывающий указывает явно (is_dir): по имени её не отличить от
+    файла — у exports.2024 тоже есть «расширение».
+    """
+    if account == DEFAULT_ACCOUNT:
+        return path
+    if is_dir:
+        return os.path.join(path, sanitize(account))
+    root, ext = os.path.splitext(path)
+    if ext:
+        return f"{root}.{sanitize(account)}{ext}"
+    return f"{path}.{sanitize(account)}"
+
+
+class Account:
+    """Сессия, RateLimiter и имена одного аккаунта."""
+
+    def __init__(self, name: str, token: str, cache=None, metrics=None, aio: bool = False,
+                 limiter: RateLimiter | None = None, report=print, **session_kwargs):
+        self.name = name
+        self.token = token
+        self.limiter = limiter or RateLimiter()
+        if aio:
+            from .aio import create_async_session
+            session = create_async_session(token, limiter=self.limiter, metrics=metrics, **session_kwargs)
+        else:
+            from .api import create_session
+            session = create_session(token, limiter=self.limiter, metrics=metrics, **session_kwargs)
+        self.vk = session.get_api()
+        self.names = NameResolver(self.vk, cache=cache, report=report)
+        self.names.warm()
+
+    def load_dialogs(self) -> list[dict]:
+        """Список диалогов аккаунта (через кеш списка); каждый помечен ключом "account"."""
+        dialogs, _ = refresh_dialogs(self.vk, self.names, load_dialog_cache(self.token))
+        save_dialog_cache(self.token, dialogs)
+        return [dict(dialog, account=self.name) for dialog in dialogs]
+
+    def dialog(self, peer_id: int) -> dict:
+        return dict(dialog_for_peer(peer_id, self.names), account=self.name)
+
+
+class AccountPool:
+    """
+    Пул потоков на каждый аккаунт.
+
+    Задание уходит в пул аккаунта, которому принадлежит диалог (ключ
+    "account"), и выполняется его сессией в пределах его лимита запросов.
+    Аккаунты работают одновременно и друг друга не ждут, так что общая
+    скорость растёт с числом аккаунтов.
+    """
+
+    def __init__(self, accounts: dict[str, Account], workers: int):
+        self.accounts = accounts
+        self._pools = {
+            name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"vk-{name}")
+            for name in accounts
+        }
+
+    def submit(self, dialog: dict, fn, *args):
+        """Запускает fn(account, dialog, *args) в пуле аккаунта диалога."""
+        account = self.accounts[dialog["account"]]
+        return self._pools[account.name].submit(fn, account, dialog, *args)
+
+    def load_dialogs(self) -> list[dict]:
+        """Списки диалогов всех аккаунтов, загруженные параллельно."""
+        futures = [self._pools[name].submit(account.load_dialogs) for name, account in self.accounts.items()]
+        return [dialog for future in futures for dialog in future.result()]
+
+    def shutdown(self, wait: bool = True, cancel: bool = False):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait, cancel_futures=cancel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
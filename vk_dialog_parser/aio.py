@@ -0,0 +1,180 @@
+"""
+Асинхронный клиент VK API на aiohttp (необязательная зависимость).
+
+Установка: pip install -e ".[async]"
+"""
+
+import asyncio
+import threading
+import time
+
+import aiohttp
+
+from .metrics import Metrics
+from .ratelimit import RateLimiter
+
+API_URL = "https://api.vk.com/method/"
+API_VERSION = "5.92"  # та же версия, что у vk_api.VkApi по умолчанию
+
+TOO_MANY_RPS_CODE = 6
+FLOOD_CONTROL_CODE = 9
+INTERNAL_ERROR_CODE = 10
+RETRY_CODES = {TOO_MANY_RPS_CODE, FLOOD_CONTROL_CODE, INTERNAL_ERROR_CODE}
+
+DEFAULT_TIMEOUT = 60.0  # execute с 25 вызовами getHistory может идти долго
+DEFAULT_CONNECTIONS = 8
+
+
+class AsyncApiError(Exception):
+    """Ошибка, которую вернул VK API (error_code в .code)."""
+
+    def __init__(self, method: str, error: dict):
+        self.method = method
+        self.error = error
+        self.code = error.get("error_code")
+        super().__init__(f"[{self.code}] {error.get('error_msg', '')}")
+
+
+def encode_params(params: dict) -> dict:
+    """Списки → строка через запятую, bool → 0/1, None отбрасывается."""
+    encoded = {}
+    for key, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            value = ",".join(map(str, value))
+        elif isinstance(value, bool):
+            value = int(value)
+        encoded[key] = str(value)
+    return encoded
+
+
+class _Method:
+    """client.messages.getHistory(...) → client.call("messages.getHistory", ...)."""
+
+    def __init__(self, call, name: str = ""):
+        self._call = call
+        self._name = name
+
+    def __getattr__(self, name: str):
+        return _Method(self._call, f"{self._name}.{name}" if self._name else name)
+
+    def __call__(self, **params):
+        return self._call(self._name, **params)
+
+
+class AsyncVkClient:
+    """
+    Клиент VK API с пулом keep-alive соединений.
+
+    Запросы могут выполняться одновременно; их частоту задаёт общий
+    RateLimiter (тот же, что у синхронной сессии). Ошибки 6/9/10 и сетевые
+    сбои повторяются с экспоненциальной паузой. Используется как
+    async-контекст:
+
+        async with AsyncVkClient(token) as vk:
+            resp = await vk.api.messages.getHistory(peer_id=..., count=200)
+    """
+
+    def __init__(self, token: str, limiter: RateLimiter | None = None, api_url: str = API_URL,
+                 api_version: str = API_VERSION, timeout: float = DEFAULT_TIMEOUT,
+                 connections: int = DEFAULT_CONNECTIONS, max_retries: int = 5,
+                 metrics: Metrics | None = None):
+        self.token = token
+        self.limiter = limiter or RateLimiter()
+        self.api_url = api_url.rstrip("/") + "/"
+        self.api_version = api_version
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.connections = connections
+        self.max_retries = max_retries
+        self.metrics = metrics or Metrics()
+        self.session = None
+        self.api = _Method(self.call)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def call(self, method: str, **params):
+        """Вызывает метод API и возвращает поле response."""
+        data = encode_params(params)
+        data.setdefault("v", self.api_version)
+        data["access_token"] = self.token
+
+        attempt = 0
+        while True:
+            self.metrics.add_sleep("rate_limit", await self.limiter.acquire_async())
+            started = time.perf_counter()
+            try:
+                async with self.session.post(self.api_url + method, data=data) as resp:
+                    resp.raise_for_status()
+                    payload = await resp.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.metrics.record_call(method, time.perf_counter() - started, type(e).__name__)
+                if attempt >= self.max_retries:
+                    raise
+                code = type(e).__name__
+            else:
+                if "error" not in payload:
+                    self.metrics.record_call(method, time.perf_counter() - started)
+                    return payload["response"]
+                error = AsyncApiError(method, payload["error"])
+                self.metrics.record_call(method, time.perf_counter() - started, error.code)
+                if error.code not in RETRY_CODES or attempt >= self.max_retries:
+                    raise error
+                code = error.code
+
+            delay = self.limiter.backoff(attempt)
+            self.metrics.record_retry(method, code, delay)
+            await asyncio.sleep(delay)
+            self.metrics.add_sleep("backoff", delay)
+            attempt += 1
+
+
+class BlockingVkApi:
+    """
+    Синхронный фасад над AsyncVkClient для существующего кода экспорта.
+
+    Цикл событий работает в отдельном потоке; вызовы vk.messages.getHistory(...)
+    из любых потоков отправляются в него и ждут результата, поэтому запросы
+    нескольких потоков экспорта идут одновременно по общему пулу соединений.
+    """
+
+    def __init__(self, token: str, limiter: RateLimiter | None = None, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self.client = AsyncVkClient(token, limiter=limiter, **kwargs)
+        self._run(self.client.open())
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def method(self, method: str, values: dict | None = None):
+        return self._run(self.client.call(method, **(values or {})))
+
+    def get_api(self):
+        return _Method(lambda name, **params: self.method(name, params))
+
+    def close(self):
+        self._run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+def create_async_session(token: str, limiter: RateLimiter | None = None, **kwargs) -> BlockingVkApi:
+    """Аналог api.create_session поверх aiohttp."""
+    return BlockingVkApi(token, limiter=limiter, **kwargs)
@@ -0,0 +1,66 @@
+"""Сессия VK API, все вызовы которой проходят через общий RateLimiter."""
+
+import contextlib
+import time
+
+import vk_api
+from vk_api.exceptions import ApiError, TOO_MANY_RPS_CODE
+
+from .metrics import Metrics
+from .ratelimit import RateLimiter
+
+FLOOD_CONTROL_CODE = 9
+INTERNAL_ERROR_CODE = 10
+
+# Ошибки, после которых запрос имеет смысл повторить с паузой
+RETRY_CODES = {TOO_MANY_RPS_CODE, FLOOD_CONTROL_CODE, INTERNAL_ERROR_CODE}
+
+
+class LimitedVkApi(vk_api.VkApi):
+    """
+    VkApi, который вместо фиксированной паузы между запросами берёт токен
+    у RateLimiter и повторяет запрос с экспоненциальной паузой при ошибках
+    6 / 9 / 10. Один limiter можно разделять между потоками и сессиями.
+
+    В отличие от VkApi, запросы из разных потоков не ждут друг друга:
+    частоту задаёт только limiter, поэтому несколько execute могут
+    выполняться одновременно. Каждый вызов записывается в metrics.
+    """
+
+    RPS_DELAY = 0  # частотой управляет RateLimiter
+
+    def __init__(self, *args, limiter: RateLimiter | None = None, max_retries: int = 5,
+                 metrics: Metrics | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter or RateLimiter()
+        self.metrics = metrics or Metrics()
+        self.max_retries = max_retries
+        # VkApi держит self.lock на всё время HTTP-запроса
+        self.lock = contextlib.nullcontext()
+        # Стандартный обработчик ошибки 6 спит 0.5 сек без учёта других потоков
+        self.error_handlers.pop(TOO_MANY_RPS_CODE, None)
+
+    def method(self, method, values=None, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.metrics.add_sleep("rate_limit", self.limiter.acquire())
+            started = time.perf_counter()
+            try:
+                response = super().method(method, values, *args, **kwargs)
+            except ApiError as e:
+                self.metrics.record_call(method, time.perf_counter() - started, e.code)
+                if e.code not in RETRY_CODES or attempt >= self.max_retries:
+                    raise
+                delay = self.limiter.backoff(attempt)
+                self.metrics.record_retry(method, e.code, delay)
+                self.logger.warning(f"VK API error {e.code} в {method}, повтор через {delay:.1f} сек")
+                attempt += 1
+            else:
+                self.metrics.record_call(method, time.perf_counter() - started)
+                return response
+
+
+def create_session(token: str, limiter: RateLimiter | None = None, metrics: Metrics | None = None,
+                   **kwargs) -> LimitedVkApi:
+    """Создаёт сессию по токену с общим ограничителем частоты."""
+    return LimitedVkApi(token=token, limiter=limiter, metrics=metrics, **kwargs)
@@ -0,0 +1,210 @@
+"""Локальный архив сообщений в SQLite с полнотекстовым индексом FTS5."""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+
+from .accounts import DEFAULT_ACCOUNT, account_path
+from .formats import format_timestamp
+from .namecache import NAME_CACHE_FILE, NameCache
+
+ARCHIVE_FILE = "messages_archive.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    peer_id INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    from_id INTEGER,
+    date INTEGER NOT NULL,
+    text TEXT NOT NULL DEFAULT '',
+    reply_id INTEGER,
+    reply_cmid INTEGER,
+    attachments TEXT NOT NULL DEFAULT '',
+    UNIQUE (peer_id, id)
+);
+CREATE INDEX IF NOT EXISTS messages_date ON messages (date);
+CREATE INDEX IF NOT EXISTS messages_peer_date ON messages (peer_id, date);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    text,
+    content='messages',
+    content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE OF text ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+    INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+"""
+
+
+def message_row(peer_id: int, msg: dict) -> tuple:
+    """
+    Строка таблицы messages. У цитаты два независимых номера: reply_id —
+    глобальный id (как messages.id, в беседах VK его часто не отдаёт),
+    reply_cmid — conversation_message_id, номер внутри беседы.
+    """
+    reply = msg.get("reply_message") or {}
+    att_types = ",".join(att.get("type", "unknown") for att in msg.get("attachments", []))
+    return (peer_id, msg["id"], msg.get("from_id"), msg.get("date", 0), msg.get("text", ""),
+            reply.get("id") or None, reply.get("conversation_message_id"), att_types)
+
+
+class MessageArchive:
+    """
+    Архив всех выгруженных сообщений.
+
+    Страницы истории пишутся пакетно, одной транзакцией на страницу, в
+    режиме WAL. Повторная запись того же сообщения обновляет его, поэтому
+    инкрементальный экспорт и перевыгрузка не создают дубликатов.
+    """
+
+    def __init__(self, path: str = ARCHIVE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(messages)")}
+        if "reply_cmid" not in columns:
+            # Архив старой версии: reply_cmid заполнится при следующей выгрузке диалога
+            self._conn.execute("ALTER TABLE messages ADD COLUMN reply_cmid INTEGER")
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_messages(self, peer_id: int, items: list):
+        """Сохраняет страницу сообщений одной транзакцией."""
+        rows = [message_row(peer_id, msg) for msg in items]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO messages (peer_id, id, from_id, date, text, reply_id, reply_cmid, attachments)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(peer_id, id) DO UPDATE SET from_id=excluded.from_id,"
+                " date=excluded.date, text=excluded.text, reply_id=excluded.reply_id,"
+                " reply_cmid=excluded.reply_cmid, attachments=excluded.attachments",
+                rows,
+            )
+
+    def search(self, query: str | None = None, peer_id: int | None = None,
+               date_from: int | None = None, date_to: int | None = None, limit: int = 100) -> list[dict]:
+        """
+        Ищет сообщения по тексту (синтаксис FTS5) и/или диапазону дат.
+        Результаты — от новых к старым.
+        """
+        sql = ("SELECT m.peer_id, m.id, m.from_id, m.date, m.text, m.reply_id, m.reply_cmid, m.attachments"
+               " FROM messages m")
+        conditions = []
+        params = []
+        if query:
+            sql += " JOIN messages_fts ON messages_fts.rowid = m.rowid"
+            conditions.append("messages_fts MATCH ?")
+            params.append(query)
+        if peer_id is not None:
+            conditions.append("m.peer_id = ?")
+            params.append(peer_id)
+        if date_from is not None:
+            conditions.append("m.date >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            conditions.append("m.date < ?")
+            params.append(date_to)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY m.date DESC LIMIT ?"
+        params.append(limit)
+
+        columns = ("peer_id", "id", "from_id", "date", "text", "reply_id", "reply_cmid", "attachments")
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+
+def parse_date(value: str) -> int:
+    """YYYY-MM-DD → Unix timestamp начала дня (локальное время)."""
+    return int(datetime.strptime(value, "%Y-%m-%d").timestamp())
+
+
+def parse_date_range(date_from: str | None, date_to: str | None) -> tuple[int | None, int | None]:
+    """Даты YYYY-MM-DD (to — включительно) → полуинтервал [from, to) в Unix time."""
+    start = parse_date(date_from) if date_from else None
+    end = None
+    if date_to:
+        end = int((datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)).timestamp())
+    return start, end
+
+
+def add_search_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("query", nargs="?", help="Текст для поиска (синтаксис FTS5)")
+    parser.add_argument("--peer", type=int, help="Только в диалоге с этим peer_id")
+    parser.add_argument("--from", dest="date_from", help="С даты YYYY-MM-DD")
+    parser.add_argument("--to", dest="date_to", help="По дату YYYY-MM-DD включительно")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--db", default=ARCHIVE_FILE, help="Путь к файлу архива")
+    parser.add_argument("--account", default=DEFAULT_ACCOUNT,
+                        help="Аккаунт из раздела accounts в config.json (его архив и кеш имён)")
+
+
+def run_search(args) -> int:
+    """Печатает результаты поиска по архиву; возвращает код выхода."""
+    db = account_path(args.db, args.account)
+    if not os.path.exists(db):
+        print(f"Архив {db} не найден", file=sys.stderr)
+        return 2
+
+    try:
+        date_from, date_to = parse_date_range(args.date_from, args.date_to)
+    except ValueError:
+        print("Даты --from/--to нужно указывать в формате YYYY-MM-DD", file=sys.stderr)
+        return 2
+
+    archive = MessageArchive(db)
+    try:
+        results = archive.search(args.query, args.peer, date_from, date_to, args.limit)
+    except sqlite3.OperationalError as e:
+        # Запрос — в синтаксисе FTS5: знаки препинания и апострофы нужно брать в кавычки
+        print(f"Неверный поисковый запрос ({e}); фразу берите в двойные кавычки: '\"привет, мир\"'",
+              file=sys.stderr)
+        return 2
+    finally:
+        archive.close()
+
+    # Имена — только из локального кеша, без обращений к API
+    names = {}
+    name_cache = account_path(NAME_CACHE_FILE, args.account)
+    if os.path.exists(name_cache):
+        cache = NameCache(name_cache)
+        try:
+            names = cache.get_many({row["from_id"] for row in results})
+        finally:
+            cache.close()
+
+    for row in results:
+        timestamp = format_timestamp(row["date"])
+        sender = names.get(row["from_id"], f"id{row['from_id']}")
+        print(f"[{timestamp}] peer {row['peer_id']} | {sender}: {row['text']}")
+    print(f"Найдено: {len(results)}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Поиск по локальному архиву сообщений VK")
+    add_search_arguments(parser)
+    sys.exit(run_search(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
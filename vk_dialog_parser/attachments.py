@@ -0,0 +1,190 @@
+"""Скачивание вложений с дедупликацией по содержимому."""
+
+import hashlib
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MEDIA_DIR = "media"
+BLOBS_DIR = ".blobs"
+PARTIAL_DIR = ".partial"
+
+DEFAULT_WORKERS = 4
+DOWNLOAD_TIMEOUT = 60
+DOWNLOAD_RETRIES = 3
+CHUNK_SIZE = 64 * 1024
+
+PHOTO_SIZE_ORDER = "smxopqryzw"  # от меньшего к большему, если width/height нет
+
+
+def _largest(sizes: list) -> dict | None:
+    def rank(size):
+        kind = size.get("type", "")
+        order = PHOTO_SIZE_ORDER.index(kind) if kind and kind in PHOTO_SIZE_ORDER else -1
+        return size.get("width", 0) * size.get("height", 0), order
+
+    return max(sizes, key=rank) if sizes else None
+
+
+def _clean_ext(ext: str) -> str:
+    ext = "".join(ch for ch in (ext or "") if ch.isalnum())[:10]
+    return f".{ext.lower()}" if ext else ".bin"
+
+
+def attachment_source(att: dict) -> tuple[str, str, str] | None:
+    """
+    (ключ, url, расширение) для вложения, которое можно скачать, иначе None.
+
+    Ключ строится из owner_id и id объекта, поэтому одно и то же вложение,
+    пересланное в разные диалоги, получает один и тот же файл.
+    """
+    kind = att.get("type")
+    obj = att.get(kind) or {}
+
+    if kind == "photo":
+        best = _largest(obj.get("sizes") or [])
+        url, ext = (best or {}).get("url"), ".jpg"
+    elif kind == "doc":
+        url, ext = obj.get("url"), _clean_ext(obj.get("ext"))
+    elif kind == "audio_message":
+        url = obj.get("link_mp3") or obj.get("link_ogg")
+        ext = ".mp3" if obj.get("link_mp3") else ".ogg"
+    elif kind == "graffiti":
+        url, ext = obj.get("url"), ".png"
+    elif kind == "sticker":
+        best = _largest(obj.get("images") or [])
+        url, ext = (best or {}).get("url"), ".png"
+        return (f"sticker{obj.get('sticker_id')}", url, ext) if url else None
+    else:
+        return None
+
+    if not url or obj.get("id") is None:
+        return None
+    return f"{kind}{obj.get('owner_id')}_{obj.get('id')}", url, ext
+
+
+class AttachmentDownloader:
+    """
+    Фоновое скачивание вложений для экспорта.
+
+    link(att) сразу возвращает относительный путь к файлу (для ссылки в
+    экспортированном файле) и ставит скачивание в очередь ограниченного пула
+    потоков, так что загрузка истории его не ждёт. Запросы идут через общую
+    сессию requests с пулом keep-alive соединений; недокачанный файл
+    докачивается через HTTP Range. requests импортируется при создании,
+    чтобы экспорт без вложений его не загружал.
+
+    Содержимое хранится один раз в media/.blobs/ под именем sha256, а файл
+    по ссылке (media/photo123_456.jpg) — жёсткая ссылка на него. Одинаковая
+    картинка, загруженная в VK несколько раз, занимает место один раз.
+    """
+
+    def __init__(self, export_dir: str, workers: int = DEFAULT_WORKERS, session=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.media_dir = os.path.join(export_dir, MEDIA_DIR)
+        os.makedirs(os.path.join(self.media_dir, PARTIAL_DIR), exist_ok=True)
+        os.makedirs(os.path.join(self.media_dir, BLOBS_DIR), exist_ok=True)
+
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media")
+        self._lock = threading.Lock()
+        self._scheduled = set()
+        self.stats = {"downloaded": 0, "existing": 0, "deduplicated": 0, "failed": 0}
+        self.errors = []
+
+    def link(self, att: dict) -> str | None:
+        """Относительный путь к файлу вложения (скачивание — в фоне) или None."""
+        source = attachment_source(att)
+        if source is None:
+            return None
+        key, url, ext = source
+        filename = key + ext
+
+        with self._lock:
+            first = filename not in self._scheduled
+            self._scheduled.add(filename)
+        if first:
+            self._pool.submit(self._fetch, filename, url)
+        return f"{MEDIA_DIR}/{filename}"
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _fetch(self, filename: str, url: str):
+        import requests
+
+        target = os.path.join(self.media_dir, filename)
+        if os.path.exists(target):
+            self._count("existing")
+            return
+
+        partial = os.path.join(self.media_dir, PARTIAL_DIR, filename)
+        try:
+            for attempt in range(DOWNLOAD_RETRIES):
+                try:
+                    self._download(url, partial)
+                    break
+                except (requests.RequestException, OSError):
+                    if attempt == DOWNLOAD_RETRIES - 1:
+                        raise
+            self._store(partial, target)
+        except Exception as e:
+            self._count("failed")
+            with self._lock:
+                self.errors.append(f"{filename}: {e}")
+
+    def _download(self, url: str, partial: str):
+        """Докачивает partial с места обрыва (Range), если сервер это умеет."""
+        have = os.path.getsize(partial) if os.path.exists(partial) else 0
+        headers = {"Range": f"bytes={have}-"} if have else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+            if resp.status_code == 416:  # файл уже докачан целиком
+                return
+            resp.raise_for_status()
+            mode = "ab" if have and resp.status_code == 206 else "wb"
+            with open(partial, mode) as f:
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+
+    def _store(self, partial: str, target: str):
+        """Переносит файл в хранилище по sha256 и ставит на него ссылку target."""
+        digest = hashlib.sha256()
+        with open(partial, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        sha = digest.hexdigest()
+        ext = os.path.splitext(target)[1]
+        blob = os.path.join(self.media_dir, BLOBS_DIR, sha[:2], sha + ext)
+
+        with self._lock:
+            if os.path.exists(blob):
+                os.remove(partial)
+                self.stats["deduplicated"] += 1
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.replace(partial, blob)
+                self.stats["downloaded"] += 1
+            if not os.path.exists(target):
+                try:
+                    os.link(blob, target)
+                except OSError:
+                    # Файловая система без жёстких ссылок — храним копию
+                    shutil.copy2(blob, target)
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"скачано {s['downloaded']}, уже были {s['existing']}, "
+                f"совпали по содержимому {s['deduplicated']}, ошибок {s['failed']}")
+
+    def close(self, cancel: bool = False):
+        """Дожидается скачивания (или отменяет ещё не начатое) и закрывает сессию."""
+        self._pool.shutdown(wait=True, cancel_futures=cancel)
+        self.session.close()
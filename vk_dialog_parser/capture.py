@@ -0,0 +1,182 @@
+"""Сырые страницы messages.getHistory на диске: для повторного рендера без сети."""
+
+import gzip
+import json
+import os
+import zlib
+
+from .attachments import MEDIA_DIR, attachment_source
+from .names import fallback_name
+
+CAPTURE_DIR = ".raw"
+CHUNK = 1 << 20
+
+
+def capture_path(export_dir: str, peer_id: int) -> str:
+    return os.path.join(export_dir, CAPTURE_DIR, f"{peer_id}.jsonl.gz")
+
+
+def page_sender_ids(items: list) -> set[int]:
+    """id, чьи имена нужны для рендера страницы: отправители и авторы цитат."""
+    ids = {msg.get("from_id") for msg in items}
+    ids |= {msg["reply_message"].get("from_id") for msg in items if msg.get("reply_message")}
+    ids.discard(None)
+    return ids
+
+
+def _broken_tail(path: str) -> int | None:
+    """Смещение последнего члена gzip, если он оборван (нет конца потока), иначе None."""
+    start = pos = 0
+    decompressor = zlib.decompressobj(31)
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK):
+            while chunk:
+                try:
+                    decompressor.decompress(chunk)
+                except zlib.error:
+                    return None  # испорчен, а не оборван: чинить нечего, read_capture сообщит
+                if not decompressor.eof:
+                    pos += len(chunk)
+                    break
+                pos += len(chunk) - len(decompressor.unused_data)
+                chunk = decompressor.unused_data
+                start = pos
+                decompressor = zlib.decompressobj(31)
+    return start if pos > start else None
+
+
+def repair_capture(path: str) -> bool:
+    """
+    Дочинивает запись, оборванную аварийным завершением: у члена gzip
+    убитого запуска нет конца потока, и член, дописанный после него,
+    сделал бы нечитаемым весь файл. Целые строки оборванного члена
+    переписываются законченным членом (оборванная страница теряется,
+    продолжение загрузит её заново). Возвращает True, если файл изменён.
+    """
+    if not os.path.exists(path):
+        return False
+    start = _broken_tail(path)
+    if start is None:
+        return False
+
+    salvaged = path + ".tmp"
+    decompressor = zlib.decompressobj(31)
+    tail = b""
+    with open(path, "rb") as src, gzip.open(salvaged, "wb") as dst:
+        src.seek(start)
+        while chunk := src.read(CHUNK):
+            try:
+                data = tail + decompressor.decompress(chunk)
+            except zlib.error:
+                break
+            lines, _, tail = data.rpartition(b"\n")
+            if lines:
+                dst.write(lines + b"\n")
+    with open(path, "r+b") as f, open(salvaged, "rb") as src:
+        f.truncate(start)
+        f.seek(start)
+        while chunk := src.read(CHUNK):
+            f.write(chunk)
+    os.remove(salvaged)
+    return True
+
+
+class PageCapture:
+    """
+    Дописываемый gzip-файл {export_dir}/.raw/{peer_id}.jsonl.gz.
+
+    Первая строка каждого запуска — {"meta": {...}} с именем и типом
+    диалога и after_id (id, после которого запуск начал загрузку), дальше
+    по строке на страницу: {"page": ответ API, "names": {id: имя}} с именами
+    отправителей на момент экспорта, чтобы рендер не обращался к API.
+    Каждый запуск добавляет новый член gzip; полная выгрузка (append=False)
+    начинает файл заново. Член, оборванный убитым запуском, перед
+    дописыванием закрывается (repair_capture).
+    """
+
+    def __init__(self, export_dir: str, peer_id: int, display_name: str, dialog_type: str,
+                 after_id: int = 0, append: bool = True):
+        self.path = capture_path(export_dir, peer_id)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if append:
+            repair_capture(self.path)
+        self.f = gzip.open(self.path, "at" if append else "wt", encoding="utf-8")
+        self._write({"meta": {"peer_id": peer_id, "display_name": display_name, "dialog_type": dialog_type,
+                              "after_id": after_id}})
+
+    def _write(self, record: dict):
+        self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.f.flush()
+
+    def add_page(self, response: dict, names):
+        page_names = {pid: names.name(pid) for pid in page_sender_ids(response.get("items", []))}
+        self._write({"page": response, "names": page_names})
+
+    def close(self):
+        self.f.close()
+
+
+def read_capture(path: str):
+    """
+    Отдаёт (meta, page, names) по порядку записи.
+
+    Сообщения, которые уже встречались (страницы, записанные перед сбоем
+    и загруженные повторно после продолжения), выбрасываются; оборванный
+    конец файла (запуск ещё пишет или был убит) игнорируется. Если запуск
+    начался позже последнего записанного сообщения (запись включили не
+    с первой выгрузки) или файл испорчен в середине, бросается ValueError:
+    история в файле неполная.
+    """
+    meta = {}
+    last_id = 0
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if "meta" in record:
+                    meta = record["meta"]
+                    if meta.get("after_id", 0) > last_id:
+                        raise ValueError(f"в {path} нет сообщений до id {meta['after_id']}")
+                    continue
+                page = record["page"]
+                items = [msg for msg in page.get("items", []) if msg["id"] > last_id]
+                if not items:
+                    continue
+                last_id = items[-1]["id"]
+                names = {int(pid): name for pid, name in record.get("names", {}).items()}
+                yield meta, dict(page, items=items), names
+    except EOFError:
+        return
+    except (zlib.error, gzip.BadGzipFile) as e:
+        raise ValueError(f"{path} повреждён: {e}") from e
+
+
+class CapturedNames:
+    """Имена для рендера из записанных страниц (вместо NameResolver)."""
+
+    def __init__(self):
+        self.names: dict[int, str] = {}
+
+    def name(self, peer_id: int) -> str:
+        return self.names.get(peer_id, fallback_name(peer_id))
+
+
+class ExistingMedia:
+    """Ссылки на уже скачанные вложения в {export_dir}/media без загрузки (пути — относительно out_dir)."""
+
+    def __init__(self, export_dir: str, out_dir: str):
+        self.media_dir = os.path.join(export_dir, MEDIA_DIR)
+        self.out_dir = out_dir
+
+    def link(self, att: dict) -> str | None:
+        source = attachment_source(att)
+        if source is None:
+            return None
+        key, _, ext = source
+        path = os.path.join(self.media_dir, key + ext)
+        if not os.path.exists(path):
+            return None
+        return os.path.relpath(path, self.out_dir).replace(os.sep, "/")
@@ -0,0 +1,76 @@
+"""Контрольные точки экспорта: докуда диалог уже выгружен в файл."""
+
+import json
+import os
+
+CHECKPOINT_DIR = ".checkpoints"
+
+
+def checkpoint_path(export_dir: str, peer_id: int, fmt: str = "md", date_range: tuple | None = None) -> str:
+    """
+    Для Markdown — {peer_id}.json, для других форматов — {peer_id}.{fmt}.json.
+    У выгрузки за период (date_from, date_to) своя точка
+    {peer_id}.{fmt}.{date_from}-{date_to}.json: она не затирает точку полной
+    выгрузки, и list_checkpoints (а с ним sync) её не видит.
+    """
+    if date_range is not None:
+        date_from, date_to = date_range
+        name = f"{peer_id}.{fmt}.{date_from or ''}-{date_to or ''}.json"
+    else:
+        name = f"{peer_id}.json" if fmt == "md" else f"{peer_id}.{fmt}.json"
+    return os.path.join(export_dir, CHECKPOINT_DIR, name)
+
+
+def load_checkpoint(export_dir: str, peer_id: int, fmt: str = "md", date_range: tuple | None = None) -> dict | None:
+    """
+    Загружает контрольную точку диалога.
+
+    Формат: {"file": имя файла, "last_message_id": id последнего записанного
+    сообщения, "offset": размер файла в байтах после последней полной
+    страницы, "message_count": сколько сообщений записано}. У шардированного
+    экспорта ещё "shard" (режим) и "shards" (список шардов), а "file" —
+    путь к последнему шарду относительно папки экспорта.
+    """
+    path = checkpoint_path(export_dir, peer_id, fmt, date_range)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(export_dir: str, peer_id: int, checkpoint: dict, fmt: str = "md",
+                    date_range: tuple | None = None):
+    """Атомарно сохраняет контрольную точку (через временный файл)."""
+    path = checkpoint_path(export_dir, peer_id, fmt, date_range)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def remove_checkpoint(export_dir: str, peer_id: int, fmt: str = "md"):
+    path = checkpoint_path(export_dir, peer_id, fmt)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def list_checkpoints(export_dir: str) -> list[tuple[int, str]]:
+    """Пары (peer_id, формат) для всех контрольных точек папки экспорта."""
+    checkpoint_dir = os.path.join(export_dir, CHECKPOINT_DIR)
+    if not os.path.isdir(checkpoint_dir):
+        return []
+    found = []
+    for filename in os.listdir(checkpoint_dir):
+        parts = filename.split(".")
+        if parts[-1] != "json" or len(parts) not in (2, 3):
+            continue
+        try:
+            peer_id = int(parts[0])
+        except ValueError:
+            continue
+        found.append((peer_id, parts[1] if len(parts) == 3 else "md"))
+    return sorted(found)
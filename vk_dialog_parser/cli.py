@@ -0,0 +1,485 @@
+"""
+Консольный экспорт диалогов без GUI (для серверов и cron).
+
+Тяжёлые зависимости (vk_api, requests, numpy, aiohttp) импортируются только
+в командах, которым они нужны: --help, stats, search и rerender их не грузят.
+"""
+
+import argparse
+import os
+import sys
+import threading
+from concurrent.futures import as_completed
+
+from .accounts import DEFAULT_ACCOUNT, Account, AccountPool, account_path, load_accounts
+from .archive import ARCHIVE_FILE, MessageArchive, add_search_arguments, parse_date_range, run_search
+from .attachments import DEFAULT_WORKERS as DEFAULT_MEDIA_WORKERS, AttachmentDownloader
+from .capture import CAPTURE_DIR
+from .config import extract_token, load_config
+from .export import EXPORT_DIR, dialog_filepath, ensure_dir, export_dialog
+from .formats import DEFAULT_FORMAT, FORMATS, format_timestamp
+from .metrics import Metrics, Profiler, save_report
+from .namecache import NAME_CACHE_FILE, NameCache, open_name_cache
+from .names import fallback_name
+from .output import DEFAULT_SHARD_SIZE, SHARD_MODES
+
+DEFAULT_WORKERS = 4
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+NUMPY_HINT = "Для колоночного индекса и stats нужен numpy: pip install -e \".[stats]\""
+
+
+class Reporter:
+    """Построчный вывод прогресса из нескольких потоков."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def __call__(self, msg: str):
+        with self._lock:
+            print(msg, file=self.stream, flush=True)
+
+
+def select_tokens(token: str | None, names: list[str] | None, config: dict) -> dict[str, str]:
+    """
+    Аккаунты для команды: --token (или VK_TOKEN) — один аккаунт default,
+    иначе из config.json — выбранные --account (names) или все.
+    """
+    token = extract_token(token or os.environ.get("VK_TOKEN") or "")
+    if token:
+        return {DEFAULT_ACCOUNT: token}
+    accounts = load_accounts(config)
+    if names:
+        unknown = [name for name in names if name not in accounts]
+        if unknown:
+            raise KeyError(", ".join(unknown))
+        accounts = {name: accounts[name] for name in names}
+    return accounts
+
+
+def select_dialogs(pool: AccountPool, peers: list[str]) -> list[dict]:
+    """
+    Диалоги для экспорта: все диалоги всех аккаунтов ("all", через кеш
+    списка) или по списку peer_id. peer_id можно указать с аккаунтом
+    (work:2000000001); без него — это диалог первого аккаунта.
+    """
+    if [p.lower() for p in peers] == ["all"]:
+        return pool.load_dialogs()
+
+    by_account = {}
+    first = next(iter(pool.accounts))
+    for peer in peers:
+        name, _, peer_id = peer.rpartition(":")
+        if name and name not in pool.accounts:
+            raise ValueError(f"неизвестный аккаунт {name}")
+        by_account.setdefault(name or first, []).append(int(peer_id))
+
+    dialogs = []
+    for name, peer_ids in by_account.items():
+        account = pool.accounts[name]
+        account.names.resolve(peer_ids)
+        dialogs.extend(account.dialog(peer_id) for peer_id in peer_ids)
+    return dialogs
+
+
+def api_errors(aio: bool = False) -> tuple:
+    """Ошибки сети и VK API, которыми может кончиться запрос сессии (--async — свои)."""
+    import requests
+    from vk_api.exceptions import ApiError
+
+    errors = (requests.RequestException, ApiError)
+    if aio:
+        import asyncio
+
+        import aiohttp
+
+        from .aio import AsyncApiError
+        errors += (aiohttp.ClientError, asyncio.TimeoutError, AsyncApiError)
+    return errors
+
+
+def run_export(args) -> int:
+    config = load_config()
+    try:
+        tokens = select_tokens(args.token, args.account, config)
+    except KeyError as e:
+        print(f"Нет аккаунтов в config.json: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if not tokens:
+        print("Не найден access token: передайте --token, VK_TOKEN или сохраните его через GUI", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        date_from, date_to = parse_date_range(args.date_from, args.date_to)
+    except ValueError:
+        print("Даты --from/--to нужно указывать в формате YYYY-MM-DD", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.columns:
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            print(NUMPY_HINT, file=sys.stderr)
+            return EXIT_USAGE
+
+    report = Reporter()
+    stop = threading.Event()
+    metrics = Metrics()
+    profiler = Profiler() if args.profile else None
+
+    # Кеши имён и архивы аккаунтов закрываются при любом выходе, в том числе по ошибке
+    caches = {name: open_name_cache(config, account_path(NAME_CACHE_FILE, name)) for name in tokens}
+    archives = {}
+    try:
+        # По сессии и лимиту запросов на аккаунт, общие для всех его потоков
+        try:
+            accounts = {
+                name: Account(name, token, cache=caches[name], metrics=metrics, aio=args.aio, report=report)
+                for name, token in tokens.items()
+            }
+        except ImportError:
+            print("Для --async нужен aiohttp: pip install -e \".[async]\"", file=sys.stderr)
+            return EXIT_USAGE
+        pool = AccountPool(accounts, args.workers)
+
+        try:
+            dialogs = select_dialogs(pool, args.peers)
+        except ValueError:
+            pool.shutdown()
+            print("peer_id должны быть числами (или одно слово all), аккаунт — из config.json", file=sys.stderr)
+            return EXIT_USAGE
+        except api_errors(args.aio) as e:
+            pool.shutdown()
+            print(f"Не удалось получить список диалогов: {e}", file=sys.stderr)
+            return EXIT_FAILED
+
+        # Экспорт, архив и вложения у каждого аккаунта свои (peer_id у аккаунтов пересекаются)
+        out_dirs = {name: account_path(args.out, name, is_dir=True) for name in accounts}
+        for out_dir in out_dirs.values():
+            ensure_dir(out_dir)
+        if args.archive:
+            archives.update((name, MessageArchive(account_path(args.archive_db, name))) for name in accounts)
+        media = {name: AttachmentDownloader(out_dirs[name], workers=args.media_workers) for name in accounts} if args.media else {}
+        total = len(dialogs)
+        report(f"[INFO] Экспорт {total} диалогов в {args.out} "
+               f"({len(accounts)} аккаунтов x {args.workers} потоков)")
+
+        def finish():
+            path = save_report(args.out, metrics, profiler)
+            for line in metrics.summary():
+                report(f"[STAT] {line}")
+            report(f"[INFO] Отчёт: {path}")
+
+        def export_one(account: Account, dialog: dict, idx: int) -> int:
+            if profiler is not None:
+                with profiler.thread():
+                    return _export_one(account, dialog, idx)
+            return _export_one(account, dialog, idx)
+
+        def _export_one(account: Account, dialog: dict, idx: int) -> int:
+            tag = f"[{idx}/{total}] {dialog['display_name']} ({dialog['peer_id']})"
+            if len(accounts) > 1:
+                tag += f" @{account.name}"
+            report(f"{tag}: начало")
+            out_dir = out_dirs[account.name]
+            count = export_dialog(
+                account.vk,
+                account.names,
+                dialog["peer_id"],
+                dialog_filepath(out_dir, dialog, args.format, date_from, date_to, sharded=args.shard is not None),
+                dialog["display_name"],
+                dialog["dialog_type"],
+                batched=not args.no_batch,
+                incremental=not args.full,
+                should_stop=stop.is_set,
+                archive=archives.get(account.name),
+                on_page=lambda n: report(f"{tag}: {n} сообщений"),
+                fmt=args.format,
+                media=media.get(account.name),
+                metrics=metrics,
+                date_from=date_from,
+                date_to=date_to,
+                shard=args.shard,
+                shard_size=args.shard_size_mb * 1024 * 1024,
+                capture=args.capture,
+                columns=args.columns,
+            )
+            report(f"{tag}: готово, сообщений: {count}")
+            return count
+
+        failed = 0
+        with pool:
+            futures = {pool.submit(dialog, export_one, idx): dialog for idx, dialog in enumerate(dialogs, 1)}
+            try:
+                for future in as_completed(futures):
+                    dialog = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed += 1
+                        report(f"[ERR] {dialog['display_name']} ({dialog['peer_id']}): {e}")
+            except KeyboardInterrupt:
+                stop.set()
+                report("[INFO] Остановка: дожидаюсь завершения текущих страниц...")
+                pool.shutdown(wait=True, cancel=True)
+                for downloader in media.values():
+                    downloader.close(cancel=True)
+                finish()
+                return EXIT_INTERRUPTED
+
+        if media:
+            report("[INFO] Дожидаюсь скачивания вложений...")
+            for name, downloader in media.items():
+                downloader.close()
+                report(f"[INFO] Вложения{'' if name == DEFAULT_ACCOUNT else f' ({name})'}: {downloader.summary()}")
+
+        finish()
+        report(f"[INFO] Готово: {total - failed} из {total}, ошибок: {failed}")
+        return EXIT_FAILED if failed else EXIT_OK
+    finally:
+        for archive in archives.values():
+            archive.close()
+        for cache in caches.values():
+            cache.close()
+
+
+def run_sync(args) -> int:
+    config = load_config()
+    try:
+        tokens = select_tokens(args.token, [args.account] if args.account else None, config)
+    except KeyError as e:
+        print(f"Нет аккаунтов в config.json: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    if not tokens:
+        print("Не найден access token: передайте --token, VK_TOKEN или сохраните его через GUI", file=sys.stderr)
+        return EXIT_USAGE
+    if len(tokens) > 1:
+        # У каждого аккаунта свой long poll и своя папка экспорта
+        print(f"В config.json несколько аккаунтов ({', '.join(tokens)}): выберите один через --account",
+              file=sys.stderr)
+        return EXIT_USAGE
+    ((account, token),) = tokens.items()
+    out_dir = account_path(args.out, account, is_dir=True)
+
+    from .api import create_session
+    from .names import NameResolver
+    from .ratelimit import RateLimiter
+    from .sync import LongPollSync
+
+    report = Reporter()
+    vk = create_session(token, limiter=RateLimiter()).get_api()
+    names = NameResolver(vk, cache=open_name_cache(config, account_path(NAME_CACHE_FILE, account)), report=report)
+    names.warm()
+    archive = MessageArchive(account_path(args.archive_db, account)) if args.archive else None
+    ensure_dir(out_dir)
+
+    sync = LongPollSync(vk, names, out_dir, archive=archive, batched=not args.no_batch, report=report)
+    try:
+        if args.once:
+            sync.start()
+        else:
+            report(f"[INFO] Синхронизация {out_dir}: жду новых сообщений (Ctrl+C — выход)")
+            sync.run()
+    except KeyboardInterrupt:
+        report("[INFO] Синхронизация остановлена")
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        # run() ошибки переживает сам, сюда попадает только --once
+        report(f"[ERR] Синхронизация не удалась: {e}")
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def run_rerender(args) -> int:
+    from .rerender import rerender_all
+
+    try:
+        peer_ids = [int(p) for p in args.peers] or None
+    except ValueError:
+        print("peer_id должны быть числами", file=sys.stderr)
+        return EXIT_USAGE
+    out_dir = args.out or args.src
+    report = Reporter()
+
+    total = failed = 0
+    try:
+        for peer_id, result in rerender_all(args.src, out_dir, peer_ids, args.format, args.shard,
+                                            args.shard_size_mb * 1024 * 1024, args.workers):
+            total += 1
+            if isinstance(result, Exception):
+                failed += 1
+                report(f"[ERR] {peer_id}: {result}")
+            else:
+                report(f"{result['display_name'] or peer_id} ({peer_id}): сообщений: {result['messages']}")
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+
+    if not total:
+        report(f"[INFO] В {os.path.join(args.src, CAPTURE_DIR)} нет сохранённых диалогов")
+    report(f"[INFO] Готово: {total - failed} из {total}, ошибок: {failed}")
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def print_stats(stats: dict, names: dict[int, str]):
+    """Человекочитаемый вывод compute_stats."""
+    def name(from_id: int) -> str:
+        return names.get(from_id) or fallback_name(from_id)
+
+    print(f"Диалогов: {stats['dialogs']}, сообщений: {stats['messages']}, участников: {stats['participants']}")
+    print(f"Период: {format_timestamp(stats['first_date'])} — {format_timestamp(stats['last_date'])}")
+    print(f"Средняя длина текста: {stats['mean_text_len']:.1f}, с цитатой: {stats['reply_share']:.1%}")
+
+    print("\nСообщений по участникам:")
+    for row in stats["by_participant"]:
+        share = row["messages"] / stats["messages"]
+        print(f"  {name(row['from_id'])}: {row['messages']} ({share:.1%}), символов: {row['chars']}")
+
+    peak = max(stats["by_hour"]) or 1
+    print("\nПо часам:")
+    for hour, count in enumerate(stats["by_hour"]):
+        print(f"  {hour:02d}  {'#' * round(40 * count / peak):<40} {count}")
+    print("По дням недели: " + ", ".join(f"{day} {count}" for day, count in zip(WEEKDAYS, stats["by_weekday"])))
+
+    latency = stats["reply_latency"]
+    if latency:
+        print(f"\nЗадержка ответа: медиана {latency['median_s'] / 60:.1f} мин, "
+              f"90% — до {latency['p90_s'] / 60:.1f} мин ({latency['count']} ответов)")
+        for row in latency["by_participant"]:
+            print(f"  {name(row['from_id'])}: медиана {row['median_s'] / 60:.1f} мин ({row['count']})")
+
+    if stats["attachments"]:
+        print("\nВложения: " + ", ".join(f"{kind} {count}" for kind, count in stats["attachments"].items()))
+
+
+def run_stats(args) -> int:
+    try:
+        from .columns import compute_stats, index_start, indexed_peers, load_columns, save_stats
+    except ImportError:
+        print(NUMPY_HINT, file=sys.stderr)
+        return EXIT_USAGE
+    src = account_path(args.src, args.account, is_dir=True)
+    try:
+        peer_ids = [int(p) for p in args.peers] or indexed_peers(src)
+    except ValueError:
+        print("peer_id должны быть числами", file=sys.stderr)
+        return EXIT_USAGE
+    if not peer_ids:
+        print(f"В {src} нет колоночного индекса: выгрузите диалоги с --columns", file=sys.stderr)
+        return EXIT_USAGE
+
+    dialogs = [load_columns(src, peer_id) for peer_id in peer_ids]
+    stats = compute_stats(dialogs, top=args.top)
+    if not stats["messages"]:
+        print("Нет сообщений в колоночном индексе", file=sys.stderr)
+        return EXIT_FAILED
+
+    # Индекс, включённый не с первой выгрузки, покрывает только часть истории
+    incomplete = {peer_id: start for peer_id in peer_ids if (start := index_start(src, peer_id))}
+    for peer_id, start in incomplete.items():
+        print(f"[WARN] {peer_id}: в индексе нет сообщений до id {start} — статистика по неполной истории; "
+              "выгрузите диалог с --columns --full", file=sys.stderr)
+    stats["incomplete"] = sorted(incomplete)
+
+    # Имена — только из локального кеша, без обращений к API
+    names = {}
+    name_cache = account_path(NAME_CACHE_FILE, args.account)
+    if os.path.exists(name_cache):
+        ids = {row["from_id"] for row in stats["by_participant"]}
+        ids.update(row["from_id"] for row in stats["reply_latency"].get("by_participant", []))
+        names = NameCache(name_cache).get_many(ids)
+
+    if args.json:
+        save_stats(args.json, stats)
+        print(f"[INFO] Статистика сохранена: {args.json}")
+    else:
+        print_stats(stats, names)
+    return EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="vk-dialog-parser", description="Экспорт диалогов ВКонтакте без GUI")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Экспортировать диалоги в файлы")
+    export.add_argument("peers", nargs="+", help="peer_id диалогов (можно аккаунт:peer_id) или all")
+    export.add_argument("--token", help="Access token (по умолчанию VK_TOKEN или аккаунты из config.json)")
+    export.add_argument("--account", action="append",
+                        help="Аккаунт из раздела accounts в config.json (можно несколько; по умолчанию — все)")
+    export.add_argument("--out", default=EXPORT_DIR, help="Папка для файлов")
+    export.add_argument("-f", "--format", choices=FORMATS, default=DEFAULT_FORMAT,
+                        help="Формат файлов: md, jsonl (по строке JSON на сообщение), csv или html")
+    export.add_argument("--shard", choices=SHARD_MODES,
+                        help="Делить диалог на файлы в отдельной папке: по месяцам или по размеру")
+    export.add_argument("--shard-size-mb", type=int, default=DEFAULT_SHARD_SIZE // (1024 * 1024),
+                        help="Размер шарда для --shard size, МБ")
+    export.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Сколько диалогов выгружать одновременно (на каждый аккаунт)")
+    export.add_argument("--full", action="store_true", help="Выгрузить заново, игнорируя контрольные точки")
+    export.add_argument("--from", dest="date_from", help="Только сообщения с даты YYYY-MM-DD")
+    export.add_argument("--to", dest="date_to", help="Только сообщения по дату YYYY-MM-DD включительно")
+    export.add_argument("--no-batch", action="store_true", help="Не использовать execute (по одной странице за запрос)")
+    export.add_argument("--async", dest="aio", action="store_true",
+                        help="Асинхронный клиент на aiohttp: пул keep-alive соединений, параллельные запросы")
+    export.add_argument("--media", action="store_true", help="Скачивать вложения в <out>/media и ссылаться на них")
+    export.add_argument("--media-workers", type=int, default=DEFAULT_MEDIA_WORKERS,
+                        help="Сколько вложений скачивать одновременно")
+    export.add_argument("--profile", action="store_true",
+                        help="Сохранить профиль cProfile рядом с отчётом (<out>/.reports/*.prof)")
+    export.add_argument("--capture", action="store_true",
+                        help="Сохранять сырые ответы API в <out>/.raw (для rerender без сети)")
+    export.add_argument("--columns", action="store_true",
+                        help="Вести колоночный индекс в <out>/.columns для команды stats (нужен numpy)")
+    export.add_argument("--archive", action="store_true", help="Сохранять сообщения в локальный архив")
+    export.add_argument("--archive-db", default=ARCHIVE_FILE, help="Путь к файлу архива")
+    export.set_defaults(func=run_export)
+
+    sync = sub.add_parser("sync", help="Держать выгруженные диалоги в актуальном состоянии через long poll")
+    sync.add_argument("--token", help="Access token (по умолчанию VK_TOKEN или аккаунт из config.json)")
+    sync.add_argument("--account",
+                      help="Аккаунт из раздела accounts в config.json (обязателен, если их несколько)")
+    sync.add_argument("--out", default=EXPORT_DIR, help="Папка экспорта (с контрольными точками)")
+    sync.add_argument("--once", action="store_true", help="Догнать изменения с прошлой синхронизации и выйти")
+    sync.add_argument("--no-batch", action="store_true", help="Не использовать execute (по одной странице за запрос)")
+    sync.add_argument("--archive", action="store_true", help="Сохранять новые и изменённые сообщения в архив")
+    sync.add_argument("--archive-db", default=ARCHIVE_FILE, help="Путь к файлу архива")
+    sync.set_defaults(func=run_sync)
+
+    rerender = sub.add_parser("rerender", help="Пересобрать файлы из сохранённых сырых ответов (--capture) без сети")
+    rerender.add_argument("peers", nargs="*", help="peer_id диалогов (по умолчанию — все сохранённые)")
+    rerender.add_argument("--src", default=EXPORT_DIR, help="Папка экспорта с .raw")
+    rerender.add_argument("--out", help="Куда писать файлы (по умолчанию — в --src)")
+    rerender.add_argument("-f", "--format", choices=FORMATS, default=DEFAULT_FORMAT)
+    rerender.add_argument("--shard", choices=SHARD_MODES)
+    rerender.add_argument("--shard-size-mb", type=int, default=DEFAULT_SHARD_SIZE // (1024 * 1024))
+    rerender.add_argument("-j", "--workers", type=int, help="Процессов (по умолчанию — по числу ядер)")
+    rerender.set_defaults(func=run_rerender)
+
+    stats = sub.add_parser("stats", help="Статистика по колоночному индексу (--columns) без сети")
+    stats.add_argument("peers", nargs="*", help="peer_id диалогов (по умолчанию — все с индексом)")
+    stats.add_argument("--src", default=EXPORT_DIR, help="Папка экспорта с .columns")
+    stats.add_argument("--account", default=DEFAULT_ACCOUNT,
+                       help="Аккаунт из раздела accounts в config.json (его папка экспорта и кеш имён)")
+    stats.add_argument("--top", type=int, default=10, help="Сколько участников показывать")
+    stats.add_argument("--json", help="Сохранить статистику в JSON-файл вместо вывода")
+    stats.set_defaults(func=run_stats)
+
+    search = sub.add_parser("search", help="Поиск по локальному архиву")
+    add_search_arguments(search)
+    search.set_defaults(func=run_search)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
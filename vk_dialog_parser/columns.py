@@ -0,0 +1,228 @@
+"""
+Колоночный индекс сообщений для статистики (необязательная зависимость numpy).
+
+Установка: pip install -e ".[stats]"
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+COLUMNS_DIR = ".columns"
+META_FILE = "meta.json"
+
+# Колонки и их типы: по файлу {name}.bin на колонку, строки — сообщения по возрастанию id
+COLUMNS = {
+    "id": np.int64,
+    "date": np.int64,
+    "from_id": np.int64,
+    "text_len": np.int32,
+    "has_reply": np.uint8,
+    "attachments": np.uint16,  # битовая маска по ATTACHMENT_TYPES
+}
+
+ATTACHMENT_TYPES = ("photo", "video", "audio", "doc", "link", "sticker", "audio_message",
+                    "wall", "graffiti", "poll", "gift", "other")
+ATTACHMENT_BITS = {kind: 1 << i for i, kind in enumerate(ATTACHMENT_TYPES)}
+
+# Пауза больше этой — уже не ответ, а новый разговор
+REPLY_WINDOW = 24 * 3600
+
+
+def columns_dir(export_dir: str, peer_id: int) -> str:
+    return os.path.join(export_dir, COLUMNS_DIR, str(peer_id))
+
+
+def attachment_mask(attachments: list) -> int:
+    mask = 0
+    for att in attachments:
+        mask |= ATTACHMENT_BITS.get(att.get("type"), ATTACHMENT_BITS["other"])
+    return mask
+
+
+class ColumnStore:
+    """
+    Дописываемые колонки сообщений диалога в {export_dir}/.columns/{peer_id}/.
+
+    Каждая колонка — плоский файл значений одного типа (см. COLUMNS),
+    который читается через np.memmap без загрузки в память. Страницы
+    дописываются по мере экспорта; при продолжении строки после after_id
+    (недописанные перед сбоем) отрезаются, а уже записанные id пропускаются,
+    поэтому колонки общие для всех форматов экспорта диалога.
+
+    В meta.json хранится after_id, с которого индекс полон (0 — с начала
+    диалога). Он больше нуля, если индекс включили на инкрементальном
+    запуске уже выгруженного диалога или пропустили запуск (в индексе нет
+    сообщения контрольной точки): см. index_start.
+    """
+
+    def __init__(self, export_dir: str, peer_id: int, after_id: int = 0):
+        self.path = columns_dir(export_dir, peer_id)
+        os.makedirs(self.path, exist_ok=True)
+        self.last_id = after_id
+        kept = self._truncate(after_id)
+        if not len(kept) or kept[-1] != after_id:
+            # Сообщений до after_id в индексе нет (или не все): он полон только после него
+            self._save_start(after_id)
+        self.files = {name: open(self._file(name), "ab") for name in COLUMNS}
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _truncate(self, after_id: int) -> np.ndarray:
+        """Отрезает строки после after_id; возвращает оставшиеся id."""
+        ids = read_column(self.path, "id")
+        keep = int(np.searchsorted(ids, after_id, side="right")) if after_id else 0
+        kept = np.array(ids[:keep])
+        del ids  # memmap держит файл открытым
+        for name, dtype in COLUMNS.items():
+            path = self._file(name)
+            if os.path.exists(path):
+                os.truncate(path, min(os.path.getsize(path), keep * np.dtype(dtype).itemsize))
+        return kept
+
+    def _save_start(self, after_id: int):
+        with open(os.path.join(self.path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"after_id": after_id}, f)
+
+    def add_page(self, items: list):
+        items = [msg for msg in items if msg["id"] > self.last_id]
+        if not items:
+            return
+        values = {
+            "id": [msg["id"] for msg in items],
+            "date": [msg.get("date", 0) for msg in items],
+            "from_id": [msg.get("from_id", 0) for msg in items],
+            "text_len": [len(msg.get("text", "")) for msg in items],
+            "has_reply": [bool(msg.get("reply_message")) for msg in items],
+            "attachments": [attachment_mask(msg.get("attachments", [])) for msg in items],
+        }
+        for name, dtype in COLUMNS.items():
+            np.asarray(values[name], dtype=dtype).tofile(self.files[name])
+            self.files[name].flush()
+        self.last_id = items[-1]["id"]
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def read_column(path: str, name: str) -> np.ndarray:
+    """Колонка name из папки path (np.memmap; пустой массив, если файла нет)."""
+    dtype = np.dtype(COLUMNS[name])
+    filepath = os.path.join(path, f"{name}.bin")
+    rows = os.path.getsize(filepath) // dtype.itemsize if os.path.exists(filepath) else 0
+    if not rows:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(filepath, dtype=dtype, mode="r", shape=(rows,))
+
+
+def load_columns(export_dir: str, peer_id: int) -> dict[str, np.ndarray]:
+    """Все колонки диалога одинаковой длины (по самой короткой — на случай оборванной записи)."""
+    path = columns_dir(export_dir, peer_id)
+    columns = {name: read_column(path, name) for name in COLUMNS}
+    rows = min(len(col) for col in columns.values())
+    return {name: col[:rows] for name, col in columns.items()}
+
+
+def index_start(export_dir: str, peer_id: int) -> int:
+    """id, после которого индекс диалога полон; 0 — в нём вся история."""
+    try:
+        with open(os.path.join(columns_dir(export_dir, peer_id), META_FILE), "r", encoding="utf-8") as f:
+            return json.load(f).get("after_id", 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def indexed_peers(export_dir: str) -> list[int]:
+    root = os.path.join(export_dir, COLUMNS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(int(name) for name in os.listdir(root) if name.lstrip("-").isdigit())
+
+
+def compute_stats(dialogs: list[dict[str, np.ndarray]], top: int = 10, utc_offset: int | None = None) -> dict:
+    """
+    Статистика по одному или нескольким диалогам (колонки из load_columns).
+
+    Всё считается векторно: сообщения и символы по участникам, активность
+    по часам и дням недели (в местном времени), задержка ответа — пауза
+    перед сообщением, если предыдущее в том же диалоге написал другой
+    участник (паузы длиннее REPLY_WINDOW не считаются), доля цитат и
+    вложения по типам.
+    """
+    if utc_offset is None:
+        utc_offset = -time.timezone if not time.localtime().tm_isdst else -time.altzone
+
+    dialogs = [d for d in dialogs if len(d["id"])]
+    if not dialogs:
+        return {"messages": 0}
+
+    date = np.concatenate([d["date"] for d in dialogs])
+    from_id = np.concatenate([d["from_id"] for d in dialogs])
+    text_len = np.concatenate([d["text_len"] for d in dialogs])
+    has_reply = np.concatenate([d["has_reply"] for d in dialogs])
+    attachments = np.concatenate([d["attachments"] for d in dialogs])
+
+    # Участники — номера 0..k-1 вместо from_id, дальше только bincount
+    senders, sender = np.unique(from_id, return_inverse=True)
+    messages = np.bincount(sender, minlength=len(senders))
+    chars = np.bincount(sender, weights=text_len, minlength=len(senders))
+    leaders = np.argsort(-messages, kind="stable")[:top]
+
+    # Ответ — смена отправителя внутри диалога (стыки диалогов не считаются)
+    answer = sender[1:] != sender[:-1]
+    bounds = np.cumsum([len(d["id"]) for d in dialogs])[:-1]
+    answer[bounds - 1] = False
+    gaps = np.diff(date)
+    answer &= (gaps >= 0) & (gaps <= REPLY_WINDOW)
+    latency = gaps[answer]
+    responder = sender[1:][answer]
+
+    local = date + utc_offset
+    hours = np.bincount((local // 3600) % 24, minlength=24)
+    weekdays = np.bincount((local // 86400 + 3) % 7, minlength=7)  # 1970-01-01 — четверг
+
+    reply_latency = {}
+    if len(latency):
+        median, p90 = np.percentile(latency, [50, 90])
+        answers = np.bincount(responder, minlength=len(senders))
+        reply_latency = {
+            "count": int(len(latency)),
+            "median_s": float(median),
+            "p90_s": float(p90),
+            "by_participant": [
+                {"from_id": int(senders[k]), "median_s": float(np.median(latency[responder == k])),
+                 "count": int(answers[k])}
+                for k in np.argsort(-answers, kind="stable")[:top] if answers[k]
+            ],
+        }
+
+    return {
+        "dialogs": len(dialogs),
+        "messages": int(len(date)),
+        "first_date": int(date.min()),
+        "last_date": int(date.max()),
+        "participants": int(len(senders)),
+        "by_participant": [
+            {"from_id": int(senders[k]), "messages": int(messages[k]), "chars": int(chars[k])}
+            for k in leaders
+        ],
+        "mean_text_len": float(text_len.mean()),
+        "by_hour": hours.tolist(),
+        "by_weekday": weekdays.tolist(),
+        "reply_share": float(has_reply.mean()),
+        "reply_latency": reply_latency,
+        "attachments": {
+            kind: count
+            for kind, bit in ATTACHMENT_BITS.items()
+            if (count := int(np.count_nonzero(attachments & bit)))
+        },
+    }
+
+
+def save_stats(path: str, stats: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,62 @@
+"""Конфигурация приложения и разбор access token."""
+
+import json
+import os
+from urllib.parse import parse_qs
+
+CONFIG_FILE = "config.json"
+
+
+def extract_token(text: str) -> str | None:
+    """
+    Принимает либо чистый токен, либо полную ссылку из адресной строки.
+    Поддерживает формат vkhost и OAuth-ссылок с access_token в фрагменте.
+    """
+    t = text.strip()
+
+    # Если похоже на "vk1.a.XXXX" — сразу возвращаем
+    if "access_token=" not in t and "vk1.a." in t:
+        return t
+
+    # access_token может быть в части после '#'
+    if "access_token=" in t:
+        parts = t.split("#", 1)
+        if len(parts) == 2:
+            fragment = parts[1]
+        else:
+            fragment = t.split("?", 1)[-1]
+
+        parsed = parse_qs(fragment, keep_blank_values=True)
+        token_list = parsed.get("access_token")
+        if token_list and token_list[0]:
+            return token_list[0]
+
+        start = t.find("access_token=")
+        if start != -1:
+            start += len("access_token=")
+            end = t.find("&", start)
+            if end == -1:
+                return t[start:]
+            return t[start:end]
+
+    return None
+
+
+def load_config() -> dict:
+    """Загружает конфигурацию из файла."""
+    if os.path.exists(CONFIG_FILE):
+        try:
+            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except:
+            pass
+    return {}
+
+
+def save_config(config: dict):
+    """Сохраняет конфигурацию в файл."""
+    try:
+        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"Не удалось сохранить конфиг: {e}")
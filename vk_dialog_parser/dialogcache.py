@@ -0,0 +1,80 @@
+"""Список диалогов на диске и его быстрое обновление."""
+
+import hashlib
+import json
+import os
+
+from .dialogs import CONVERSATIONS_PAGE_SIZE, iter_dialog_pages
+
+DIALOG_CACHE_FILE = "dialogs_cache.json"
+
+# Сколько неизменившихся диалогов подряд означают, что дальше новых нет
+# (запас на закреплённые беседы, которые идут вне порядка дат)
+UNCHANGED_STREAK = 3
+
+
+def account_key(token: str) -> str:
+    """Ключ аккаунта для кеша — хеш токена, сам токен в файл не пишется."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+def load_dialog_cache(token: str, path: str = DIALOG_CACHE_FILE) -> list[dict]:
+    """Сохранённый список диалогов этого токена (пустой, если его нет)."""
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return data.get("accounts", {}).get(account_key(token), [])
+
+
+def save_dialog_cache(token: str, dialogs: list[dict], path: str = DIALOG_CACHE_FILE):
+    """Атомарно сохраняет список диалогов токена, не трогая списки других аккаунтов."""
+    data = {"accounts": {}}
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            pass
+    data.setdefault("accounts", {})[account_key(token)] = dialogs
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def refresh_dialogs(vk, names, cached: list[dict], count: int = CONVERSATIONS_PAGE_SIZE,
+                    on_page=None) -> tuple[list[dict], int]:
+    """
+    Обновляет сохранённый список; возвращает (список, сколько диалогов изменилось).
+
+    getConversations отдаёт диалоги от последнего сообщения к старым, поэтому
+    листать нужно только до диалогов, у которых id последнего сообщения тот
+    же, что в кеше: всё, что ниже, тоже не менялось. Обычно это одна страница
+    вместо всего списка. Без кеша загружается весь список.
+    on_page(dialogs) вызывается после каждой загруженной страницы.
+    """
+    known = {d["peer_id"]: d.get("last_message_id") for d in cached}
+    fresh = []
+    streak = 0
+    stopped = False
+    for page in iter_dialog_pages(vk, names, count):
+        for dialog in page:
+            unchanged = dialog["last_message_id"] and known.get(dialog["peer_id"]) == dialog["last_message_id"]
+            streak = streak + 1 if unchanged else 0
+            stopped = stopped or streak >= UNCHANGED_STREAK
+        fresh.extend(page)
+        if on_page is not None:
+            on_page(page)
+        if cached and stopped:
+            break
+
+    changed = sum(1 for d in fresh if known.get(d["peer_id"]) != d["last_message_id"])
+    if not (cached and stopped):
+        return fresh, changed
+
+    fresh_ids = {d["peer_id"] for d in fresh}
+    return fresh + [d for d in cached if d["peer_id"] not in fresh_ids], changed
@@ -0,0 +1,87 @@
+"""Загрузка списка диалогов (messages.getConversations)."""
+
+from .names import CHAT_PEER_OFFSET
+
+CONVERSATIONS_PAGE_SIZE = 200
+
+DIALOG_TYPES = {
+    "user": "ЛС",
+    "chat": "Беседа",
+    "group": "Группа",
+}
+
+
+def dialog_label(dialog: dict) -> str:
+    """Подпись диалога в списке: тип, имя, ID и начало последнего сообщения."""
+    label_text = f"[{dialog['dialog_type']}] {dialog['display_name']} (ID: {dialog['peer_id']})"
+    if dialog["last_text"]:
+        label_text += f" - \"{dialog['last_text']}...\""
+    return label_text
+
+
+def make_dialog(item: dict, names) -> dict:
+    """Строит описание диалога из элемента ответа getConversations."""
+    conversation = item.get("conversation", {})
+    peer = conversation.get("peer", {})
+    peer_id = peer.get("id")
+    peer_type = peer.get("type")
+
+    last_message = item.get("last_message", {})
+
+    if peer_type in DIALOG_TYPES:
+        display_name = names.name(peer_id)
+        dialog_type = DIALOG_TYPES[peer_type]
+    else:
+        display_name = f"peer_id {peer_id}"
+        dialog_type = "Неизвестно"
+
+    return {
+        "peer_id": peer_id,
+        "peer_type": peer_type,
+        "display_name": display_name,
+        "dialog_type": dialog_type,
+        "last_text": last_message.get("text", "")[:50],
+        "last_date": last_message.get("date", 0),
+        "last_message_id": last_message.get("id") or conversation.get("last_message_id", 0),
+    }
+
+
+def dialog_for_peer(peer_id: int, names) -> dict:
+    """Описание диалога по одному peer_id (без запроса списка диалогов)."""
+    if peer_id > CHAT_PEER_OFFSET:
+        peer_type = "chat"
+    elif peer_id < 0:
+        peer_type = "group"
+    else:
+        peer_type = "user"
+    return {
+        "peer_id": peer_id,
+        "peer_type": peer_type,
+        "display_name": names.name(peer_id),
+        "dialog_type": DIALOG_TYPES[peer_type],
+        "last_text": "",
+        "last_date": 0,
+        "last_message_id": 0,
+    }
+
+
+def iter_dialog_pages(vk, names, count: int = CONVERSATIONS_PAGE_SIZE):
+    """Отдаёт список диалогов постранично (по count за запрос)."""
+    offset = 0
+    while True:
+        response = vk.messages.getConversations(offset=offset, count=count, extended=1)
+        items = response.get("items", [])
+
+        if not items:
+            break
+
+        # Имена собеседников приходят вместе со страницей (extended=1),
+        # недостающие догружаются одним пакетным запросом
+        conversations = [item.get("conversation", {}) for item in items]
+        names.add_profiles(response.get("profiles"), response.get("groups"))
+        names.add_conversations(conversations)
+        names.resolve(c.get("peer", {}).get("id") for c in conversations)
+
+        yield [make_dialog(item, names) for item in items]
+
+        offset += count
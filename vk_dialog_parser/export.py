@@ -0,0 +1,178 @@
+"""Экспорт одного диалога в файл (Markdown, JSONL, CSV или HTML)."""
+
+import os
+from datetime import datetime
+
+from .capture import PageCapture
+from .checkpoint import load_checkpoint, save_checkpoint
+from .formats import DEFAULT_FORMAT, get_renderer
+from .history import iter_history_pages, iter_history_range, iter_new_history_pages, iter_new_history_until
+from .metrics import Metrics
+from .names import CHAT_PEER_OFFSET
+from .output import DEFAULT_SHARD_SIZE, FileOutput, ShardedOutput, checkpoint_matches, shard_spec
+from .pipeline import prefetch_pages
+
+EXPORT_DIR = "exported_dialogs"
+
+
+def ensure_dir(path: str):
+    """Создание папки, если её нет."""
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+
+def sanitize(name: str) -> str:
+    """Убираем запрещённые символы Windows из имени файла."""
+    bad = '<>:"/\\|?*'
+    for ch in bad:
+        name = name.replace(ch, "_")
+    return name.strip()
+
+
+def range_suffix(date_from: int | None = None, date_to: int | None = None) -> str:
+    """Часть имени файла для выгрузки за период: _from2024-01-01_to2024-01-31 (to — включительно)."""
+    suffix = ""
+    if date_from is not None:
+        suffix += "_from" + datetime.fromtimestamp(date_from).strftime("%Y-%m-%d")
+    if date_to is not None:
+        suffix += "_to" + datetime.fromtimestamp(date_to - 1).strftime("%Y-%m-%d")
+    return suffix
+
+
+def dialog_filepath(export_dir: str, dialog: dict, fmt: str = DEFAULT_FORMAT,
+                    date_from: int | None = None, date_to: int | None = None, sharded: bool = False) -> str:
+    """
+    Путь к файлу диалога: {имя}_id{peer_id}.md (расширение — по формату,
+    суффикс — по периоду). Для шардированного экспорта — папка без расширения.
+    """
+    safe_name = sanitize(dialog["display_name"])
+    base = f"{safe_name}_id{dialog['peer_id']}{range_suffix(date_from, date_to)}"
+    if sharded:
+        return os.path.join(export_dir, base)
+    return os.path.join(export_dir, base + get_renderer(fmt).extension)
+
+
+def export_dialog(vk, names, peer_id: int, filepath: str, display_name: str, dialog_type: str,
+                  batched: bool = True, incremental: bool = True, should_stop=None, archive=None,
+                  on_page=None, fmt: str = DEFAULT_FORMAT, media=None, metrics: Metrics | None = None,
+                  date_from: int | None = None, date_to: int | None = None,
+                  shard: str | None = None, shard_size: int = DEFAULT_SHARD_SIZE, capture: bool = False,
+                  columns: bool = False) -> int:
+    """
+    Экспортирует один диалог в файл формата fmt; возвращает число записанных сообщений.
+
+    После каждой полностью записанной страницы сохраняется контрольная точка
+    (id последнего сообщения и размер файла). Если она есть и файл на месте,
+    файл обрезается до неё и дописывается только более новыми сообщениями —
+    так повторный экспорт и продолжение прерванного не качают историю заново.
+    Страницы загружаются заранее в фоновом потоке (prefetch_pages), каждая
+    записывается в файл одним вызовом; остановка происходит между страницами.
+    Если передан archive (MessageArchive), страницы сохраняются и в него.
+    on_page(message_count) вызывается после каждой записанной страницы.
+    Если передан media (AttachmentDownloader), вложения скачиваются в фоне,
+    а в файле появляются ссылки на них.
+    У каждого формата своя контрольная точка, так что один диалог можно
+    вести одновременно, например, в Markdown и JSONL.
+    В metrics записывается время стадий: ожидание страницы (wait_fetch),
+    render, write (с числом байт), archive и checkpoint.
+    Если задан период [date_from, date_to) (Unix time), выгружаются только
+    его сообщения (iter_history_range); у такой выгрузки своя контрольная
+    точка (см. checkpoint_path), и продолжение дописывает сообщения периода
+    после последнего записанного.
+    С shard="month" или "size" filepath — папка (см. dialog_filepath), в
+    которую пишутся шарды по месяцам или по shard_size байт и index.json;
+    инкрементальный запуск дописывает только последний шард.
+    С capture=True сырые страницы API дописываются в .raw/{peer_id}.jsonl.gz
+    (см. PageCapture), из которых rerender потом собирает файлы без сети;
+    выгрузка за период их не пишет.
+    С columns=True метаданные сообщений дописываются в колоночный индекс
+    .columns/{peer_id}/ (ColumnStore, нужен numpy) для команды stats;
+    выгрузка за период его тоже не пишет.
+    Перед полной выгрузкой беседы имена всех участников загружаются одним
+    запросом (NameResolver.seed_chat).
+    """
+    should_stop = should_stop or (lambda: False)
+    metrics = metrics or Metrics()
+    renderer = get_renderer(fmt)
+    spec = shard_spec(shard, shard_size)
+    export_dir = os.path.dirname(filepath) or "."
+    filename = os.path.basename(filepath)
+
+    ranged = date_from is not None or date_to is not None
+    date_range = (date_from, date_to) if ranged else None
+    checkpoint = load_checkpoint(export_dir, peer_id, fmt, date_range) if incremental else None
+    if checkpoint and not checkpoint_matches(checkpoint, export_dir, filepath, spec):
+        checkpoint = None
+
+    resume = checkpoint is not None
+    if resume:
+        # Отбрасываем недописанную страницу после последней контрольной точки
+        os.truncate(os.path.join(export_dir, checkpoint["file"]), checkpoint["offset"])
+        if ranged:
+            pages = iter_new_history_until(vk, peer_id, checkpoint["last_message_id"], date_to, batched=batched)
+        else:
+            pages = iter_new_history_pages(vk, peer_id, checkpoint["last_message_id"], batched=batched)
+    else:
+        if peer_id > CHAT_PEER_OFFSET:
+            # Участники беседы известны до первой страницы — без догрузки по отправителям
+            names.seed_chat(peer_id)
+        checkpoint = {"file": filename, "last_message_id": 0, "offset": 0, "message_count": 0}
+        if spec is not None:
+            checkpoint["shard"] = spec
+        if ranged:
+            pages = iter_history_range(vk, peer_id, date_from, date_to, batched=batched)
+        else:
+            pages = iter_history_pages(vk, peer_id, batched=batched)
+
+    header = (display_name, dialog_type, peer_id)
+    if spec is None:
+        out = FileOutput(filepath, renderer, header, checkpoint, resume, metrics)
+    else:
+        out = ShardedOutput(filepath, renderer, header, checkpoint, resume, metrics, shard, shard_size)
+    raw = None
+    if capture and not ranged:
+        raw = PageCapture(export_dir, peer_id, display_name, dialog_type, checkpoint["last_message_id"], append=resume)
+    store = None
+    if columns and not ranged:
+        from .columns import ColumnStore
+        store = ColumnStore(export_dir, peer_id, checkpoint["last_message_id"])
+
+    message_count = 0
+    try:
+        # Загрузка и разрешение имён идут в фоне, здесь — только запись
+        for response in metrics.timed_iter(prefetch_pages(pages, names, should_stop), "wait_fetch"):
+            if should_stop():
+                break
+
+            items = response["items"]
+            out.write_page(items, names, media)
+            message_count += len(items)
+
+            if archive is not None:
+                with metrics.stage("archive"):
+                    archive.add_messages(peer_id, items)
+
+            if raw is not None:
+                with metrics.stage("capture"):
+                    raw.add_page(response, names)
+
+            if store is not None:
+                with metrics.stage("columns"):
+                    store.add_page(items)
+
+            checkpoint["last_message_id"] = items[-1]["id"]
+            checkpoint["message_count"] += len(items)
+            with metrics.stage("checkpoint"):
+                save_checkpoint(export_dir, peer_id, checkpoint, fmt, date_range)
+                out.save_index()
+
+            if on_page is not None:
+                on_page(message_count)
+    finally:
+        out.close()
+        if raw is not None:
+            raw.close()
+        if store is not None:
+            store.close()
+
+    return message_count
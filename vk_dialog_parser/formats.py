@@ -0,0 +1,318 @@
+"""
+Форматы вывода экспорта: Markdown, JSON Lines, CSV и HTML.
+
+Рендерер превращает страницу сообщений в строку, которая сразу пишется в
+файл; ничего, кроме текущей страницы, в памяти не держится, так что размер
+диалога не влияет на расход памяти.
+"""
+
+import csv
+import html
+import io
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+IMAGE_TYPES = {"photo", "sticker", "graffiti"}  # встраиваются картинкой, остальное — ссылкой
+
+
+def format_timestamp(ts: int) -> str:
+    """Форматирует Unix timestamp в читаемый формат."""
+    dt = datetime.fromtimestamp(ts)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def render_header(display_name: str, dialog_type: str, peer_id: int) -> str:
+    return (
+        f"# Диалог: {display_name}\n\n"
+        f"**Тип:** {dialog_type}\n"
+        f"**Peer ID:** {peer_id}\n"
+        f"**Дата экспорта:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+        "---\n\n"
+    )
+
+
+def render_message(msg: dict, names, media=None) -> str:
+    """
+    Markdown одного сообщения (с цитатой и списком вложений).
+
+    Если передан media (AttachmentDownloader), вложения ссылаются на
+    скачанные файлы.
+    """
+    from_id = msg.get("from_id")
+    text = msg.get("text", "")
+    date = msg.get("date", 0)
+    attachments = msg.get("attachments", [])
+    reply_message = msg.get("reply_message")  # Информация об ответе
+
+    sender_name = names.name(from_id)
+    timestamp = format_timestamp(date)
+
+    parts = [f"## {sender_name}\n", f"*{timestamp}*\n\n"]
+
+    # Обработка ответа на сообщение
+    if reply_message:
+        reply_from_id = reply_message.get("from_id")
+        reply_text = reply_message.get("text", "")
+        reply_date = reply_message.get("date", 0)
+        reply_attachments = reply_message.get("attachments", [])
+
+        reply_sender_name = names.name(reply_from_id)
+        reply_timestamp = format_timestamp(reply_date)
+
+        # Форматируем цитату
+        parts.append(f"**↩️ В ответ на сообщение от {reply_sender_name}** *({reply_timestamp})*:\n")
+
+        if reply_text:
+            # Обрезаем длинный текст цитаты
+            quote_text = reply_text if len(reply_text) <= 200 else reply_text[:200] + "..."
+            # Форматируем как цитату (каждая строка с >)
+            for line in quote_text.split('\n'):
+                parts.append(f"> {line}\n")
+        else:
+            parts.append("> *(без текста)*\n")
+
+        # Если в цитируемом сообщении были вложения
+        if reply_attachments:
+            att_types = [att.get("type", "unknown") for att in reply_attachments]
+            parts.append(f"> *Вложения: {', '.join(att_types)}*\n")
+
+        parts.append("\n")
+
+    # Основной текст сообщения
+    if text:
+        parts.append(f"{text}\n\n")
+    else:
+        parts.append("*(без текста)*\n\n")
+
+    # Информация о вложениях (без скачивания)
+    if attachments:
+        parts.append("**Вложения:**\n")
+        for att in attachments:
+            att_type = att.get("type", "unknown")
+            path = media.link(att) if media is not None else None
+            if path is None:
+                parts.append(f"- {att_type}\n")
+            elif att_type in IMAGE_TYPES:
+                parts.append(f"- ![{att_type}]({path})\n")
+            else:
+                parts.append(f"- [{att_type}]({path})\n")
+        parts.append("\n")
+
+    parts.append("---\n\n")
+    return "".join(parts)
+
+
+def render_page(items: list, names, media=None) -> str:
+    """Markdown всей страницы одним буфером — для одной записи на диск."""
+    return "".join(render_message(msg, names, media) for msg in items)
+
+
+def message_record(msg: dict, names, media=None) -> dict:
+    """Плоская запись сообщения для машиночитаемых форматов."""
+    from_id = msg.get("from_id")
+    reply = msg.get("reply_message")
+    attachments = msg.get("attachments", [])
+    files = [media.link(att) for att in attachments] if media is not None else []
+    reply_to = None
+    if reply:
+        reply_to = {
+            # Глобальный id и номер в беседе — разные пространства, не смешиваем
+            "id": reply.get("id") or None,
+            "cmid": reply.get("conversation_message_id"),
+            "from_id": reply.get("from_id"),
+            "from_name": names.name(reply.get("from_id")),
+            "date": reply.get("date", 0),
+            "text": reply.get("text", ""),
+        }
+    return {
+        "id": msg.get("id"),
+        "peer_id": msg.get("peer_id"),
+        "date": msg.get("date", 0),
+        "from_id": from_id,
+        "from_name": names.name(from_id),
+        "text": msg.get("text", ""),
+        "reply_to": reply_to,
+        "attachments": [att.get("type", "unknown") for att in attachments],
+        "files": [path for path in files if path],
+        "fwd_count": len(msg.get("fwd_messages", [])),
+    }
+
+
+class Renderer(ABC):
+    """
+    Потоковый формат вывода.
+
+    header() пишется только в новый файл, page() — после каждой страницы
+    истории (media — AttachmentDownloader или None), footer() — в конце
+    каждого запуска. Контрольная точка запоминает размер файла до footer(),
+    поэтому при дописывании окончание отрезается вместе с недописанной
+    страницей и добавляется заново.
+    """
+
+    name = ""
+    extension = ""
+    newline = None  # параметр newline для open()
+
+    def header(self, display_name: str, dialog_type: str, peer_id: int) -> str:
+        return ""
+
+    @abstractmethod
+    def page(self, items: list, names, media=None) -> str:
+        """Текст страницы сообщений."""
+
+    def footer(self) -> str:
+        return ""
+
+
+class MarkdownRenderer(Renderer):
+    name = "md"
+    extension = ".md"
+
+    def header(self, display_name: str, dialog_type: str, peer_id: int) -> str:
+        return render_header(display_name, dialog_type, peer_id)
+
+    def page(self, items: list, names, media=None) -> str:
+        return render_page(items, names, media)
+
+
+class JsonLinesRenderer(Renderer):
+    """Одно сообщение — одна строка JSON (см. message_record)."""
+
+    name = "jsonl"
+    extension = ".jsonl"
+
+    def page(self, items: list, names, media=None) -> str:
+        return "".join(json.dumps(message_record(msg, names, media), ensure_ascii=False) + "\n" for msg in items)
+
+
+CSV_COLUMNS = ["id", "peer_id", "date", "datetime", "from_id", "from_name", "text",
+               "reply_to_id", "reply_to_cmid", "reply_to_from_id", "attachments", "files", "fwd_count"]
+
+
+class CsvRenderer(Renderer):
+    """CSV с заголовком; вложения и пути к скачанным файлам — через запятую."""
+
+    name = "csv"
+    extension = ".csv"
+    newline = ""  # переводы строк расставляет модуль csv
+
+    def _rows(self, rows) -> str:
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue()
+
+    def header(self, display_name: str, dialog_type: str, peer_id: int) -> str:
+        return self._rows([CSV_COLUMNS])
+
+    def page(self, items: list, names, media=None) -> str:
+        rows = []
+        for msg in items:
+            record = message_record(msg, names, media)
+            reply = record["reply_to"] or {}
+            rows.append([
+                record["id"],
+                record["peer_id"],
+                record["date"],
+                format_timestamp(record["date"]),
+                record["from_id"],
+                record["from_name"],
+                record["text"],
+                reply.get("id") or "",
+                reply.get("cmid") or "",
+                reply.get("from_id", ""),
+                ",".join(record["attachments"]),
+                ",".join(record["files"]),
+                record["fwd_count"],
+            ])
+        return self._rows(rows)
+
+
+HTML_STYLE = """
+body { font-family: sans-serif; max-width: 820px; margin: 2em auto; color: #222; }
+.msg { border-bottom: 1px solid #ddd; padding: 0.6em 0; }
+.from { font-weight: bold; }
+.date { color: #888; font-size: 0.85em; margin-left: 0.5em; }
+.text { white-space: pre-wrap; margin-top: 0.3em; }
+.empty { color: #888; font-style: italic; }
+blockquote { border-left: 3px solid #aac; margin: 0.4em 0; padding-left: 0.6em; color: #555; }
+.att { color: #555; font-size: 0.9em; }
+.att img { max-width: 320px; max-height: 320px; display: block; margin-top: 0.3em; }
+"""
+
+
+class HtmlRenderer(Renderer):
+    """Один самодостаточный HTML-файл со встроенными стилями."""
+
+    name = "html"
+    extension = ".html"
+
+    def header(self, display_name: str, dialog_type: str, peer_id: int) -> str:
+        title = html.escape(display_name)
+        return (
+            "<!DOCTYPE html>\n<html lang=\"ru\">\n<head>\n<meta charset=\"utf-8\">\n"
+            f"<title>Диалог: {title}</title>\n<style>{HTML_STYLE}</style>\n</head>\n<body>\n"
+            f"<h1>Диалог: {title}</h1>\n"
+            f"<p><b>Тип:</b> {html.escape(dialog_type)}<br>\n"
+            f"<b>Peer ID:</b> {peer_id}<br>\n"
+            f"<b>Дата экспорта:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>\n<hr>\n"
+        )
+
+    def _message(self, msg: dict, names, media=None) -> str:
+        parts = [
+            '<div class="msg">',
+            f'<span class="from">{html.escape(names.name(msg.get("from_id")))}</span>'
+            f'<span class="date">{format_timestamp(msg.get("date", 0))}</span>',
+        ]
+
+        reply = msg.get("reply_message")
+        if reply:
+            reply_text = reply.get("text", "")
+            quote = reply_text if len(reply_text) <= 200 else reply_text[:200] + "..."
+            parts.append(
+                f"<blockquote>↩️ {html.escape(names.name(reply.get('from_id')))}"
+                f" ({format_timestamp(reply.get('date', 0))}):<br>"
+                + (html.escape(quote) if quote else '<span class="empty">(без текста)</span>')
+                + "</blockquote>"
+            )
+
+        text = msg.get("text", "")
+        if text:
+            parts.append(f'<div class="text">{html.escape(text)}</div>')
+        else:
+            parts.append('<div class="text empty">(без текста)</div>')
+
+        attachments = msg.get("attachments", [])
+        if attachments:
+            links = []
+            for att in attachments:
+                att_type = html.escape(att.get("type", "unknown"))
+                path = media.link(att) if media is not None else None
+                if path is None:
+                    links.append(att_type)
+                elif att.get("type") in IMAGE_TYPES:
+                    links.append(f'<a href="{html.escape(path)}"><img src="{html.escape(path)}" alt="{att_type}"></a>')
+                else:
+                    links.append(f'<a href="{html.escape(path)}">{att_type}</a>')
+            parts.append(f'<div class="att">Вложения: {", ".join(links)}</div>')
+
+        parts.append("</div>\n")
+        return "".join(parts)
+
+    def page(self, items: list, names, media=None) -> str:
+        return "".join(self._message(msg, names, media) for msg in items)
+
+    def footer(self) -> str:
+        return "</body>\n</html>\n"
+
+
+RENDERERS = {r.name: r for r in (MarkdownRenderer(), JsonLinesRenderer(), CsvRenderer(), HtmlRenderer())}
+FORMATS = tuple(RENDERERS)
+DEFAULT_FORMAT = "md"
+
+
+def get_renderer(fmt: str) -> Renderer:
+    try:
+        return RENDERERS[fmt]
+    except KeyError:
+        raise ValueError(f"Неизвестный формат: {fmt} (доступны: {', '.join(FORMATS)})") from None
@@ -0,0 +1,225 @@
+"""Постраничная загрузка истории сообщений (в том числе через execute)."""
+
+import json
+
+HISTORY_PAGE_SIZE = 200  # максимум messages.getHistory за один вызов
+EXECUTE_MAX_CALLS = 25  # максимум вызовов API внутри одного execute
+
+RESPONSE_TOO_BIG_CODE = 13  # execute: ответ или код VKScript слишком большой
+
+# VKScript: до max_calls вызовов getHistory подряд, остановка на неполной странице
+EXECUTE_HISTORY_CODE = """
+var params = %(params)s;
+var offset = %(offset)d;
+var pages = [];
+var i = 0;
+while (i < %(max_calls)d) {
+    params.offset = offset + i * %(count)d;
+    var page = API.messages.getHistory(params);
+    pages.push(page);
+    if (page.items.length < %(count)d) {
+        i = %(max_calls)d;
+    }
+    i = i + 1;
+}
+return pages;
+"""
+
+
+def build_history_code(params: dict, offset: int, max_calls: int, count: int = HISTORY_PAGE_SIZE) -> str:
+    """Собирает VKScript для пакетной загрузки max_calls страниц истории."""
+    params = dict(params, count=count)
+    return EXECUTE_HISTORY_CODE % {
+        "params": json.dumps(params, ensure_ascii=False),
+        "offset": offset,
+        "max_calls": max_calls,
+        "count": count,
+    }
+
+
+def iter_history_pages(vk, peer_id: int, offset: int = 0, batched: bool = True,
+                       max_calls: int = EXECUTE_MAX_CALLS, **params):
+    """
+    Отдаёт ответы messages.getHistory (rev=1, extended=1) по порядку.
+
+    В пакетном режиме один запрос execute приносит до max_calls страниц,
+    т.е. до 5000 сообщений. Если VK отвечает, что ответ слишком большой,
+    число вызовов в пакете уменьшается вдвое.
+    """
+    params = dict(params, peer_id=peer_id, rev=1, extended=1)
+    count = HISTORY_PAGE_SIZE
+
+    while True:
+        if batched and max_calls > 1:
+            try:
+                pages = vk.execute(code=build_history_code(params, offset, max_calls, count))
+            except Exception as e:
+                if getattr(e, "code", None) == RESPONSE_TOO_BIG_CODE:
+                    max_calls //= 2
+                    continue
+                raise
+        else:
+            pages = [vk.messages.getHistory(offset=offset, count=count, **params)]
+
+        for page in pages:
+            # Упавший внутри execute вызов возвращается как false
+            if not page:
+                raise RuntimeError(f"execute: не удалось получить страницу истории (offset={offset})")
+
+            items = page.get("items", [])
+            if not items:
+                return
+
+            yield page
+            offset += len(items)
+
+            if len(items) < count:
+                return
+
+
+# VKScript: цепочка getHistory от start_message_id к более новым сообщениям
+EXECUTE_NEW_HISTORY_CODE = """
+var params = %(params)s;
+var start = %(start)d;
+var pages = [];
+var i = 0;
+while (i < %(max_calls)d) {
+    params.start_message_id = start;
+    var page = API.messages.getHistory(params);
+    pages.push(page);
+    var ids = page.items@.id;
+    var newest = start;
+    if (ids.length > 0) {
+        newest = ids[0];
+        if (ids[ids.length - 1] > newest) {
+            newest = ids[ids.length - 1];
+        }
+    }
+    if (newest <= start || ids.length < %(count)d) {
+        i = %(max_calls)d;
+    }
+    start = newest;
+    i = i + 1;
+}
+return pages;
+"""
+
+
+def build_new_history_code(params: dict, start_message_id: int, max_calls: int,
+                           count: int = HISTORY_PAGE_SIZE) -> str:
+    """Собирает VKScript для загрузки сообщений новее start_message_id."""
+    params = dict(params, offset=-count, count=count)
+    return EXECUTE_NEW_HISTORY_CODE % {
+        "params": json.dumps(params, ensure_ascii=False),
+        "start": start_message_id,
+        "max_calls": max_calls,
+        "count": count,
+    }
+
+
+def iter_new_history_pages(vk, peer_id: int, start_message_id: int, batched: bool = True,
+                           max_calls: int = EXECUTE_MAX_CALLS, **params):
+    """
+    Отдаёт страницы сообщений новее start_message_id в хронологическом порядке.
+
+    Использует start_message_id с отрицательным offset: каждый вызов
+    возвращает до 200 сообщений, следующих за последним полученным.
+    Элементы страниц отфильтрованы (id > уже полученного) и отсортированы.
+    """
+    params = dict(params, peer_id=peer_id, extended=1)
+    count = HISTORY_PAGE_SIZE
+    last_id = start_message_id
+
+    while True:
+        if batched and max_calls > 1:
+            try:
+                pages = vk.execute(code=build_new_history_code(params, last_id, max_calls, count))
+            except Exception as e:
+                if getattr(e, "code", None) == RESPONSE_TOO_BIG_CODE:
+                    max_calls //= 2
+                    continue
+                raise
+        else:
+            pages = [vk.messages.getHistory(start_message_id=last_id, offset=-count, count=count, **params)]
+
+        for page in pages:
+            if not page:
+                raise RuntimeError(f"execute: не удалось получить страницу истории (после id={last_id})")
+
+            raw_items = page.get("items", [])
+            items = sorted((m for m in raw_items if m["id"] > last_id), key=lambda m: m["id"])
+            if not items:
+                return
+
+            yield dict(page, items=items)
+            last_id = items[-1]["id"]
+
+            if len(raw_items) < count:
+                return
+
+
+def find_date_offset(vk, peer_id: int, timestamp: int, total: int) -> int:
+    """
+    Смещение (в порядке rev=1, от старых к новым) первого сообщения с
+    date >= timestamp; total, если таких нет.
+
+    Бинарный поиск: каждая проба — getHistory с count=1, всего около
+    log2(total) запросов (17 на 100 000 сообщений).
+    """
+    lo, hi = 0, total
+    while lo < hi:
+        mid = (lo + hi) // 2
+        items = vk.messages.getHistory(peer_id=peer_id, offset=mid, count=1, rev=1).get("items", [])
+        if not items:
+            # История стала короче, чем при первом запросе
+            hi = mid
+        elif items[0]["date"] < timestamp:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def iter_history_range(vk, peer_id: int, date_from: int | None = None, date_to: int | None = None,
+                       batched: bool = True):
+    """
+    Страницы истории только за период [date_from, date_to) в хронологическом порядке.
+
+    Границы находятся бинарным поиском (find_date_offset), после чего
+    загружаются только страницы внутри окна; execute не запрашивает
+    больше страниц, чем в окне помещается.
+    """
+    probe = vk.messages.getHistory(peer_id=peer_id, count=1, rev=1)
+    total = probe.get("count", 0)
+    start = find_date_offset(vk, peer_id, date_from, total) if date_from is not None else 0
+    end = find_date_offset(vk, peer_id, date_to, total) if date_to is not None else total
+
+    remaining = end - start
+    if remaining <= 0:
+        return
+
+    max_calls = min(EXECUTE_MAX_CALLS, -(-remaining // HISTORY_PAGE_SIZE))
+    for page in iter_history_pages(vk, peer_id, offset=start, batched=batched, max_calls=max_calls):
+        raw_items = page["items"][:remaining]
+        remaining -= len(raw_items)
+        # Фильтр по дате страхует от сдвига смещений, если сообщения удаляли
+        items = [m for m in raw_items
+                 if (date_from is None or m["date"] >= date_from) and (date_to is None or m["date"] < date_to)]
+        if items:
+            yield dict(page, items=items)
+        if remaining <= 0:
+            return
+
+
+def iter_new_history_until(vk, peer_id: int, start_message_id: int, date_to: int | None = None,
+                           batched: bool = True):
+    """
+    Страницы новее start_message_id только с сообщениями до date_to —
+    продолжение выгрузки за период с последнего записанного сообщения.
+    """
+    for page in iter_new_history_pages(vk, peer_id, start_message_id, batched=batched):
+        items = page["items"] if date_to is None else [m for m in page["items"] if m["date"] < date_to]
+        if items:
+            yield dict(page, items=items)
+        if len(items) < len(page["items"]):
+            return
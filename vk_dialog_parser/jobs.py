@@ -0,0 +1,358 @@
+"""Постоянная очередь заданий экспорта (SQLite) и пул, который её выполняет."""
+
+import json
+import sqlite3
+import threading
+import time
+
+JOBS_FILE = "export_jobs.sqlite3"
+
+PENDING = "pending"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+FAILED = "failed"
+STATES = (PENDING, RUNNING, PAUSED, DONE, FAILED)
+ACTIVE_STATES = (PENDING, RUNNING, PAUSED)
+
+DEFAULT_WORKERS = 2
+MAX_ATTEMPTS = 5
+RETRY_BASE = 30.0  # секунд до первого повтора, дальше вдвое больше
+RETRY_MAX = 30 * 60.0
+IDLE_WAIT = 60.0  # как долго спит свободный поток, если его не будят
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    peer_id INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    dialog TEXT NOT NULL,
+    options TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    runs INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    messages INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (account, state, priority, id);
+CREATE INDEX IF NOT EXISTS jobs_peer ON jobs (account, state, peer_id);
+"""
+
+COLUMNS = ("id", "account", "peer_id", "target", "dialog", "options", "priority", "state", "attempts", "runs",
+           "not_before", "messages", "error", "created", "updated")
+
+
+def retry_delay(attempts: int) -> float:
+    """Пауза перед повтором после attempts неудачных запусков."""
+    return min(RETRY_BASE * (2 ** (attempts - 1)), RETRY_MAX)
+
+
+class JobQueue:
+    """
+    Очередь заданий «выгрузить диалог» с приоритетами и состояниями
+    pending / running / paused / done / failed.
+
+    Хранится в SQLite, поэтому переживает перезапуск: задания, которые
+    выполнялись в момент закрытия, recover() возвращает в pending, а сам
+    экспорт продолжается с контрольной точки — с последней записанной
+    страницы. target — путь к файлу (или папке шардов) задания: пока
+    задание с тем же target не завершено, второе не создаётся. Задания
+    одного диалога (например, в разных форматах) не выполняются
+    одновременно — у них общие .raw, .columns и архив, — так что два
+    потока никогда не пишут одни файлы.
+    """
+
+    def __init__(self, path: str = JOBS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _job(self, row) -> dict:
+        job = dict(zip(COLUMNS, row))
+        job["dialog"] = json.loads(job["dialog"])
+        job["options"] = json.loads(job["options"])
+        return job
+
+    def _where(self, account: str, states, job_ids=None) -> tuple[str, list]:
+        sql = f"account = ? AND state IN ({','.join('?' * len(states))})"
+        params = [account, *states]
+        if job_ids is not None:
+            job_ids = list(job_ids)
+            sql += f" AND id IN ({','.join('?' * len(job_ids))})"
+            params.extend(job_ids)
+        return sql, params
+
+    def add(self, account: str, dialog: dict, options: dict, target: str, priority: int = 0) -> int:
+        """
+        Ставит диалог в очередь; возвращает id задания. Если незавершённое
+        задание с тем же target уже есть, у него только меняется приоритет.
+        """
+        now = time.time()
+        where, params = self._where(account, ACTIVE_STATES)
+        with self._lock, self._conn:
+            row = self._conn.execute(f"SELECT id FROM jobs WHERE target = ? AND {where}", (target, *params)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE jobs SET priority = ?, updated = ? WHERE id = ?", (priority, now, row[0]))
+                return row[0]
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (account, peer_id, target, dialog, options, priority, state, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (account, dialog["peer_id"], target, json.dumps(dialog, ensure_ascii=False), json.dumps(options), priority,
+                 PENDING, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self, account: str) -> dict | None:
+        """
+        Берёт в работу задание с наибольшим приоритетом (из равных — самое
+        старое), пропуская диалоги, по которым задание уже выполняется.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE account = ? AND state = ? AND not_before <= ?"
+                " AND peer_id NOT IN (SELECT peer_id FROM jobs WHERE account = ? AND state = ?)"
+                " ORDER BY priority DESC, id LIMIT 1",
+                (account, PENDING, now, account, RUNNING),
+            ).fetchone()
+            if row is None:
+                return None
+            job = self._job(row)
+            self._conn.execute("UPDATE jobs SET state = ?, runs = runs + 1, updated = ? WHERE id = ?",
+                               (RUNNING, now, job["id"]))
+        job.update(state=RUNNING, runs=job["runs"] + 1)
+        return job
+
+    def finish(self, job_id: int, messages: int):
+        self._set(job_id, DONE, messages, attempts=0, error=None)
+
+    def release(self, job_id: int, state: str, messages: int):
+        """Возвращает прерванное задание в pending или paused; записанное не теряется."""
+        self._set(job_id, state, messages)
+
+    def fail(self, job_id: int, error: str, messages: int = 0) -> float | None:
+        """
+        Отмечает неудачный запуск. Пока попыток меньше MAX_ATTEMPTS, задание
+        возвращается в очередь с паузой retry_delay; возвращает её (или None,
+        если задание окончательно failed).
+        """
+        with self._lock, self._conn:
+            (attempts,) = self._conn.execute("SELECT attempts + 1 FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if attempts >= MAX_ATTEMPTS:
+            self._set(job_id, FAILED, messages, attempts=attempts, error=error)
+            return None
+        delay = retry_delay(attempts)
+        self._set(job_id, PENDING, messages, attempts=attempts, error=error, not_before=time.time() + delay)
+        return delay
+
+    def _set(self, job_id: int, state: str, messages: int, **fields):
+        fields.update(state=state, updated=time.time())
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments}, messages = messages + ? WHERE id = ?",
+                               (*fields.values(), messages, job_id))
+
+    def _move(self, account: str, states, state: str, job_ids=None, **fields) -> int:
+        fields.update(state=state, updated=time.time())
+        where, params = self._where(account, states, job_ids)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE {where}",
+                (*fields.values(), *params),
+            )
+        return cursor.rowcount
+
+    def pause(self, account: str, job_ids=None) -> int:
+        """Ожидающие задания → paused (выполняющиеся останавливает JobScheduler)."""
+        return self._move(account, (PENDING,), PAUSED, job_ids)
+
+    def resume(self, account: str, job_ids=None) -> int:
+        """paused и failed → pending; у failed попытки считаются заново."""
+        resumed = self._move(account, (PAUSED,), PENDING, job_ids)
+        return resumed + self._move(account, (FAILED,), PENDING, job_ids, attempts=0, not_before=0)
+
+    def recover(self, account: str) -> int:
+        """Задания, оставшиеся running после сбоя или закрытия, снова ждут очереди."""
+        return self._move(account, (RUNNING,), PENDING)
+
+    def purge(self, account: str, states=(DONE,)) -> int:
+        where, params = self._where(account, states)
+        with self._lock, self._conn:
+            return self._conn.execute(f"DELETE FROM jobs WHERE {where}", params).rowcount
+
+    def counts(self, account: str) -> dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs WHERE account = ? GROUP BY state",
+                                      (account,)).fetchall()
+        return dict({state: 0 for state in STATES}, **dict(rows))
+
+    def jobs(self, account: str, states=STATES) -> list[dict]:
+        where, params = self._where(account, states)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE {where} ORDER BY priority DESC, id", params
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def next_due(self, account: str) -> float | None:
+        """
+        Через сколько секунд наступит срок ближайшего отложенного повтора
+        (None, если таких нет). Задания, которые ждут только освобождения
+        своего диалога, не учитываются: их будит завершение текущего.
+        """
+        now = time.time()
+        with self._lock:
+            (due,) = self._conn.execute(
+                "SELECT MIN(not_before) FROM jobs WHERE account = ? AND state = ? AND not_before > ?",
+                (account, PENDING, now),
+            ).fetchone()
+        return None if due is None else due - now
+
+
+class JobScheduler:
+    """
+    Пул потоков, разбирающий JobQueue одного аккаунта.
+
+    run_job(job, should_stop) выполняет задание и возвращает число
+    записанных сообщений; should_stop становится True, когда задание
+    ставят на паузу или пул останавливают, — экспорт завершает текущую
+    страницу и сохраняет контрольную точку, так что продолжение начнётся
+    с неё. Исключение из run_job — неудачная попытка: задание повторяется
+    с растущей паузой (JobQueue.fail). on_idle() вызывается, когда очередь
+    опустела (нет ни ожидающих, ни отложенных, ни поставленных на паузу
+    заданий) и все потоки свободны; on_change() — после каждого изменения
+    состояния заданий.
+    """
+
+    def __init__(self, queue: JobQueue, account: str, run_job, workers: int = DEFAULT_WORKERS,
+                 report=print, on_idle=None, on_change=None):
+        self.queue = queue
+        self.account = account
+        self.run_job = run_job
+        self.workers = workers
+        self.report = report
+        self.on_idle = on_idle or (lambda: None)
+        self.on_change = on_change or (lambda: None)
+        self._cond = threading.Condition()
+        self._running = {}  # job_id → задание
+        self._pausing = set()
+        self._stopping = False
+        self._busy = False
+        self._threads = []
+
+    def start(self):
+        recovered = self.queue.recover(self.account)
+        if recovered:
+            self.report(f"[INFO] Возвращено в очередь прерванных заданий: {recovered}")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"export-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.on_change()
+
+    def notify(self):
+        """Будит свободные потоки (после добавления заданий)."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def pause(self, job_ids=None):
+        """Ставит на паузу ожидающие задания и останавливает выполняющиеся после текущей страницы."""
+        # Под тем же замком, что и claim: задание не проскочит между паузой очереди и потоков
+        with self._cond:
+            self.queue.pause(self.account, job_ids)
+            running = self._running if job_ids is None else set(self._running) & set(job_ids)
+            self._pausing.update(running)
+        self.on_change()
+
+    def resume(self, job_ids=None):
+        self.queue.resume(self.account, job_ids)
+        self.on_change()
+        self.notify()
+
+    def stop(self, wait: bool = True):
+        """Останавливает пул; выполнявшиеся задания вернутся в pending и продолжатся при следующем start."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                job = self.queue.claim(self.account)
+                if job is not None:
+                    self._running[job["id"]] = job
+                    self._busy = True
+                else:
+                    idle = self._wait_for_work()
+            if job is None:
+                if idle:
+                    self.on_idle()
+                continue
+            self.on_change()
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._running.pop(job["id"], None)
+                    self._pausing.discard(job["id"])
+                    # Освободился диалог — его следующие задания можно брать
+                    self._cond.notify_all()
+                self.on_change()
+
+    def _wait_for_work(self) -> bool:
+        """
+        Вызывается под self._cond, когда брать нечего. Возвращает True, если
+        очередь только что опустела (on_idle вызывает _worker без замка);
+        иначе ждёт срока отложенного повтора или notify — завершения задания
+        (освободился диалог), добавления, продолжения, остановки.
+        """
+        # Отложенные повторы и задания на паузе — ещё не простой: отчёт
+        # подождёт, пока они не выполнятся
+        due = self.queue.next_due(self.account)
+        if (self._busy and not self._running and due is None
+                and not self.queue.counts(self.account)[PAUSED]):
+            self._busy = False
+            return True
+        self._cond.wait(IDLE_WAIT if due is None else min(due, IDLE_WAIT))
+        return False
+
+    def _run(self, job: dict):
+        job_id = job["id"]
+
+        def should_stop() -> bool:
+            return self._stopping or job_id in self._pausing
+
+        try:
+            messages = self.run_job(job, should_stop)
+        except Exception as e:
+            delay = self.queue.fail(job_id, str(e))
+            name = job["dialog"].get("display_name", job["target"])
+            if delay is None:
+                self.report(f"[ERR] {name}: {e} — попытки исчерпаны")
+            else:
+                self.report(f"[WARN] {name}: {e} — повтор через {delay:.0f} сек")
+            return
+
+        if job_id in self._pausing:
+            self.queue.release(job_id, PAUSED, messages)
+        elif self._stopping:
+            self.queue.release(job_id, PENDING, messages)
+        else:
+            self.queue.finish(job_id, messages)
@@ -0,0 +1,200 @@
+"""Счётчики запросов к API и стадий экспорта, отчёт о прогоне."""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+REPORTS_DIR = ".reports"
+
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _bucket_labels() -> list[str]:
+    return [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+
+
+class Metrics:
+    """
+    Потокобезопасные счётчики одного прогона экспорта.
+
+    Сессия API (LimitedVkApi, AsyncVkClient) записывает каждый вызов
+    метода: время, ошибку, повторы и ожидание в RateLimiter. export_dialog
+    записывает стадии: ожидание страницы, рендер, запись (с байтами),
+    архив и контрольные точки. reset() начинает новый прогон.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = datetime.now()
+            self._t0 = time.perf_counter()
+            self.calls = {}
+            self.retries = {}
+            self.sleep = {}
+            self.stages = {}
+
+    def record_call(self, method: str, seconds: float, error_code: int | None = None):
+        ms = seconds * 1000
+        bucket = next((i for i, b in enumerate(LATENCY_BUCKETS_MS) if ms <= b), len(LATENCY_BUCKETS_MS))
+        with self._lock:
+            call = self.calls.get(method)
+            if call is None:
+                call = self.calls[method] = {"count": 0, "errors": 0, "total": 0.0, "max": 0.0,
+                                             "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+            call["count"] += 1
+            call["errors"] += error_code is not None
+            call["total"] += seconds
+            call["max"] = max(call["max"], seconds)
+            call["histogram"][bucket] += 1
+
+    def record_retry(self, method: str, code, delay: float):
+        key = f"{method}:{code}"
+        with self._lock:
+            retry = self.retries.setdefault(key, {"count": 0, "delay": 0.0})
+            retry["count"] += 1
+            retry["delay"] += delay
+
+    def add_sleep(self, reason: str, seconds: float):
+        if not seconds:
+            return
+        with self._lock:
+            self.sleep[reason] = self.sleep.get(reason, 0.0) + seconds
+
+    def add_stage(self, name: str, seconds: float, nbytes: int = 0):
+        with self._lock:
+            stage = self.stages.setdefault(name, {"count": 0, "total": 0.0, "bytes": 0})
+            stage["count"] += 1
+            stage["total"] += seconds
+            stage["bytes"] += nbytes
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+
+    def timed_iter(self, iterable, name: str):
+        """Отдаёт элементы iterable, записывая ожидание каждого как стадию name."""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.add_stage(name, time.perf_counter() - started)
+            yield item
+
+    def report(self) -> dict:
+        labels = _bucket_labels()
+        with self._lock:
+            calls = {
+                method: {
+                    "count": c["count"],
+                    "errors": c["errors"],
+                    "total_s": round(c["total"], 3),
+                    "mean_ms": round(c["total"] / c["count"] * 1000, 1),
+                    "max_ms": round(c["max"] * 1000, 1),
+                    "histogram": {label: n for label, n in zip(labels, c["histogram"]) if n},
+                }
+                for method, c in sorted(self.calls.items())
+            }
+            return {
+                "started": self.started.isoformat(timespec="seconds"),
+                "wall_s": round(time.perf_counter() - self._t0, 3),
+                "api": {
+                    "calls": sum(c["count"] for c in self.calls.values()),
+                    "errors": sum(c["errors"] for c in self.calls.values()),
+                    "time_s": round(sum(c["total"] for c in self.calls.values()), 3),
+                    "methods": calls,
+                },
+                "retries": {k: {"count": r["count"], "delay_s": round(r["delay"], 3)} for k, r in self.retries.items()},
+                "sleep_s": {k: round(v, 3) for k, v in self.sleep.items()},
+                "stages": {k: {"count": s["count"], "total_s": round(s["total"], 3), "bytes": s["bytes"]}
+                           for k, s in self.stages.items()},
+            }
+
+    def summary(self) -> list[str]:
+        """Короткая сводка для лога."""
+        r = self.report()
+        api = r["api"]
+        lines = [f"Время: {r['wall_s']:.1f} сек, запросов к API: {api['calls']} "
+                 f"({api['time_s']:.1f} сек), ошибок: {api['errors']}"]
+        for method, c in sorted(api["methods"].items(), key=lambda kv: -kv[1]["total_s"]):
+            lines.append(f"  {method}: {c['count']} x {c['mean_ms']:.0f} мс (макс. {c['max_ms']:.0f} мс)")
+        if r["retries"]:
+            retries = sum(x["count"] for x in r["retries"].values())
+            lines.append(f"Повторов после ошибок: {retries}")
+        if r["sleep_s"]:
+            lines.append("Ожидание: " + ", ".join(f"{k} {v:.1f} сек" for k, v in r["sleep_s"].items()))
+        if r["stages"]:
+            parts = []
+            for name, s in r["stages"].items():
+                part = f"{name} {s['total_s']:.1f} сек"
+                if s["bytes"]:
+                    part += f" ({s['bytes'] / 1e6:.1f} МБ)"
+                parts.append(part)
+            lines.append("Стадии: " + ", ".join(parts))
+        return lines
+
+
+class Profiler:
+    """
+    cProfile для нескольких потоков: у каждого потока свой профиль,
+    при сохранении они сливаются в один файл .prof.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = []
+
+    @contextmanager
+    def thread(self):
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+: профилировщик один на интерпретатор и уже запущен
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._profiles.append(profile)
+
+    def dump(self, path: str) -> bool:
+        import pstats
+
+        with self._lock:
+            if not self._profiles:
+                return False
+            stats = pstats.Stats(self._profiles[0])
+            for profile in self._profiles[1:]:
+                stats.add(profile)
+        stats.dump_stats(path)
+        return True
+
+
+def save_report(export_dir: str, metrics: Metrics, profiler: Profiler | None = None) -> str:
+    """Пишет отчёт в {export_dir}/.reports/export-<время>.json (и .prof рядом)."""
+    reports_dir = os.path.join(export_dir, REPORTS_DIR)
+    os.makedirs(reports_dir, exist_ok=True)
+    base = os.path.join(reports_dir, f"export-{metrics.started.strftime('%Y%m%d-%H%M%S')}")
+    report = metrics.report()
+    if profiler is not None and profiler.dump(base + ".prof"):
+        report["profile"] = os.path.basename(base + ".prof")
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return base + ".json"
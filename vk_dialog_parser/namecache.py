@@ -0,0 +1,121 @@
+"""Постоянный кеш имён (пользователи, сообщества, беседы) в SQLite."""
+
+import sqlite3
+import threading
+import time
+
+NAME_CACHE_FILE = "names_cache.sqlite3"
+
+DEFAULT_TTL = 7 * 24 * 3600  # имя считается актуальным неделю
+DEFAULT_MAX_ENTRIES = 100000
+
+SQLITE_MAX_VARIABLES = 900  # запас до лимита SQLite на число параметров
+
+
+class NameCache:
+    """
+    Кеш peer_id → имя, общий для диалогов, потоков и запусков.
+
+    Записи старше ttl секунд считаются устаревшими и не отдаются.
+    Когда записей больше max_entries, удаляются давно не использованные
+    (LRU по времени последнего обращения).
+    """
+
+    def __init__(self, path: str = NAME_CACHE_FILE, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS names ("
+            " peer_id INTEGER PRIMARY KEY,"
+            " name TEXT NOT NULL,"
+            " updated REAL NOT NULL,"
+            " used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get_many(self, peer_ids) -> dict[int, str]:
+        """Возвращает актуальные имена для тех id, что есть в кеше."""
+        peer_ids = list(peer_ids)
+        now = time.time()
+        found = {}
+        with self._lock:
+            for i in range(0, len(peer_ids), SQLITE_MAX_VARIABLES):
+                chunk = peer_ids[i:i + SQLITE_MAX_VARIABLES]
+                marks = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT peer_id, name FROM names WHERE peer_id IN ({marks}) AND updated >= ?",
+                    (*chunk, now - self.ttl),
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._touch(list(found), now)
+                self._conn.commit()
+        return found
+
+    def load_all(self) -> dict[int, str]:
+        """Все актуальные записи разом — для прогрева кеша в памяти."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT peer_id, name FROM names WHERE updated >= ?",
+                (time.time() - self.ttl,),
+            ).fetchall()
+        return dict(rows)
+
+    def put_many(self, names: dict[int, str]):
+        """Сохраняет (или обновляет) имена одним пакетом."""
+        if not names:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO names (peer_id, name, updated, used) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(peer_id) DO UPDATE SET name=excluded.name,"
+                " updated=excluded.updated, used=excluded.used",
+                [(peer_id, name, now, now) for peer_id, name in names.items()],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, peer_ids):
+        """Отмечает имена использованными сейчас (для LRU), одним пакетом."""
+        peer_ids = list(peer_ids)
+        if not peer_ids:
+            return
+        with self._lock:
+            self._touch(peer_ids, time.time())
+            self._conn.commit()
+
+    def _touch(self, peer_ids: list, now: float):
+        for i in range(0, len(peer_ids), SQLITE_MAX_VARIABLES):
+            chunk = peer_ids[i:i + SQLITE_MAX_VARIABLES]
+            marks = ",".join("?" * len(chunk))
+            self._conn.execute(f"UPDATE names SET used = ? WHERE peer_id IN ({marks})", (now, *chunk))
+
+    def _evict(self):
+        """Удаляет устаревшие записи и лишние по LRU."""
+        self._conn.execute("DELETE FROM names WHERE updated < ?", (time.time() - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM names").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM names WHERE peer_id IN"
+                " (SELECT peer_id FROM names ORDER BY used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+def open_name_cache(config: dict, path: str = NAME_CACHE_FILE) -> NameCache:
+    """Кеш имён рядом с config.json с TTL и размером из конфига."""
+    return NameCache(
+        path,
+        ttl=config.get("name_cache_ttl_days", DEFAULT_TTL / 86400) * 86400,
+        max_entries=config.get("name_cache_max_entries", DEFAULT_MAX_ENTRIES),
+    )
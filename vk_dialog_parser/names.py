@@ -0,0 +1,190 @@
+"""Пакетное получение имён пользователей, сообществ и бесед."""
+
+CHAT_PEER_OFFSET = 2000000000
+
+USERS_GET_LIMIT = 1000  # users.get принимает до 1000 id за раз
+GROUPS_GET_LIMIT = 500  # groups.getById принимает до 500 id за раз
+CONVERSATIONS_GET_LIMIT = 100  # messages.getConversationsById — до 100 peer_id
+
+# Участники беседы и её название — одним запросом
+CHAT_MEMBERS_CODE = """var peer_id = %d;
+return {
+    "members": API.messages.getConversationMembers({"peer_id": peer_id}),
+    "conversations": API.messages.getConversationsById({"peer_ids": peer_id})
+};"""
+
+
+def chunked(items: list, size: int):
+    """Разбивает список на части не длиннее size."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def fallback_name(peer_id: int) -> str:
+    """Имя-заглушка, если получить настоящее не удалось."""
+    if peer_id > CHAT_PEER_OFFSET:
+        return f"Беседа {peer_id - CHAT_PEER_OFFSET}"
+    if peer_id < 0:
+        return f"club{abs(peer_id)}"
+    return f"id{peer_id}"
+
+
+class NameResolver:
+    """
+    Кеш имён для peer_id / from_id.
+
+    Имена из profiles/groups ответов с extended=1 попадают в кеш бесплатно,
+    а оставшиеся неизвестные id разрешаются пачками: users.get,
+    groups.getById и messages.getConversationsById — по одному запросу
+    на пачку, а не на каждого отправителя. Если передан постоянный
+    NameCache, сначала используется он, а новые имена сохраняются в него.
+    Имена, прогретые из него заранее (warm), отмечаются в нём
+    использованными, когда resolve впервые за запуск их запрашивает, чтобы
+    вытеснение по LRU не удаляло тех, с кем переписка продолжается.
+    Ошибки запросов не прерывают экспорт: вместо имени остаётся заглушка,
+    а сообщение уходит в report (вывод CLI или лог GUI).
+    """
+
+    def __init__(self, vk, cache=None, report=print):
+        self.vk = vk
+        self.cache = cache
+        self.report = report
+        self.names: dict[int, str] = {}
+        self._touched: set[int] = set()  # id, уже отмеченные в постоянном кеше за этот запуск
+
+    def __contains__(self, peer_id: int) -> bool:
+        return peer_id in self.names
+
+    def _remember(self, found: dict[int, str]):
+        """Кладёт имена в память и новые/изменившиеся — в постоянный кеш."""
+        changed = {pid: name for pid, name in found.items() if self.names.get(pid) != name}
+        self.names.update(found)
+        if self.cache is not None and changed:
+            self.cache.put_many(changed)
+
+    def warm(self, peer_ids=None):
+        """Загружает весь постоянный кеш в память и разрешает peer_ids."""
+        if self.cache is not None:
+            for pid, name in self.cache.load_all().items():
+                self.names.setdefault(pid, name)
+        if peer_ids:
+            self.resolve(peer_ids)
+
+    def add_profiles(self, profiles: list | None = None, groups: list | None = None):
+        """Добавляет в кеш профили и сообщества из ответа с extended=1."""
+        found = {}
+        for profile in profiles or []:
+            user_id = profile["id"]
+            full_name = f"{profile.get('first_name', '')} {profile.get('last_name', '')}".strip()
+            found[user_id] = full_name or f"id{user_id}"
+
+        for group in groups or []:
+            group_id = group["id"]
+            found[-group_id] = group.get("name") or f"club{group_id}"
+
+        self._remember(found)
+
+    def add_conversations(self, conversations: list):
+        """Берёт названия бесед из объектов conversation (chat_settings)."""
+        found = {}
+        for conversation in conversations:
+            peer = conversation.get("peer", {})
+            peer_id = peer.get("id")
+            if peer.get("type") != "chat" or not peer_id:
+                continue
+            title = conversation.get("chat_settings", {}).get("title")
+            if title:
+                found[peer_id] = title
+
+        self._remember(found)
+
+    def add_page(self, response: dict):
+        """Имена всех отправителей страницы истории (и авторов цитат)."""
+        items = response.get("items", [])
+        self.add_profiles(response.get("profiles"), response.get("groups"))
+        page_ids = [msg.get("from_id") for msg in items]
+        page_ids += [msg["reply_message"].get("from_id") for msg in items if msg.get("reply_message")]
+        self.resolve(page_ids)
+
+    def seed_chat(self, peer_id: int) -> int:
+        """
+        Заранее узнаёт имена всех участников беседы и её название.
+
+        Один execute с messages.getConversationMembers (профили и сообщества
+        приходят вместе с ним) и getConversationsById вместо догрузки
+        отправителей по ходу истории. Возвращает число участников; если
+        список недоступен (например, пользователь вышел из беседы) — 0,
+        и имена разрешаются как обычно, постранично.
+        """
+        try:
+            resp = self.vk.execute(code=CHAT_MEMBERS_CODE % peer_id)
+        except Exception as e:
+            self.report(f"[WARN] Не удалось получить участников беседы {peer_id}: {e}")
+            return 0
+
+        members = resp.get("members") or {}
+        self.add_profiles(members.get("profiles"), members.get("groups"))
+        self.add_conversations((resp.get("conversations") or {}).get("items", []))
+
+        member_ids = [m.get("member_id") for m in members.get("items", []) if m.get("member_id")]
+        # Участники без профиля в ответе (удалённые) — чтобы не спрашивать о них API
+        for pid in member_ids:
+            self.names.setdefault(pid, fallback_name(pid))
+        return len(member_ids)
+
+    def resolve(self, peer_ids):
+        """Разрешает все ещё неизвестные id пакетными запросами."""
+        peer_ids = {pid for pid in peer_ids if pid}
+        missing = {pid for pid in peer_ids if pid not in self.names}
+        self._mark_used(peer_ids - missing)
+        if missing and self.cache is not None:
+            self.names.update(self.cache.get_many(missing))
+            missing = {pid for pid in missing if pid not in self.names}
+        if not missing:
+            return
+
+        user_ids = sorted(pid for pid in missing if 0 < pid < CHAT_PEER_OFFSET)
+        group_ids = sorted(-pid for pid in missing if pid < 0)
+        chat_ids = sorted(pid for pid in missing if pid > CHAT_PEER_OFFSET)
+
+        for chunk in chunked(user_ids, USERS_GET_LIMIT):
+            try:
+                profiles = self.vk.users.get(user_ids=",".join(map(str, chunk)))
+                self.add_profiles(profiles=profiles)
+            except Exception as e:
+                self.report(f"[WARN] Не удалось получить имена пользователей: {e}")
+
+        for chunk in chunked(group_ids, GROUPS_GET_LIMIT):
+            try:
+                resp = self.vk.groups.getById(group_ids=",".join(map(str, chunk)))
+                # Новые версии API возвращают {"groups": [...]}, старые — список
+                groups = resp.get("groups", []) if isinstance(resp, dict) else resp
+                self.add_profiles(groups=groups)
+            except Exception as e:
+                self.report(f"[WARN] Не удалось получить названия сообществ: {e}")
+
+        for chunk in chunked(chat_ids, CONVERSATIONS_GET_LIMIT):
+            try:
+                resp = self.vk.messages.getConversationsById(peer_ids=",".join(map(str, chunk)))
+                self.add_conversations(resp.get("items", []))
+            except Exception as e:
+                self.report(f"[WARN] Не удалось получить названия бесед: {e}")
+
+        # Чтобы не спрашивать API повторно о недоступных id
+        for pid in missing:
+            self.names.setdefault(pid, fallback_name(pid))
+
+    def _mark_used(self, peer_ids: set[int]):
+        # Имена из памяти не проходят через get_many, который обновляет used
+        if self.cache is None:
+            return
+        fresh = peer_ids - self._touched
+        if fresh:
+            self._touched |= fresh
+            self.cache.touch(fresh)
+
+    def name(self, peer_id: int) -> str:
+        """Возвращает имя из кеша, при необходимости догружая его."""
+        if peer_id not in self.names:
+            self.resolve([peer_id])
+        return self.names.get(peer_id, fallback_name(peer_id))
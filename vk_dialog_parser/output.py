@@ -0,0 +1,225 @@
+"""Куда пишутся страницы экспорта: один файл или шарды по месяцам / по размеру."""
+
+import json
+import os
+import time
+from datetime import datetime
+from itertools import groupby
+
+from .formats import format_timestamp
+
+SHARD_MODES = ("month", "size")
+DEFAULT_SHARD_SIZE = 50 * 1024 * 1024
+INDEX_FILE = "index.json"
+
+
+def index_filename(fmt: str) -> str:
+    """index.json для Markdown, index.<fmt>.json для остальных форматов (как у контрольных точек)."""
+    return INDEX_FILE if fmt == "md" else f"index.{fmt}.json"
+
+
+def shard_spec(shard: str | None, shard_size: int = DEFAULT_SHARD_SIZE) -> str | None:
+    """Режим шардирования для контрольной точки: None, "month" или "size:<байт>"."""
+    if shard is None:
+        return None
+    if shard not in SHARD_MODES:
+        raise ValueError(f"Неизвестный режим шардирования: {shard}")
+    return "month" if shard == "month" else f"size:{shard_size}"
+
+
+def parse_shard_spec(spec: str | None) -> tuple[str | None, int]:
+    """Обратное к shard_spec: (режим, размер шарда)."""
+    if not spec:
+        return None, DEFAULT_SHARD_SIZE
+    mode, _, size = spec.partition(":")
+    return mode, int(size) if size else DEFAULT_SHARD_SIZE
+
+
+def checkpoint_matches(checkpoint: dict, export_dir: str, filepath: str, spec: str | None) -> bool:
+    """Подходит ли контрольная точка к этому файлу (папке шардов) и режиму."""
+    name = os.path.basename(filepath)
+    current = checkpoint.get("file", "")
+    if checkpoint.get("shard") != spec:
+        return False
+    if spec is None:
+        ok = current == name
+    else:
+        ok = current.startswith(name + "/") and bool(checkpoint.get("shards"))
+    path = os.path.join(export_dir, current)
+    return ok and os.path.exists(path) and os.path.getsize(path) >= checkpoint.get("offset", 0)
+
+
+class _NestedMedia:
+    """Ссылки на вложения из шарда: папка media/ лежит уровнем выше."""
+
+    def __init__(self, media):
+        self.media = media
+
+    def link(self, att: dict) -> str | None:
+        path = self.media.link(att)
+        return f"../{path}" if path else None
+
+
+class _Output:
+    def __init__(self, renderer, header: tuple, checkpoint: dict, metrics):
+        self.renderer = renderer
+        self.header = header
+        self.checkpoint = checkpoint
+        self.metrics = metrics
+        self.f = None
+
+    def _open(self, path: str, mode: str):
+        self.f = open(path, mode, encoding="utf-8", newline=self.renderer.newline)
+
+    def _write(self, buf: str):
+        """Пишет буфер страницы и переносит размер файла в контрольную точку."""
+        started = time.perf_counter()
+        self.f.write(buf)
+        self.f.flush()
+        offset = self.f.tell()
+        self.metrics.add_stage("write", time.perf_counter() - started, offset - self.checkpoint["offset"])
+        self.checkpoint["offset"] = offset
+
+    def _render(self, items: list, names, media) -> str:
+        with self.metrics.stage("render"):
+            return self.renderer.page(items, names, media)
+
+    def save_index(self):
+        pass
+
+    def close(self):
+        # Окончание файла не входит в offset контрольной точки
+        if self.f is not None:
+            self.f.write(self.renderer.footer())
+            self.f.close()
+            self.f = None
+
+
+class FileOutput(_Output):
+    """Весь диалог в одном файле."""
+
+    def __init__(self, path: str, renderer, header: tuple, checkpoint: dict, resume: bool, metrics):
+        super().__init__(renderer, header, checkpoint, metrics)
+        self._open(path, "a" if resume else "w")
+        if not resume:
+            self.f.write(renderer.header(*header))
+
+    def write_page(self, items: list, names, media=None):
+        self._write(self._render(items, names, media))
+
+
+class ShardedOutput(_Output):
+    """
+    Диалог в папке: по файлу на месяц (2024-01.md) или части примерно по
+    max_bytes (part-0001.md; новая начинается со страницы, после которой
+    текущая стала не меньше max_bytes), плюс index.json со списком шардов,
+    числом сообщений и диапазоном дат.
+
+    Контрольная точка хранит список шардов и ссылается на последний из них,
+    поэтому при дописывании меняется только он: предыдущие шарды закрыты
+    (с окончанием файла) и больше не переписываются.
+    """
+
+    def __init__(self, dirpath: str, renderer, header: tuple, checkpoint: dict, resume: bool, metrics,
+                 mode: str = "month", max_bytes: int = DEFAULT_SHARD_SIZE):
+        super().__init__(renderer, header, checkpoint, metrics)
+        self.dirpath = dirpath
+        self.mode = mode
+        self.max_bytes = max_bytes
+        os.makedirs(dirpath, exist_ok=True)
+
+        if resume:
+            self._open(os.path.join(dirpath, checkpoint["shards"][-1]["file"]), "a")
+        else:
+            self._remove_old_shards()
+            checkpoint["shards"] = []
+
+    @property
+    def shards(self) -> list:
+        return self.checkpoint["shards"]
+
+    def _remove_old_shards(self):
+        """Перед полной выгрузкой удаляет шарды из прежнего index.json."""
+        index_path = os.path.join(self.dirpath, index_filename(self.renderer.name))
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                old = json.load(f).get("shards", [])
+        except (OSError, ValueError):
+            return
+        for shard in old:
+            path = os.path.join(self.dirpath, shard.get("file", ""))
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _key(self, msg: dict):
+        if self.mode == "month":
+            return datetime.fromtimestamp(msg.get("date", 0)).strftime("%Y-%m")
+        return None
+
+    def _needs_new_shard(self, key) -> bool:
+        if self.f is None:
+            return True
+        if self.mode == "month":
+            return key > self.shards[-1]["key"]
+        return self.checkpoint["offset"] >= self.max_bytes
+
+    def _start_shard(self, key):
+        _Output.close(self)
+        number = len(self.shards) + 1
+        label = key if self.mode == "month" else f"part-{number:04d}"
+        filename = label + self.renderer.extension
+
+        self._open(os.path.join(self.dirpath, filename), "w")
+        display_name, dialog_type, peer_id = self.header
+        self.f.write(self.renderer.header(f"{display_name} ({label})", dialog_type, peer_id))
+
+        self.shards.append({"file": filename, "key": key, "messages": 0,
+                            "first_id": None, "last_id": None, "first_date": None, "last_date": None})
+        self.checkpoint["file"] = f"{os.path.basename(self.dirpath)}/{filename}"
+        self.checkpoint["offset"] = 0
+
+    def write_page(self, items: list, names, media=None):
+        # Страница может пересекать границу месяца — делим её по шардам
+        for key, group in groupby(items, key=self._key):
+            group = list(group)
+            if self._needs_new_shard(key):
+                self._start_shard(key)
+            self._write(self._render(group, names, media and _NestedMedia(media)))
+
+            shard = self.shards[-1]
+            shard["messages"] += len(group)
+            if shard["first_id"] is None:
+                shard["first_id"], shard["first_date"] = group[0]["id"], group[0].get("date", 0)
+            shard["last_id"], shard["last_date"] = group[-1]["id"], group[-1].get("date", 0)
+
+    def save_index(self):
+        """Атомарно переписывает index.json (он маленький: по строке на шард)."""
+        display_name, dialog_type, peer_id = self.header
+        index = {
+            "peer_id": peer_id,
+            "display_name": display_name,
+            "dialog_type": dialog_type,
+            "format": self.renderer.name,
+            "shard": self.mode,
+            "message_count": sum(s["messages"] for s in self.shards),
+            "shards": [
+                {
+                    "file": s["file"],
+                    "messages": s["messages"],
+                    "first_id": s["first_id"],
+                    "last_id": s["last_id"],
+                    "first_date": format_timestamp(s["first_date"]) if s["first_date"] is not None else None,
+                    "last_date": format_timestamp(s["last_date"]) if s["last_date"] is not None else None,
+                }
+                for s in self.shards
+            ],
+        }
+        path = os.path.join(self.dirpath, index_filename(self.renderer.name))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        super().close()
+        self.save_index()
@@ -0,0 +1,62 @@
+"""Фоновая загрузка страниц истории через ограниченную очередь."""
+
+import queue
+import threading
+
+PREFETCH_PAGES = 4  # сколько готовых страниц может ждать записи
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def prefetch_pages(pages, names, should_stop=None, maxsize: int = PREFETCH_PAGES):
+    """
+    Загружает страницы в отдельном потоке, пока вызывающий их записывает.
+
+    Стадия загрузки выполняет запросы к API и разрешает имена отправителей
+    страницы, так что запись на диск не ждёт сеть, а сеть — диск. Очередь
+    ограничена maxsize страницами: если запись отстаёт, загрузка ждёт.
+    Ошибки загрузки пробрасываются в вызывающий поток. При выходе из цикла
+    (остановка, исключение) фоновый поток завершается после текущего запроса.
+    """
+    should_stop = should_stop or (lambda: False)
+    q = queue.Queue(maxsize)
+    cancelled = threading.Event()
+
+    def put(item):
+        while not cancelled.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        try:
+            for page in pages:
+                if cancelled.is_set() or should_stop():
+                    break
+                names.add_page(page)
+                put(page)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            put(_DONE)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        cancelled.set()
+        thread.join()
@@ -0,0 +1,77 @@
+"""Ограничитель частоты запросов к VK API (token bucket)."""
+
+import threading
+import time
+
+VK_RATE = 3.0  # VK разрешает пользовательскому токену 3 запроса в секунду
+
+
+class RateLimiter:
+    """
+    Token bucket, общий для всех потоков, работающих с одним токеном.
+
+    Токены пополняются непрерывно со скоростью rate в секунду, поэтому
+    время, которое занял сам запрос, автоматически засчитывается в паузу.
+    backoff() приостанавливает выдачу токенов для всех потоков сразу.
+    Один и тот же limiter можно использовать из потоков и из asyncio.
+    """
+
+    def __init__(self, rate: float = VK_RATE, burst: int = 1,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0):
+        self.rate = rate
+        self.burst = burst
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Забирает токен и возвращает 0 или сколько секунд ещё ждать."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            elapsed = now - self._updated
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> float:
+        """Блокирует поток, пока не освободится токен на один запрос; возвращает время ожидания."""
+        waited = 0.0
+        while True:
+            wait = self._reserve()
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self) -> float:
+        """То же для asyncio: ждёт токен, не блокируя цикл событий."""
+        import asyncio  # только для клиента на aiohttp, обычный запуск его не грузит
+
+        waited = 0.0
+        while True:
+            wait = self._reserve()
+            if not wait:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def backoff(self, attempt: int) -> float:
+        """Экспоненциальная пауза после ошибки лимита; возвращает её длину."""
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        with self._lock:
+            resume = time.monotonic() + delay
+            if resume > self._paused_until:
+                self._paused_until = resume
+                # После паузы — ровно один запрос, дальше обычный темп
+                self._tokens = 1.0
+                self._updated = resume
+        return delay
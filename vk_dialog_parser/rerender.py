@@ -0,0 +1,97 @@
+"""Повторный рендер экспорта из сырых страниц (.raw) — без токена и сети."""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import chain
+
+from .capture import CAPTURE_DIR, CapturedNames, ExistingMedia, capture_path, read_capture
+from .checkpoint import save_checkpoint
+from .export import dialog_filepath, ensure_dir
+from .formats import DEFAULT_FORMAT, get_renderer
+from .metrics import Metrics
+from .output import DEFAULT_SHARD_SIZE, FileOutput, ShardedOutput, shard_spec
+
+CAPTURE_SUFFIX = ".jsonl.gz"
+
+
+def captured_peers(src_dir: str) -> list[int]:
+    """peer_id диалогов, для которых есть сырые страницы."""
+    raw_dir = os.path.join(src_dir, CAPTURE_DIR)
+    if not os.path.isdir(raw_dir):
+        return []
+    peers = []
+    for filename in os.listdir(raw_dir):
+        if filename.endswith(CAPTURE_SUFFIX):
+            try:
+                peers.append(int(filename[:-len(CAPTURE_SUFFIX)]))
+            except ValueError:
+                continue
+    return sorted(peers)
+
+
+def rerender_peer(src_dir: str, out_dir: str, peer_id: int, fmt: str = DEFAULT_FORMAT,
+                  shard: str | None = None, shard_size: int = DEFAULT_SHARD_SIZE) -> dict:
+    """
+    Собирает файл (или шарды) диалога заново из .raw/{peer_id}.jsonl.gz.
+
+    Вложения получают ссылки, если уже скачаны в {src_dir}/media. В out_dir
+    сохраняется контрольная точка, как после обычной выгрузки, так что
+    следующий инкрементальный экспорт просто допишет новые сообщения.
+    Функция верхнего уровня — вызывается в процессах rerender_all.
+    """
+    renderer = get_renderer(fmt)
+    spec = shard_spec(shard, shard_size)
+    pages = read_capture(capture_path(src_dir, peer_id))
+    first = next(pages, None)
+    if first is None:
+        return {"peer_id": peer_id, "display_name": None, "messages": 0, "file": None}
+
+    meta = first[0]
+    display_name = meta.get("display_name") or str(peer_id)
+    dialog = {"peer_id": peer_id, "display_name": display_name}
+    filepath = dialog_filepath(out_dir, dialog, fmt, sharded=spec is not None)
+
+    checkpoint = {"file": os.path.basename(filepath), "last_message_id": 0, "offset": 0, "message_count": 0}
+    if spec is not None:
+        checkpoint["shard"] = spec
+    header = (display_name, meta.get("dialog_type", ""), peer_id)
+    metrics = Metrics()
+    if spec is None:
+        out = FileOutput(filepath, renderer, header, checkpoint, False, metrics)
+    else:
+        out = ShardedOutput(filepath, renderer, header, checkpoint, False, metrics, shard, shard_size)
+
+    names = CapturedNames()
+    media = ExistingMedia(src_dir, out_dir)
+    try:
+        for _, page, page_names in chain([first], pages):
+            items = page["items"]
+            names.names.update(page_names)
+            out.write_page(items, names, media)
+            checkpoint["last_message_id"] = items[-1]["id"]
+            checkpoint["message_count"] += len(items)
+    finally:
+        out.close()
+
+    save_checkpoint(out_dir, peer_id, checkpoint, fmt)
+    return {"peer_id": peer_id, "display_name": display_name, "messages": checkpoint["message_count"],
+            "file": filepath}
+
+
+def rerender_all(src_dir: str, out_dir: str, peer_ids: list[int] | None = None, fmt: str = DEFAULT_FORMAT,
+                 shard: str | None = None, shard_size: int = DEFAULT_SHARD_SIZE, workers: int | None = None):
+    """
+    Рендерит диалоги параллельно в пуле процессов (рендер упирается в CPU,
+    а потоки делили бы один GIL). Отдаёт (peer_id, результат или исключение)
+    по мере готовности.
+    """
+    ensure_dir(out_dir)
+    peer_ids = captured_peers(src_dir) if peer_ids is None else peer_ids
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(rerender_peer, src_dir, out_dir, peer_id, fmt, shard, shard_size): peer_id
+                   for peer_id in peer_ids}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
@@ -0,0 +1,267 @@
+"""Непрерывная синхронизация через long poll: дописывает только изменившиеся диалоги."""
+
+import json
+import os
+import time
+
+import requests
+
+from .capture import capture_path
+from .checkpoint import CHECKPOINT_DIR, list_checkpoints, load_checkpoint
+from .dialogs import dialog_for_peer
+from .export import export_dialog
+from .output import parse_shard_spec
+
+LONGPOLL_VERSION = 3
+LONGPOLL_WAIT = 25  # секунд ожидания событий на сервере long poll
+LONGPOLL_RETRY_DELAY = 5
+LONGPOLL_EVENTS_LIMIT = 1000
+LONGPOLL_MSGS_LIMIT = 1000
+# getLongPollHistory: pts слишком старый (907) или новее известного серверу (908)
+PTS_OUTDATED_CODES = (907, 908)
+SYNC_STATE_FILE = "longpoll.json"
+
+# Коды событий long poll (версия 3), после которых стоит спросить историю:
+# новое сообщение, редактирование, восстановление / изменение сообщения
+MESSAGE_EVENTS = {4, 5, 18}
+
+
+def has_columns(export_dir: str, peer_id: int) -> bool:
+    """Ведётся ли для диалога колоночный индекс (и установлен ли numpy, чтобы его дописывать)."""
+    try:
+        from .columns import columns_dir
+    except ImportError:
+        return False
+    return os.path.isdir(columns_dir(export_dir, peer_id))
+
+
+def sync_state_path(export_dir: str) -> str:
+    return os.path.join(export_dir, CHECKPOINT_DIR, SYNC_STATE_FILE)
+
+
+def load_sync_state(export_dir: str) -> dict | None:
+    """{"pts": ..., "ts": ...} последней синхронизации или None."""
+    try:
+        with open(sync_state_path(export_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_sync_state(export_dir: str, state: dict):
+    path = sync_state_path(export_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class LongPollSync:
+    """
+    Держит выгруженные диалоги в актуальном состоянии.
+
+    Вместо перебора всех диалогов хранит pts (номер последнего события
+    аккаунта) и спрашивает messages.getLongPollHistory, какие сообщения
+    появились или изменились после него: один запрос (или несколько при
+    more=1) на цикл. В файлы дописываются только диалоги с контрольными
+    точками в export_dir, в которых есть сообщения новее записанных, — по
+    запросу на диалог. В archive попадают все полученные сообщения, включая
+    отредактированные (файлы экспорта только дописываются, правки в них не
+    попадают).
+
+    Между циклами ждёт событий на сервере long poll (запрос к нему не
+    расходует лимит API) и синхронизируется только после событий о
+    сообщениях. pts сохраняется только после того, как изменения записаны,
+    поэтому цикл, прерванный ошибкой, повторится. run() переживает ошибки
+    сети и API: пишет их в report и повторяет через LONGPOLL_RETRY_DELAY.
+    Если VK больше не помнит сохранённый pts, синхронизация начинается
+    заново, как при первом запуске.
+    """
+
+    def __init__(self, vk, names, export_dir: str, archive=None, batched: bool = True, metrics=None,
+                 should_stop=None, report=print, http: requests.Session | None = None):
+        self.vk = vk
+        self.names = names
+        self.export_dir = export_dir
+        self.archive = archive
+        self.batched = batched
+        self.metrics = metrics
+        self.should_stop = should_stop or (lambda: False)
+        self.report = report
+        self.http = http or requests.Session()
+        self.server = None
+        self.state = None
+
+    def _exports(self) -> dict[int, list[str]]:
+        """peer_id → форматы, в которых диалог уже выгружен."""
+        exports = {}
+        for peer_id, fmt in list_checkpoints(self.export_dir):
+            exports.setdefault(peer_id, []).append(fmt)
+        return exports
+
+    def _connect(self) -> dict:
+        server = self.vk.messages.getLongPollServer(need_pts=1, lp_version=LONGPOLL_VERSION)
+        self.server = {"server": server["server"], "key": server["key"], "ts": server["ts"]}
+        return server
+
+    def start(self):
+        """
+        Подключается к long poll. При первом запуске запоминает текущий pts
+        и дописывает все выгруженные диалоги обычным инкрементальным
+        экспортом; при следующих — догоняет события, пропущенные, пока
+        синхронизация не работала.
+        """
+        server = self._connect()
+        self.state = load_sync_state(self.export_dir)
+        if self.state is None:
+            self.report("[INFO] Первая синхронизация")
+            self.catch_up(server)
+        else:
+            self.sync_once()
+
+    def catch_up(self, server: dict) -> int:
+        """
+        Начинает с текущего pts сервера и дописывает все выгруженные диалоги
+        обычным инкрементальным экспортом; возвращает число сообщений.
+        """
+        # pts берём до догоняющего экспорта: события во время него не потеряются
+        state = {"pts": server["pts"], "ts": server["ts"]}
+        exports = self._exports()
+        self.report(f"[INFO] Дописываю {len(exports)} выгруженных диалогов")
+        written = 0
+        for peer_id in exports:
+            if self.should_stop():
+                return written
+            written += self.export_peer(peer_id, exports[peer_id])
+        # Новый pts — только когда всё дописано; при сбое догонка повторится
+        self.state = state
+        save_sync_state(self.export_dir, state)
+        return written
+
+    def fetch_changes(self) -> tuple[dict[int, list], int]:
+        """
+        Сообщения, новые или изменённые после сохранённого pts, по диалогам,
+        и pts после них (self.state не меняется, пока изменения не записаны).
+        """
+        changed = {}
+        pts = self.state["pts"]
+        while True:
+            response = self.vk.messages.getLongPollHistory(
+                ts=self.state["ts"],
+                pts=pts,
+                lp_version=LONGPOLL_VERSION,
+                events_limit=LONGPOLL_EVENTS_LIMIT,
+                msgs_limit=LONGPOLL_MSGS_LIMIT,
+                onlines=0,
+            )
+            self.names.add_profiles(response.get("profiles"), response.get("groups"))
+            for msg in response.get("messages", {}).get("items", []):
+                changed.setdefault(msg["peer_id"], []).append(msg)
+            pts = response.get("new_pts", pts)
+            if not response.get("more"):
+                return changed, pts
+
+    def sync_once(self) -> int:
+        """Один цикл синхронизации; возвращает число дописанных в файлы сообщений."""
+        try:
+            changed, pts = self.fetch_changes()
+        except Exception as e:
+            if getattr(e, "code", None) not in PTS_OUTDATED_CODES:
+                raise
+            self.report(f"[WARN] VK не помнит сохранённый pts ({e}): синхронизирую заново")
+            return self.catch_up(self._connect())
+        exports = self._exports()
+        written = 0
+        for peer_id, messages in changed.items():
+            if self.should_stop():
+                return written
+            if self.archive is not None:
+                self.archive.add_messages(peer_id, sorted(messages, key=lambda m: m["id"]))
+            if peer_id in exports:
+                newest = max(msg["id"] for msg in messages)
+                written += self.export_peer(peer_id, exports[peer_id], newest)
+
+        self.state = {"pts": pts, "ts": self.server["ts"]}
+        save_sync_state(self.export_dir, self.state)
+        if changed:
+            self.report(f"[INFO] Синхронизация: изменились {len(changed)} диалогов, дописано сообщений: {written}")
+        return written
+
+    def export_peer(self, peer_id: int, formats: list[str], newest_id: int | None = None) -> int:
+        """Дописывает диалог во все форматы, если в нём есть сообщения новее контрольной точки."""
+        dialog = dialog_for_peer(peer_id, self.names)
+        captured = os.path.exists(capture_path(self.export_dir, peer_id))
+        indexed = has_columns(self.export_dir, peer_id)
+        written = 0
+        for fmt in formats:
+            checkpoint = load_checkpoint(self.export_dir, peer_id, fmt)
+            if checkpoint is None or (newest_id is not None and newest_id <= checkpoint["last_message_id"]):
+                continue
+            shard, shard_size = parse_shard_spec(checkpoint.get("shard"))
+            filepath = os.path.join(self.export_dir, checkpoint["file"].split("/")[0])
+            count = export_dialog(
+                self.vk,
+                self.names,
+                peer_id,
+                filepath,
+                dialog["display_name"],
+                dialog["dialog_type"],
+                batched=self.batched,
+                should_stop=self.should_stop,
+                fmt=fmt,
+                metrics=self.metrics,
+                shard=shard,
+                shard_size=shard_size,
+                # Сырые страницы пишем один раз, с первым форматом
+                capture=captured and fmt == formats[0],
+                columns=indexed and fmt == formats[0],
+            )
+            if count:
+                self.report(f"  {dialog['display_name']} ({peer_id}, {fmt}): +{count}")
+            written = max(written, count)
+        return written
+
+    def wait(self) -> bool:
+        """Ждёт событий на сервере long poll; True, если среди них есть сообщения."""
+        try:
+            resp = self.http.get(
+                f"https://{self.server['server']}",
+                params={"act": "a_check", "key": self.server["key"], "ts": self.server["ts"],
+                        "wait": LONGPOLL_WAIT, "mode": 2, "version": LONGPOLL_VERSION},
+                timeout=LONGPOLL_WAIT + 10,
+            )
+            data = resp.json()
+        except (requests.RequestException, ValueError) as e:
+            self.report(f"[WARN] Long poll недоступен: {e}")
+            time.sleep(LONGPOLL_RETRY_DELAY)
+            return False
+
+        failed = data.get("failed")
+        if failed == 1:
+            # История событий устарела — ts новый, а пропущенное догонит getLongPollHistory по pts
+            self.server["ts"] = data["ts"]
+            return True
+        if failed in (2, 3):
+            self._connect()
+            return True
+        self.server["ts"] = data.get("ts", self.server["ts"])
+        return any(update and update[0] in MESSAGE_EVENTS for update in data.get("updates", []))
+
+    def run(self):
+        """Синхронизирует до остановки (should_stop); ошибки не прерывают работу."""
+        started = False
+        pending = False  # события были, но цикл синхронизации не удался
+        while not self.should_stop():
+            try:
+                if not started:
+                    self.start()
+                    started = True
+                elif pending or self.wait():
+                    pending = True
+                    if not self.should_stop():
+                        self.sync_once()
+                    pending = False
+            except Exception as e:
+                self.report(f"[WARN] Ошибка синхронизации: {e} — повтор через {LONGPOLL_RETRY_DELAY} сек")
+                time.sleep(LONGPOLL_RETRY_DELAY)
@@ -1,153 +1,236 @@
+import importlib.util
+import logging
 import os
-import time
+import queue
 import threading
 import webbrowser
-import json
-from datetime import datetime
-from urllib.parse import parse_qs
+from contextlib import nullcontext
+from functools import partial
+from logging.handlers import RotatingFileHandler
 
-import vk_api
 import customtkinter as ctk
 
+from vk_dialog_parser.archive import ARCHIVE_FILE, MessageArchive, parse_date_range
+from vk_dialog_parser.attachments import AttachmentDownloader
+from vk_dialog_parser.config import extract_token, load_config, save_config
+from vk_dialog_parser.dialogcache import account_key, load_dialog_cache, refresh_dialogs, save_dialog_cache
+from vk_dialog_parser.dialogs import dialog_label
+from vk_dialog_parser.export import EXPORT_DIR, dialog_filepath, ensure_dir, export_dialog
+from vk_dialog_parser.formats import DEFAULT_FORMAT, FORMATS
+from vk_dialog_parser.jobs import ACTIVE_STATES, DEFAULT_WORKERS, DONE, FAILED, JOBS_FILE, JobQueue, JobScheduler
+from vk_dialog_parser.metrics import Metrics, Profiler, save_report
+from vk_dialog_parser.namecache import open_name_cache
+from vk_dialog_parser.names import NameResolver
+from vk_dialog_parser.output import DEFAULT_SHARD_SIZE
+from vk_dialog_parser.ratelimit import RateLimiter
+
 APP_NAME = "VK Dialog Parser"
 APP_VERSION = "1.0"
-CONFIG_FILE = "config.json"
 APP_AUTHOR = "abshka"
 
-DELAY = 0.34  # пауза между запросами к VK API
-
-
-def ensure_dir(path: str):
-    """Создание папки, если её нет."""
-    if not os.path.exists(path):
-        os.makedirs(path)
-
+SHARD_OPTIONS = {
+    "Один файл": None,
+    "По месяцам": "month",
+    f"По {DEFAULT_SHARD_SIZE // (1024 * 1024)} МБ": "size",
+}
 
-def sanitize(name: str) -> str:
-    """Убираем запрещённые символы Windows из имени файла."""
-    bad = '<>:"/\\|?*'
-    for ch in bad:
-        name = name.replace(ch, "_")
-    return name.strip()
+# Задания с большим приоритетом берутся из очереди раньше
+PRIORITY_OPTIONS = {
+    "Обычный": 0,
+    "Срочно": 10,
+    "Потом": -10,
+}
 
+LOG_FILE = "vk_dialog_parser.log"
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+LOG_MAX_LINES = 2000  # столько последних строк держит окно лога
+UI_POLL_MS = 200  # как часто главный поток забирает события из очереди
 
-def extract_token(text: str) -> str | None:
-    """
-    Принимает либо чистый токен, либо полную ссылку из адресной строки.
-    Поддерживает формат vkhost и OAuth-ссылок с access_token в фрагменте.
-    """
-    t = text.strip()
+logger = logging.getLogger("vk_dialog_parser")
 
-    # Если похоже на "vk1.a.XXXX" — сразу возвращаем
-    if "access_token=" not in t and "vk1.a." in t:
-        return t
 
-    # access_token может быть в части после '#'
-    if "access_token=" in t:
-        parts = t.split("#", 1)
-        if len(parts) == 2:
-            fragment = parts[1]
-        else:
-            fragment = t.split("?", 1)[-1]
+def setup_file_log(path: str = LOG_FILE):
+    """Полный лог пишется в файл с ротацией, окно показывает только хвост."""
+    handler = RotatingFileHandler(path, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
 
-        parsed = parse_qs(fragment, keep_blank_values=True)
-        token_list = parsed.get("access_token")
-        if token_list and token_list[0]:
-            return token_list[0]
 
-        start = t.find("access_token=")
-        if start != -1:
-            start += len("access_token=")
-            end = t.find("&", start)
-            if end == -1:
-                return t[start:]
-            return t[start:end]
+SORT_NEWEST = "Сначала новые"
+SORT_OLDEST = "Сначала старые"
+SORT_NAME = "По имени"
 
-    return None
 
+class DialogList(ctk.CTkFrame):
+    """
+    Виртуализированный список диалогов с фильтром и сортировкой.
 
-def load_config() -> dict:
-    """Загружает конфигурацию из файла."""
-    if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except:
-            pass
-    return {}
+    Чекбоксы создаются один раз и только для видимых строк; прокрутка и
+    фильтр лишь перепривязывают их к другим диалогам модели. Поэтому
+    заполнение и прокрутка не зависят от количества диалогов.
+    """
 
+    ROWS = 8
+
+    def __init__(self, master, on_change=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.on_change = on_change
+
+        self.dialogs = []  # модель: все загруженные диалоги
+        self.search_keys = []  # "имя тип id" в нижнем регистре для фильтра
+        self.visible = []  # индексы диалогов после фильтра и сортировки
+        self.selected = set()  # выбранные peer_id
+        self.query = ""
+        self.sort_mode = SORT_NEWEST
+        self.top = 0
+
+        self.grid_columnconfigure(0, weight=1)
+        self.rows = []
+        for i in range(self.ROWS):
+            checkbox = ctk.CTkCheckBox(self, text="", command=lambda i=i: self._toggle(i))
+            checkbox.grid(row=i, column=0, sticky="w", padx=5, pady=2)
+            self.rows.append(checkbox)
+
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, rowspan=self.ROWS, sticky="ns")
+
+        for widget in (self, *self.rows):
+            widget.bind("<MouseWheel>", self._on_wheel)
+            widget.bind("<Button-4>", lambda e: self.scroll_to(self.top - 3))
+            widget.bind("<Button-5>", lambda e: self.scroll_to(self.top + 3))
+
+        self._render()
+
+    # ----- Модель -----
+
+    def clear(self):
+        self.dialogs = []
+        self.search_keys = []
+        self.selected = set()
+        self._refilter()
+
+    def set_dialogs(self, dialogs: list):
+        """Заменяет список целиком (после обновления), сохраняя выбор."""
+        self.dialogs = list(dialogs)
+        self.search_keys = [f"{d['display_name']} {d['dialog_type']} {d['peer_id']}".lower() for d in self.dialogs]
+        self.selected &= {d["peer_id"] for d in self.dialogs}
+        self._refilter()
+
+    def add_dialogs(self, dialogs: list):
+        self.dialogs.extend(dialogs)
+        self.search_keys.extend(
+            f"{d['display_name']} {d['dialog_type']} {d['peer_id']}".lower() for d in dialogs
+        )
+        self._refilter()
+
+    def set_filter(self, query: str):
+        self.query = query.strip().lower()
+        self.top = 0
+        self._refilter()
+
+    def set_sort(self, mode: str):
+        self.sort_mode = mode
+        self._refilter()
+
+    def select_visible(self, value: bool = True):
+        """Отмечает (или снимает) все диалоги, прошедшие фильтр."""
+        peer_ids = {self.dialogs[i]["peer_id"] for i in self.visible}
+        if value:
+            self.selected |= peer_ids
+        else:
+            self.selected -= peer_ids
+        self._render()
+        self._changed()
 
-def save_config(config: dict):
-    """Сохраняет конфигурацию в файл."""
-    try:
-        with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Не удалось сохранить конфиг: {e}")
+    def get_selected(self) -> list[dict]:
+        return [d for d in self.dialogs if d["peer_id"] in self.selected]
 
+    def _refilter(self):
+        query = self.query
+        if query:
+            visible = [i for i, key in enumerate(self.search_keys) if query in key]
+        else:
+            visible = list(range(len(self.dialogs)))
 
-def format_timestamp(ts: int) -> str:
-    """Форматирует Unix timestamp в читаемый формат."""
-    dt = datetime.fromtimestamp(ts)
-    return dt.strftime("%Y-%m-%d %H:%M:%S")
+        if self.sort_mode == SORT_NAME:
+            visible.sort(key=lambda i: self.dialogs[i]["display_name"].lower())
+        else:
+            visible.sort(key=lambda i: self.dialogs[i]["last_date"], reverse=self.sort_mode == SORT_NEWEST)
+
+        self.visible = visible
+        self.scroll_to(self.top)
+        self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    # ----- Отображение -----
+
+    def scroll_to(self, top: int):
+        self.top = max(0, min(top, len(self.visible) - self.ROWS))
+        self._render()
+
+    def _render(self):
+        for i, checkbox in enumerate(self.rows):
+            pos = self.top + i
+            if pos < len(self.visible):
+                dialog = self.dialogs[self.visible[pos]]
+                checkbox.configure(text=dialog_label(dialog), state="normal")
+                if dialog["peer_id"] in self.selected:
+                    checkbox.select()
+                else:
+                    checkbox.deselect()
+                checkbox.grid()
+            else:
+                checkbox.grid_remove()
 
+        total = len(self.visible)
+        if total > self.ROWS:
+            self.scrollbar.set(self.top / total, (self.top + self.ROWS) / total)
+        else:
+            self.scrollbar.set(0, 1)
 
-def get_user_info(vk, user_id: int) -> dict:
-    """Получает информацию о пользователе."""
-    try:
-        info = vk.users.get(user_ids=user_id)[0]
-        return {
-            "id": user_id,
-            "first_name": info.get("first_name", ""),
-            "last_name": info.get("last_name", ""),
-            "full_name": f"{info.get('first_name', '')} {info.get('last_name', '')}".strip()
-        }
-    except:
-        return {
-            "id": user_id,
-            "first_name": "",
-            "last_name": "",
-            "full_name": f"id{user_id}"
-        }
+    def _toggle(self, row: int):
+        pos = self.top + row
+        if pos >= len(self.visible):
+            return
+        peer_id = self.dialogs[self.visible[pos]]["peer_id"]
+        if self.rows[row].get():
+            self.selected.add(peer_id)
+        else:
+            self.selected.discard(peer_id)
+        self._changed()
 
+    def _on_scrollbar(self, action, value, units=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * len(self.visible)))
+        elif action == "scroll":
+            step = self.ROWS if units == "pages" else 1
+            self.scroll_to(self.top + int(value) * step)
 
-def get_chat_info(vk, chat_id: int) -> dict:
-    """Получает информацию о беседе."""
-    try:
-        peer_id = 2000000000 + chat_id
-        resp = vk.messages.getConversationsById(peer_ids=peer_id)
-        items = resp.get("items", [])
-        if items:
-            chat = items[0].get("chat_settings", {})
-            return {
-                "id": peer_id,
-                "title": chat.get("title", f"Беседа {chat_id}"),
-                "members_count": chat.get("members_count", 0)
-            }
-    except:
-        pass
-    return {
-        "id": 2000000000 + chat_id,
-        "title": f"Беседа {chat_id}",
-        "members_count": 0
-    }
+    def _on_wheel(self, event):
+        self.scroll_to(self.top - (3 if event.delta > 0 else -3))
 
 
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
 
-        # Загружаем конфиг
-        self.config_data = load_config()
-        last_token = self.config_data.get("last_token")
-        self._initial_token = last_token or ""
+        # config.json, кеши и vk_api загружаются в фоне (startup), окно — сразу
+        self.config_data = {}
+        self.name_cache = None
+        self.ready = threading.Event()
+        self.startup_error = None  # почему не открылись кеш имён или очередь заданий
 
         # Настройки внешнего вида
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("blue")
 
         self.title(f"{APP_NAME} v{APP_VERSION}")
-        self.geometry("700x750")
+        self.geometry("700x850")
         self.resizable(False, False)
 
         # Иконка окна
@@ -169,7 +252,7 @@ class App(ctk.CTk):
 
         self.label_sub = ctk.CTkLabel(
             self,
-            text="Экспортирует диалоги ВКонтакте в формат Markdown с сохранением имен и временных меток.",
+            text="Экспортирует диалоги ВКонтакте в Markdown, JSONL, CSV или HTML с сохранением имен и временных меток.",
             font=ctk.CTkFont(size=13),
             wraplength=650,
         )
@@ -198,9 +281,6 @@ class App(ctk.CTk):
         )
         self.entry_token.grid(row=1, column=0, padx=0, pady=(0, 0), sticky="w")
 
-        if self._initial_token:
-            self.entry_token.insert(0, self._initial_token)
-
         # Горячие клавиши для токена
         def _token_key_handler(event):
             code = event.keycode
@@ -270,12 +350,48 @@ class App(ctk.CTk):
         )
         self.button_load_dialogs.grid(row=4, column=0, columnspan=2, padx=5, pady=(0, 10))
 
-        # Скроллируемый фрейм для списка диалогов
-        self.dialogs_frame = ctk.CTkScrollableFrame(self.frame_inputs, height=200, width=640)
-        self.dialogs_frame.grid(row=5, column=0, columnspan=2, padx=5, pady=(0, 10), sticky="nsew")
+        # Фильтр, сортировка и выбор найденных
+        self.frame_filter = ctk.CTkFrame(self.frame_inputs, fg_color="transparent")
+        self.frame_filter.grid(row=5, column=0, columnspan=2, sticky="ew", padx=5, pady=(0, 5))
+
+        self.entry_filter = ctk.CTkEntry(
+            self.frame_filter,
+            width=230,
+            placeholder_text="Фильтр: имя, тип или ID",
+        )
+        self.entry_filter.pack(side="left")
+        self.entry_filter.bind("<KeyRelease>", lambda e: self.dialog_list.set_filter(self.entry_filter.get()))
+
+        self.option_sort = ctk.CTkOptionMenu(
+            self.frame_filter,
+            values=[SORT_NEWEST, SORT_OLDEST, SORT_NAME],
+            width=140,
+            command=lambda mode: self.dialog_list.set_sort(mode),
+        )
+        self.option_sort.pack(side="left", padx=(5, 0))
+
+        self.button_select_visible = ctk.CTkButton(
+            self.frame_filter,
+            text="Выбрать найденные",
+            width=130,
+            command=lambda: self.dialog_list.select_visible(True),
+        )
+        self.button_select_visible.pack(side="left", padx=(5, 0))
+
+        self.button_unselect_visible = ctk.CTkButton(
+            self.frame_filter,
+            text="Снять",
+            width=60,
+            command=lambda: self.dialog_list.select_visible(False),
+        )
+        self.button_unselect_visible.pack(side="left", padx=(5, 0))
+
+        # Список диалогов: виджеты только для видимых строк
+        self.dialog_list = DialogList(self.frame_inputs, on_change=self.update_selection_label)
+        self.dialog_list.grid(row=6, column=0, columnspan=2, padx=5, pady=(0, 5), sticky="nsew")
 
-        self.dialogs_checkboxes = []
-        self.dialogs_data = []
+        self.label_selection = ctk.CTkLabel(self.frame_inputs, text="", font=ctk.CTkFont(size=11))
+        self.label_selection.grid(row=7, column=0, columnspan=2, sticky="w", padx=5, pady=(0, 5))
 
         # ---------- Кнопки управления и прогресс ----------
         self.frame_controls = ctk.CTkFrame(self)
@@ -284,21 +400,119 @@ class App(ctk.CTk):
         self.button_export = ctk.CTkButton(
             self.frame_controls,
             text="Экспортировать выбранные диалоги",
-            command=self.start_export_thread,
+            command=self.enqueue_export,
             width=250,
             # height=40,
         )
         self.button_export.grid(row=0, column=0, padx=(0, 10))
         self.button_export.configure(state="disabled")
 
-        self.button_stop = ctk.CTkButton(
+        # Задания попадают в постоянную очередь; пауза останавливает их после текущей страницы
+        self.button_pause = ctk.CTkButton(
             self.frame_controls,
-            text="Стоп",
+            text="Пауза",
             width=90,
-            command=self.stop_export,
+            command=self.pause_export,
         )
-        self.button_stop.grid(row=0, column=1, padx=(0, 0))
-        self.button_stop.configure(state="disabled")
+        self.button_pause.grid(row=0, column=1, padx=(0, 5))
+        self.button_pause.configure(state="disabled")
+
+        self.button_resume = ctk.CTkButton(
+            self.frame_controls,
+            text="Продолжить",
+            width=100,
+            command=self.resume_export,
+        )
+        self.button_resume.grid(row=0, column=2, padx=(0, 5))
+        self.button_resume.configure(state="disabled")
+
+        self.option_priority = ctk.CTkOptionMenu(self.frame_controls, values=list(PRIORITY_OPTIONS), width=100)
+        self.option_priority.set(next(iter(PRIORITY_OPTIONS)))
+        self.option_priority.grid(row=0, column=3)
+
+        # Параметры экспорта — двумя строками под кнопками
+        self.frame_options = ctk.CTkFrame(self, fg_color="transparent")
+        self.frame_options.pack(pady=(0, 5))
+
+        self.var_batched = ctk.StringVar(value="on")
+        self.checkbox_batched = ctk.CTkCheckBox(
+            self.frame_options,
+            text="Пакетно (execute)",
+            variable=self.var_batched,
+            onvalue="on",
+            offvalue="off",
+        )
+        self.checkbox_batched.grid(row=0, column=0, padx=5, pady=(0, 5), sticky="w")
+
+        self.var_incremental = ctk.StringVar(value="on")
+        self.checkbox_incremental = ctk.CTkCheckBox(
+            self.frame_options,
+            text="Только новые сообщения",
+            variable=self.var_incremental,
+            onvalue="on",
+            offvalue="off",
+        )
+        self.checkbox_incremental.grid(row=0, column=1, padx=5, pady=(0, 5), sticky="w")
+
+        self.var_archive = ctk.StringVar(value="off")
+        self.checkbox_archive = ctk.CTkCheckBox(
+            self.frame_options,
+            text="В архив с поиском",
+            variable=self.var_archive,
+            onvalue="on",
+            offvalue="off",
+        )
+        self.checkbox_archive.grid(row=0, column=2, padx=5, pady=(0, 5), sticky="w")
+
+        self.var_media = ctk.StringVar(value="off")
+        self.checkbox_media = ctk.CTkCheckBox(
+            self.frame_options,
+            text="Скачивать вложения",
+            variable=self.var_media,
+            onvalue="on",
+            offvalue="off",
+        )
+        self.checkbox_media.grid(row=1, column=0, padx=5, sticky="w")
+
+        self.var_capture = ctk.StringVar(value="off")
+        self.checkbox_capture = ctk.CTkCheckBox(
+            self.frame_options,
+            text="Сохранять сырые ответы",
+            variable=self.var_capture,
+            onvalue="on",
+            offvalue="off",
+        )
+        self.checkbox_capture.grid(row=2, column=0, padx=5, pady=(5, 0), sticky="w")
+
+        # Колоночный индекс для stats пишется только при установленном numpy
+        self.var_columns = ctk.StringVar(value="off")
+        self.checkbox_columns = ctk.CTkCheckBox(
+            self.frame_options,
+            text="Индекс для статистики",
+            variable=self.var_columns,
+            onvalue="on",
+            offvalue="off",
+            state="normal" if importlib.util.find_spec("numpy") else "disabled",
+        )
+        self.checkbox_columns.grid(row=2, column=1, padx=5, pady=(5, 0), sticky="w")
+
+        self.frame_output = ctk.CTkFrame(self.frame_options, fg_color="transparent")
+        self.frame_output.grid(row=1, column=1, padx=5, sticky="w")
+        self.option_format = ctk.CTkOptionMenu(self.frame_output, values=list(FORMATS), width=80)
+        self.option_format.set(DEFAULT_FORMAT)
+        self.option_format.pack(side="left")
+        # Большие диалоги можно делить на файлы в отдельной папке
+        self.option_shard = ctk.CTkOptionMenu(self.frame_output, values=list(SHARD_OPTIONS), width=110)
+        self.option_shard.set(next(iter(SHARD_OPTIONS)))
+        self.option_shard.pack(side="left", padx=(5, 0))
+
+        # Период: пустые поля — вся история
+        self.frame_period = ctk.CTkFrame(self.frame_options, fg_color="transparent")
+        self.frame_period.grid(row=1, column=2, padx=5, sticky="w")
+        self.entry_date_from = ctk.CTkEntry(self.frame_period, width=95, placeholder_text="с ГГГГ-ММ-ДД")
+        self.entry_date_from.pack(side="left")
+        self.entry_date_to = ctk.CTkEntry(self.frame_period, width=95, placeholder_text="по ГГГГ-ММ-ДД")
+        self.entry_date_to.pack(side="left", padx=(5, 0))
 
         self.label_progress_info = ctk.CTkLabel(
             self,
@@ -307,51 +521,229 @@ class App(ctk.CTk):
         )
         self.label_progress_info.pack(pady=(5, 5))
 
+        self.progress = ctk.CTkProgressBar(self, width=640)
+        self.progress.pack(pady=(0, 5))
+        self.progress.set(0)
+
         self.text_log = ctk.CTkTextbox(self, height=150)
         self.text_log.pack(fill="both", expand=True, padx=20, pady=(5, 15))
         self.text_log.insert("end", f"{APP_NAME} готов к работе.\n")
         self.text_log.configure(state="disabled")
 
-        self.stop_flag = False
+        # Рабочие потоки не трогают виджеты: они кладут события в очередь,
+        # а главный поток разбирает её пачками по таймеру
+        self.events = queue.SimpleQueue()
+        setup_file_log()
+        self.after(UI_POLL_MS, self._drain_events)
+
+        self.limiter = RateLimiter()  # общий лимит запросов для всех потоков
+        self.metrics = Metrics()  # счётчики запросов и стадий, сбрасываются перед экспортом
         self.vk_session = None
         self.vk = None
+        self.names = None
+        self.archive = None
+        self.jobs = None
+        self.scheduler = None
+        self.media = None  # загрузчик вложений текущей партии заданий
+        self.profiler = None
+        self._open_lock = threading.Lock()  # архив и загрузчик вложений общие для потоков пула
+
+        t = threading.Thread(target=self.startup)
+        t.daemon = True
+        t.start()
+
+    def startup(self):
+        """
+        Всё, что не нужно для первого кадра: config.json, кеш имён, очередь
+        заданий и сохранённый список диалогов. Окно к этому моменту уже на
+        экране; затем токен проверяется и список обновляется (load_dialogs).
+        """
+        try:
+            self.config_data = load_config()
+            # Постоянный кеш имён и очередь заданий лежат рядом с config.json
+            self.name_cache = open_name_cache(self.config_data)
+            self.jobs = JobQueue(JOBS_FILE)
+        except Exception as e:
+            # Иначе поток молча умрёт, а load_dialogs будет вечно ждать ready
+            self.startup_error = str(e)
+            logger.exception("Ошибка при запуске")
+            self.log(f"[ERR] Не удалось открыть кеш имён или очередь заданий: {e}")
+            self.update_progress_label("Ошибка запуска: см. лог")
+            return
+        finally:
+            self.ready.set()
+
+        token = self.config_data.get("last_token") or ""
+        if not token:
+            return
+        self.call_in_gui(self._set_initial_token, token)
+
+        # Сохранённый список диалогов показываем сразу, а обновляем следом
+        cached = load_dialog_cache(token)
+        if cached:
+            self.call_in_gui(self.dialog_list.set_dialogs, cached)
+            self.log(f"[INFO] Показан сохранённый список: {len(cached)} диалогов, обновляю...")
+        self.load_dialogs(token)
+
+    def _set_initial_token(self, token: str):
+        # Не затираем то, что пользователь успел вставить сам
+        if not self.entry_token.get():
+            self.entry_token.insert(0, token)
 
     # ===== Вспомогательные методы GUI =====
 
     def log(self, msg: str):
+        """Можно вызывать из любого потока."""
+        logger.info(msg)
+        self.events.put(("log", msg))
+
+    def update_progress_label(self, text: str):
+        """Можно вызывать из любого потока; на экран попадает последний текст."""
+        self.events.put(("status", text))
+
+    def set_progress(self, value: float):
+        self.events.put(("progress", value))
+
+    def call_in_gui(self, func, *args, **kwargs):
+        """Выполняет func в главном потоке при следующем разборе очереди."""
+        self.events.put(("call", partial(func, *args, **kwargs)))
+
+    def _drain_events(self):
+        """
+        Разбирает всё, что накопилось в очереди, за один проход.
+
+        Строки лога вставляются в окно одной операцией, из обновлений
+        статуса и прогресса применяется только последнее, поэтому нагрузка
+        на интерфейс не зависит от того, как часто пишут рабочие потоки.
+        """
+        lines = []
+        status = progress = None
+        try:
+            while True:
+                kind, payload = self.events.get_nowait()
+                if kind == "log":
+                    lines.append(payload)
+                elif kind == "status":
+                    status = payload
+                elif kind == "progress":
+                    progress = payload
+                else:
+                    # Ошибка одного вызова не должна останавливать разбор очереди
+                    try:
+                        payload()
+                    except Exception as e:
+                        logger.exception("Ошибка при обновлении интерфейса")
+                        lines.append(f"[ERR] Ошибка интерфейса: {e}")
+        except queue.Empty:
+            pass
+
+        try:
+            if lines:
+                self._append_log(lines[-LOG_MAX_LINES:])
+            if status is not None:
+                self.label_progress_info.configure(text=status)
+            if progress is not None:
+                self.progress.set(progress)
+        except Exception:
+            logger.exception("Ошибка при обновлении интерфейса")
+        finally:
+            self.after(UI_POLL_MS, self._drain_events)
+
+    def _append_log(self, lines: list[str]):
         self.text_log.configure(state="normal")
-        self.text_log.insert("end", msg + "\n")
+        self.text_log.insert("end", "\n".join(lines) + "\n")
+        line_count = int(self.text_log.index("end-1c").split(".")[0])
+        if line_count > LOG_MAX_LINES:
+            self.text_log.delete("1.0", f"{line_count - LOG_MAX_LINES}.0")
         self.text_log.see("end")
         self.text_log.configure(state="disabled")
-        self.update_idletasks()
 
-    def update_progress_label(self, text: str):
-        self.label_progress_info.configure(text=text)
-        self.update_idletasks()
+    def update_selection_label(self):
+        total = len(self.dialog_list.dialogs)
+        shown = len(self.dialog_list.visible)
+        selected = len(self.dialog_list.selected)
+        self.label_selection.configure(text=f"Показано: {shown} из {total}, выбрано: {selected}")
 
     def open_token_page(self):
         webbrowser.open("https://vkhost.github.io", new=2)
         self.log("[INFO] Открыта страница для получения токена. Скопируйте всю ссылку после авторизации.")
 
-    def stop_export(self):
-        self.stop_flag = True
-        self.update_progress_label("Остановка по запросу пользователя...")
+    def pause_export(self):
+        if self.scheduler is not None:
+            self.scheduler.pause()
+            self.log("[INFO] Очередь на паузе: текущие диалоги остановятся после загруженной страницы.")
+
+    def resume_export(self):
+        if self.scheduler is not None:
+            self.scheduler.resume()
+            self.log("[INFO] Очередь продолжена.")
 
     def load_dialogs_thread(self):
-        t = threading.Thread(target=self.load_dialogs)
+        t = threading.Thread(target=self.load_dialogs, args=(self.entry_token.get(),))
         t.daemon = True
         t.start()
 
-    def start_export_thread(self):
-        t = threading.Thread(target=self.export_dialogs)
-        t.daemon = True
-        t.start()
+    def enqueue_export(self):
+        """Ставит выбранные диалоги в очередь; выбор и параметры читаются в главном потоке."""
+        if self.scheduler is None:
+            self.log("[ERR] Сначала загрузите список диалогов.")
+            return
+        selected = self.dialog_list.get_selected()
+        if not selected:
+            self.log("[WARN] Не выбрано ни одного диалога для экспорта.")
+            self.update_progress_label("Выберите хотя бы один диалог")
+            return
+
+        try:
+            date_from, date_to = parse_date_range(self.entry_date_from.get().strip() or None,
+                                                  self.entry_date_to.get().strip() or None)
+        except ValueError:
+            self.log("[ERR] Даты периода нужно указывать в формате ГГГГ-ММ-ДД.")
+            self.update_progress_label("Неверный формат даты")
+            return
+
+        options = {
+            "batched": self.var_batched.get() == "on",
+            "incremental": self.var_incremental.get() == "on",
+            "archive": self.var_archive.get() == "on",
+            "fmt": self.option_format.get(),
+            "shard": SHARD_OPTIONS[self.option_shard.get()],
+            "media": self.var_media.get() == "on",
+            "capture": self.var_capture.get() == "on",
+            "columns": self.var_columns.get() == "on",
+            "date_from": date_from,
+            "date_to": date_to,
+        }
+        priority = PRIORITY_OPTIONS[self.option_priority.get()]
+
+        account = self.scheduler.account
+        counts = self.jobs.counts(account)
+        if not any(counts[state] for state in ACTIVE_STATES):
+            # Новая партия: прогресс и отчёт считаются с нуля
+            self.jobs.purge(account)
+            self.metrics.reset()
+            self.profiler = Profiler() if self.config_data.get("profile_exports") else None
+
+        for dialog in selected:
+            target = dialog_filepath(EXPORT_DIR, dialog, options["fmt"], date_from, date_to,
+                                     sharded=options["shard"] is not None)
+            self.jobs.add(account, dialog, options, target, priority)
+        self.log(f"[INFO] В очередь добавлено диалогов: {len(selected)}")
+        self.update_queue_status()
+        self.scheduler.notify()
 
     # ===== Загрузка списка диалогов =====
 
-    def load_dialogs(self):
-        token_raw = self.entry_token.get().strip()
-        token = extract_token(token_raw)
+    def load_dialogs(self, token_raw: str):
+        # vk_api нужен только здесь и грузится в фоновом потоке
+        from vk_dialog_parser.api import create_session
+
+        self.ready.wait()
+        if self.startup_error is not None:
+            self.log(f"[ERR] Приложение запущено с ошибкой, работа невозможна: {self.startup_error}")
+            self.update_progress_label("Ошибка запуска: см. лог")
+            return
+        token = extract_token(token_raw.strip())
 
         if not token:
             self.log("[ERR] Не удалось извлечь access token. Вставьте токен или полную ссылку после авторизации.")
@@ -361,307 +753,176 @@ class App(ctk.CTk):
         self.config_data["last_token"] = token
         save_config(self.config_data)
 
+        # Очередь другого аккаунта останавливается до смены сессии
+        if self.scheduler is not None and self.scheduler.account != account_key(token):
+            self.scheduler.stop()
+            self.scheduler = None
+
         try:
-            self.vk_session = vk_api.VkApi(token=token)
+            self.vk_session = create_session(token, limiter=self.limiter, metrics=self.metrics)
             self.vk = self.vk_session.get_api()
+            self.names = NameResolver(self.vk, cache=self.name_cache, report=self.log)
+            self.names.warm()
         except Exception as e:
             self.log(f"[ERR] Не удалось создать сессию VK: {e}")
             self.update_progress_label("Ошибка подключения к VK")
             return
 
-        self.button_load_dialogs.configure(state="disabled")
+        if self.scheduler is None:
+            self.start_scheduler(account_key(token))
+
+        self.call_in_gui(self.button_load_dialogs.configure, state="disabled")
         self.update_progress_label("Загрузка списка диалогов...")
         self.log("[INFO] Загружаю список диалогов...")
 
         try:
-            # Очищаем предыдущий список
-            for widget in self.dialogs_frame.winfo_children():
-                widget.destroy()
-            self.dialogs_checkboxes = []
-            self.dialogs_data = []
+            cached = load_dialog_cache(token)
+            loaded = [0]
+
+            def on_page(page):
+                # Без кеша список наполняется постранично; виджеты не создаются,
+                # страница лишь добавляется в модель списка
+                if not cached:
+                    self.call_in_gui(self.dialog_list.add_dialogs, page)
+                loaded[0] += len(page)
+                self.update_progress_label(f"Загружено диалогов: {loaded[0]}")
+
+            if not cached:
+                self.call_in_gui(self.dialog_list.clear)
+            # Листаем только до диалогов без новых сообщений, остальное — из кеша
+            dialogs, changed = refresh_dialogs(self.vk, self.names, cached, on_page=on_page)
+            if cached:
+                self.call_in_gui(self.dialog_list.set_dialogs, dialogs)
+                self.log(f"[INFO] Список обновлён: {len(dialogs)} диалогов, изменилось {changed}.")
+            else:
+                self.log(f"[INFO] Загружено {len(dialogs)} диалогов.")
+            save_dialog_cache(token, dialogs)
 
-            offset = 0
-            count = 200
-            total_loaded = 0
-
-            while True:
-                response = self.vk.messages.getConversations(offset=offset, count=count)
-                items = response.get("items", [])
-
-                if not items:
-                    break
-
-                for item in items:
-                    conversation = item.get("conversation", {})
-                    peer = conversation.get("peer", {})
-                    peer_id = peer.get("id")
-                    peer_type = peer.get("type")
-
-                    last_message = item.get("last_message", {})
-                    last_text = last_message.get("text", "")[:50]
-
-                    if peer_type == "user":
-                        user_info = get_user_info(self.vk, peer_id)
-                        display_name = user_info["full_name"] or f"id{peer_id}"
-                        dialog_type = "ЛС"
-                    elif peer_type == "chat":
-                        chat_id = peer_id - 2000000000
-                        chat_info = get_chat_info(self.vk, chat_id)
-                        display_name = chat_info["title"]
-                        dialog_type = "Беседа"
-                    elif peer_type == "group":
-                        # Группа
-                        group_id = abs(peer_id)
-                        try:
-                            group_info = self.vk.groups.getById(group_id=group_id)[0]
-                            display_name = group_info.get("name", f"club{group_id}")
-                        except:
-                            display_name = f"club{group_id}"
-                        dialog_type = "Группа"
-                    else:
-                        display_name = f"peer_id {peer_id}"
-                        dialog_type = "Неизвестно"
-
-                    label_text = f"[{dialog_type}] {display_name} (ID: {peer_id})"
-                    if last_text:
-                        label_text += f" - \"{last_text}...\""
-
-                    var = ctk.StringVar(value="off")
-                    checkbox = ctk.CTkCheckBox(
-                        self.dialogs_frame,
-                        text=label_text,
-                        variable=var,
-                        onvalue="on",
-                        offvalue="off"
-                    )
-                    checkbox.pack(anchor="w", pady=2, padx=5)
-
-                    self.dialogs_checkboxes.append(var)
-                    self.dialogs_data.append({
-                        "peer_id": peer_id,
-                        "peer_type": peer_type,
-                        "display_name": display_name,
-                        "dialog_type": dialog_type
-                    })
-
-                total_loaded += len(items)
-                self.update_progress_label(f"Загружено диалогов: {total_loaded}")
-
-                offset += count
-                time.sleep(DELAY)
-
-            self.log(f"[INFO] Загружено {total_loaded} диалогов.")
-            self.update_progress_label(f"Загружено {total_loaded} диалогов. Выберите нужные для экспорта.")
-            self.button_export.configure(state="normal")
+            self.update_progress_label(f"Загружено {len(dialogs)} диалогов. Выберите нужные для экспорта.")
+            self.call_in_gui(self.button_export.configure, state="normal")
 
         except Exception as e:
             self.log(f"[ERR] Ошибка при загрузке диалогов: {e}")
             self.update_progress_label("Ошибка при загрузке")
         finally:
-            self.button_load_dialogs.configure(state="normal")
+            self.call_in_gui(self.button_load_dialogs.configure, state="normal")
 
     # ===== Экспорт диалогов =====
 
-    def export_dialogs(self):
-        if not self.vk:
-            self.log("[ERR] Сначала загрузите список диалогов.")
-            return
-
-        # Получаем выбранные диалоги
-        selected_dialogs = []
-        for i, var in enumerate(self.dialogs_checkboxes):
-            if var.get() == "on":
-                selected_dialogs.append(self.dialogs_data[i])
-
-        if not selected_dialogs:
-            self.log("[WARN] Не выбрано ни одного диалога для экспорта.")
-            self.update_progress_label("Выберите хотя бы один диалог")
+    def start_scheduler(self, account: str):
+        """
+        Запускает пул, который разбирает очередь заданий аккаунта. Задания,
+        оставшиеся с прошлого запуска, продолжаются с контрольных точек.
+        """
+        workers = self.config_data.get("export_workers", DEFAULT_WORKERS)
+        self.scheduler = JobScheduler(self.jobs, account, self.run_job, workers=workers, report=self.log,
+                                      on_idle=self.on_queue_idle, on_change=self.update_queue_status)
+        counts = self.jobs.counts(account)
+        unfinished = sum(counts[state] for state in ACTIVE_STATES)
+        if unfinished:
+            self.log(f"[INFO] В очереди с прошлого запуска: {unfinished} (на паузе: {counts['paused']})")
+        self.scheduler.start()
+        self.call_in_gui(self.button_pause.configure, state="normal")
+        self.call_in_gui(self.button_resume.configure, state="normal")
+
+    def run_job(self, job: dict, should_stop) -> int:
+        """
+        Выполняет задание очереди в потоке пула. Исключение не ловится:
+        JobScheduler повторит задание с паузой.
+        """
+        dialog, options = job["dialog"], job["options"]
+        display_name = dialog["display_name"]
+        ensure_dir(EXPORT_DIR)
+        self.log(f"[INFO] Экспортирую: {display_name} (ID: {dialog['peer_id']})")
+        profile = self.profiler.thread() if self.profiler is not None else nullcontext()
+        with profile:
+            message_count = export_dialog(
+                self.vk,
+                self.names,
+                dialog["peer_id"],
+                job["target"],
+                display_name,
+                dialog["dialog_type"],
+                batched=options["batched"],
+                # Продолжение после паузы или сбоя — всегда с контрольной точки
+                incremental=options["incremental"] or job["runs"] > 1,
+                should_stop=should_stop,
+                archive=self.get_archive(options["archive"]),
+                fmt=options["fmt"],
+                media=self.get_media(options["media"]),
+                metrics=self.metrics,
+                date_from=options["date_from"],
+                date_to=options["date_to"],
+                shard=options["shard"],
+                capture=options["capture"],
+                columns=options["columns"],
+                on_page=lambda n: self.update_progress_label(f"Экспорт: {display_name} — {n} сообщений"),
+            )
+        self.log(f"  └─ {display_name}: экспортировано сообщений: {message_count}")
+        return message_count
+
+    def update_queue_status(self):
+        """Прогресс и счётчики очереди; вызывается из потоков пула."""
+        if self.scheduler is None:
             return
+        counts = self.jobs.counts(self.scheduler.account)
+        total = sum(counts.values())
+        if total:
+            self.set_progress((counts[DONE] + counts[FAILED]) / total)
+        self.update_progress_label(
+            f"Очередь: в работе {counts['running']}, ждут {counts['pending']}, на паузе {counts['paused']}, "
+            f"готово {counts[DONE]}, ошибок {counts[FAILED]}"
+        )
 
-        self.stop_flag = False
-        self.button_export.configure(state="disabled")
-        self.button_stop.configure(state="normal")
-        self.progress.set(0)
-
-        export_dir = "exported_dialogs"
-        ensure_dir(export_dir)
-
-        self.log(f"[INFO] Начинаю экспорт {len(selected_dialogs)} диалогов...")
-
-        try:
-            for idx, dialog in enumerate(selected_dialogs):
-                if self.stop_flag:
-                    self.log("[INFO] Экспорт остановлен пользователем.")
-                    break
-
-                peer_id = dialog["peer_id"]
-                display_name = dialog["display_name"]
-                dialog_type = dialog["dialog_type"]
-
-                safe_name = sanitize(display_name)
-                filename = f"{safe_name}_id{peer_id}.md"
-                filepath = os.path.join(export_dir, filename)
-
-                self.log(f"[{idx + 1}/{len(selected_dialogs)}] Экспортирую: {display_name} (ID: {peer_id})")
-                self.update_progress_label(f"Экспорт: {display_name} ({idx + 1}/{len(selected_dialogs)})")
-
-                # Экспортируем диалог
-                self.export_single_dialog(peer_id, filepath, display_name, dialog_type)
-
-                # Обновляем прогресс
-                progress_val = (idx + 1) / len(selected_dialogs)
-                self.progress.set(progress_val)
-
-            if not self.stop_flag:
-                self.log(f"[INFO] Экспорт завершён! Файлы сохранены в папку: {export_dir}")
-                self.update_progress_label(f"Готово! Экспортировано диалогов: {len(selected_dialogs)}")
-                self.progress.set(1.0)
-            else:
-                self.update_progress_label("Экспорт остановлен пользователем")
-
-        except Exception as e:
-            self.log(f"[ERR] Ошибка при экспорте: {e}")
-            self.update_progress_label("Ошибка при экспорте")
-        finally:
-            self.button_export.configure(state="normal")
-            self.button_stop.configure(state="disabled")
-
-    def export_single_dialog(self, peer_id: int, filepath: str, display_name: str, dialog_type: str):
-        """Экспортирует один диалог в MD файл."""
+    def on_queue_idle(self):
+        """Очередь опустела: дожидаемся вложений и сохраняем отчёт о партии."""
+        with self._open_lock:
+            media, self.media = self.media, None
+        if media is not None:
+            self.log("[INFO] Дожидаюсь скачивания вложений...")
+            media.close()
+            self.log(f"[INFO] Вложения: {media.summary()}")
+        self.log_report(EXPORT_DIR, self.profiler)
+        self.profiler = None
+        self.log(f"[INFO] Очередь выполнена. Файлы сохранены в папку: {EXPORT_DIR}")
+
+    def log_report(self, export_dir: str, profiler=None):
+        """Сохраняет отчёт о прогоне в .reports и выводит сводку в лог."""
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                # Заголовок
-                f.write(f"# Диалог: {display_name}\n\n")
-                f.write(f"**Тип:** {dialog_type}\n")
-                f.write(f"**Peer ID:** {peer_id}\n")
-                f.write(f"**Дата экспорта:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                f.write("---\n\n")
-
-                # Получаем сообщения
-                offset = 0
-                count = 200
-                message_count = 0
-
-                # Кеш для имен пользователей
-                user_cache = {}
-
-                while True:
-                    if self.stop_flag:
-                        break
-
-                    response = self.vk.messages.getHistory(
-                        peer_id=peer_id,
-                        offset=offset,
-                        count=count,
-                        rev=1  # Сначала старые сообщения
-                    )
-
-                    items = response.get("items", [])
-                    if not items:
-                        break
-
-                    for msg in items:
-                        if self.stop_flag:
-                            break
-
-                        from_id = msg.get("from_id")
-                        text = msg.get("text", "")
-                        date = msg.get("date", 0)
-                        attachments = msg.get("attachments", [])
-                        reply_message = msg.get("reply_message")  # Информация об ответе
-
-                        # Получаем имя отправителя
-                        if from_id not in user_cache:
-                            if from_id > 0:
-                                user_info = get_user_info(self.vk, from_id)
-                                user_cache[from_id] = user_info["full_name"] or f"id{from_id}"
-                            else:
-                                # Группа
-                                group_id = abs(from_id)
-                                try:
-                                    group_info = self.vk.groups.getById(group_id=group_id)[0]
-                                    user_cache[from_id] = group_info.get("name", f"club{group_id}")
-                                except:
-                                    user_cache[from_id] = f"club{group_id}"
-
-                        sender_name = user_cache[from_id]
-                        timestamp = format_timestamp(date)
-
-                        # Записываем сообщение
-                        f.write(f"## {sender_name}\n")
-                        f.write(f"*{timestamp}*\n\n")
-
-                        # Обработка ответа на сообщение
-                        if reply_message:
-                            reply_from_id = reply_message.get("from_id")
-                            reply_text = reply_message.get("text", "")
-                            reply_date = reply_message.get("date", 0)
-                            reply_attachments = reply_message.get("attachments", [])
-
-                            # Получаем имя автора цитируемого сообщения
-                            if reply_from_id not in user_cache:
-                                if reply_from_id > 0:
-                                    reply_user_info = get_user_info(self.vk, reply_from_id)
-                                    user_cache[reply_from_id] = reply_user_info["full_name"] or f"id{reply_from_id}"
-                                else:
-                                    reply_group_id = abs(reply_from_id)
-                                    try:
-                                        reply_group_info = self.vk.groups.getById(group_id=reply_group_id)[0]
-                                        user_cache[reply_from_id] = reply_group_info.get("name", f"club{reply_group_id}")
-                                    except:
-                                        user_cache[reply_from_id] = f"club{reply_group_id}"
-
-                            reply_sender_name = user_cache[reply_from_id]
-                            reply_timestamp = format_timestamp(reply_date)
-
-                            # Форматируем цитату
-                            f.write(f"**↩️ В ответ на сообщение от {reply_sender_name}** *({reply_timestamp})*:\n")
-
-                            if reply_text:
-                                # Обрезаем длинный текст цитаты
-                                quote_text = reply_text if len(reply_text) <= 200 else reply_text[:200] + "..."
-                                # Форматируем как цитату (каждая строка с >)
-                                quote_lines = quote_text.split('\n')
-                                for line in quote_lines:
-                                    f.write(f"> {line}\n")
-                            else:
-                                f.write("> *(без текста)*\n")
-
-                            # Если в цитируемом сообщении были вложения
-                            if reply_attachments:
-                                att_types = [att.get("type", "unknown") for att in reply_attachments]
-                                f.write(f"> *Вложения: {', '.join(att_types)}*\n")
-
-                            f.write("\n")
-
-                        # Основной текст сообщения
-                        if text:
-                            f.write(f"{text}\n\n")
-                        else:
-                            f.write("*(без текста)*\n\n")
-
-                        # Информация о вложениях (без скачивания)
-                        if attachments:
-                            f.write("**Вложения:**\n")
-                            for att in attachments:
-                                att_type = att.get("type", "unknown")
-                                f.write(f"- {att_type}\n")
-                            f.write("\n")
-
-                        f.write("---\n\n")
-                        message_count += 1
-
-                    offset += count
-                    time.sleep(DELAY)
-
-                self.log(f"  └─ Экспортировано сообщений: {message_count}")
-
-        except Exception as e:
-            self.log(f"[ERR] Ошибка при экспорте диалога {peer_id}: {e}")
+            path = save_report(export_dir, self.metrics, profiler)
+        except OSError as e:
+            self.log(f"[WARN] Не удалось сохранить отчёт: {e}")
+            return
+        for line in self.metrics.summary():
+            self.log(f"[STAT] {line}")
+        self.log(f"[INFO] Отчёт о производительности: {path}")
+
+    def get_archive(self, enabled: bool):
+        """Архив открывается при первом экспорте с включённой опцией."""
+        if not enabled:
+            return None
+        with self._open_lock:
+            if self.archive is None:
+                self.archive = MessageArchive(ARCHIVE_FILE)
+        return self.archive
+
+    def get_media(self, enabled: bool):
+        """Один пул скачивания на партию заданий: файлы общие для всех диалогов."""
+        if not enabled:
+            return None
+        with self._open_lock:
+            if self.media is None:
+                ensure_dir(EXPORT_DIR)
+                self.media = AttachmentDownloader(EXPORT_DIR)
+        return self.media
+
+
+def main():
+    app = App()
+    app.mainloop()
 
 
 if __name__ == "__main__":
-    app = App()
-    app.mainloop()
+    main()
 
 